@@ -1,15 +1,26 @@
 import streamlit as st
 import pandas as pd
-from openpyxl import Workbook
-from openpyxl.styles import PatternFill, Font, Alignment
 from io import BytesIO
 import re
-import ast
-import os
-import json
-from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode
-import uuid
-import time
+from learning_curve import LEARNING_CURVE_METHODS, production_cost_matrix, parse_quantity_list
+from budget_phasing import PHASING_PROFILES, build_phasing_table
+from backtest import run_backtest, error_metrics
+from cost_engine import find_wbs_column, merged_wbs_aggregates, estimate_wbs_costs, numeric_columns, select_wbs_rows
+import history_db
+import reference_data
+import currency
+import session_memory
+import profiling
+import metrics
+import upload_worker
+import upload_validation
+import xlsx_export
+import project_snapshot
+from table_preview import render_paginated_table
+from wbs_matching import DEFAULT_THRESHOLD, names_hash, suggest_merge_groups
+from portfolio import PORTFOLIO_COLUMNS, comparison_table, historical_rates, portfolio_template, prepare_portfolio, run_portfolio
+from scenarios import (MERGE_COLUMNS, aggregate_frame, default_scenarios, evaluate_scenarios, scenario_matrix,
+                       sheet_aggregates, side_by_side, validate_scenarios)
 
 # Define predefined subsystems from the reference image
 AVAILABLE_SUBSYSTEMS = {
@@ -46,24 +57,34 @@ AVAILABLE_SUBSYSTEMS = {
     ]
 }
 
-# Load custom headers for each subsystem from dict.txt
-def load_subsystem_headers():
-    json_path = os.path.join(os.path.dirname(__file__), 'subsystem_headers.json')
-    if os.path.exists(json_path):
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            # Convert list of {name, headers} to dict: name -> headers
-            return {entry['name']: entry['headers'] for entry in data if 'name' in entry and 'headers' in entry}
-    return {}
+# Seconds between refreshes of the upload parse progress
+PARSE_POLL_SECONDS = 1.0
 
-SUBSYSTEM_HEADERS = load_subsystem_headers()
+@profiling.timed("inflation load")
+def load_inflation_index():
+    """Fiscal years and NASA New Start Inflation Index values from the inflation table (shared, read-only)"""
+    return reference_data.inflation_index()
+
+def inflation_year_defaults(years):
+    """Default (base year, target year) positions in the year list: 1999 (else 2024) and 2025"""
+    if 1999 in years:
+        base_year_index = years.index(1999)
+    elif 2024 in years:
+        base_year_index = years.index(2024)
+    else:
+        base_year_index = 0
+    return base_year_index, years.index(2025) if 2025 in years else len(years)-1
 
 def sanitize_sheet_name(name):
     # Excel sheet names cannot contain: : \ / ? * [ ]
     return re.sub(r'[:\\/?*\[\]]', ' ', name)[:31]  # Also limit to 31 chars
 
 # Helper to create a styled Excel workbook
+@profiling.timed("create_template")
 def create_template(subsystems):
+    # openpyxl is only imported when a workbook is actually built (keeps app start-up fast)
+    from openpyxl import Workbook
+    from openpyxl.styles import PatternFill, Font, Alignment
     wb = Workbook()
     wb.properties.creator = "Harsh Kumar"
     # Remove default sheet
@@ -74,15 +95,7 @@ def create_template(subsystems):
     for subsystem in subsystems:
         safe_name = sanitize_sheet_name(subsystem)
         # Try exact match, then fallback to group name match (case-insensitive, ignoring common variations)
-        headers = SUBSYSTEM_HEADERS.get(safe_name)
-        if headers is None:
-            # Try to match group names in a more robust way
-            for key in SUBSYSTEM_HEADERS:
-                if key.replace('&', 'and').replace('/', '').replace(' ', '').lower() == safe_name.replace('&', 'and').replace('/', '').replace(' ', '').lower():
-                    headers = SUBSYSTEM_HEADERS[key]
-                    break
-        if headers is None:
-            headers = []
+        headers = reference_data.headers_for(safe_name) or []
         ws = wb.create_sheet(title=safe_name)
         for col, header in enumerate(headers, 1):
             cell = ws.cell(row=1, column=col, value=header)
@@ -92,6 +105,7 @@ def create_template(subsystems):
         ws.freeze_panes = ws["A2"]
     return wb
 
+@profiling.timed("create_mass_budget_template")
 def create_mass_budget_template(uploaded_file):
     from openpyxl import Workbook
     from openpyxl.utils import get_column_letter
@@ -104,11 +118,7 @@ def create_mass_budget_template(uploaded_file):
     subsystem_wbs = {}
     for sheet in subsystems:
         df = pd.read_excel(xls, sheet_name=sheet)
-        wbs_col = None
-        for col in df.columns:
-            if col.strip().lower() in ["wbs item", "wbs element", "wbs"]:
-                wbs_col = col
-                break
+        wbs_col = find_wbs_column(df)
         if wbs_col:
             unique_wbs = sorted(df[wbs_col].dropna().unique())
         else:
@@ -169,11 +179,227 @@ def create_mass_budget_template(uploaded_file):
         ws.freeze_panes = ws["A3"]
     return wb
 
+def create_cost_analysis_workbook(subsystem_results, currency_frames, user_mass_df=None, infl_df=None, phasing_results=None, scenario_results=None):
+    """
+    xlsx bytes of the styled Cost Analysis export built from the per-subsystem results.
+
+    Every sheet is rendered separately and cached by its contents (xlsx_export.py), so a re-export
+    only renders the sheets whose tables changed.
+    """
+    sheets = []
+    for idx, (sheet, result_df) in enumerate((subsystem_results or {}).items()):
+        tables = [(result_df, xlsx_export.sheet_color(idx), xlsx_export.ALT_FILL)]
+        # --- Add currency table (all selected currencies) below main table ---
+        currency_df = currency_frames.get(sheet)
+        if currency_df is not None:
+            tables.append((currency_df, xlsx_export.CURRENCY_HEADER, xlsx_export.CURRENCY_ALT_FILL))
+        sheets.append((sheet[:31], tables, None))
+    breakdown_style = (xlsx_export.BREAKDOWN_HEADER, xlsx_export.BREAKDOWN_ALT_FILL)
+    # Total Cost Breakdown sheet (distinct style)
+    if subsystem_results is not None:
+        tables = [(df, *breakdown_style) for df in (user_mass_df, infl_df) if df is not None]
+        sheets.append(("Total Cost Breakdown", tables, None))
+    # Then-year budget profiles of every phased subsystem on one sheet
+    if phasing_results:
+        phasing_df = pd.concat([df.assign(Subsystem=sheet) for sheet, df in phasing_results.items()], ignore_index=True)
+        year_cols = sorted(c for c in phasing_df.columns if isinstance(c, int))
+        phasing_df = phasing_df[["Subsystem", "WBS", "Cost Element"] + year_cols + ["Total"]].fillna(0)
+        phasing_df.columns = [str(c) for c in phasing_df.columns]
+        sheets.append(("Budget Phasing", [(phasing_df, *breakdown_style)], "D2"))
+    # Scenario matrix (costs and deltas side by side) with the per-scenario detail below
+    if scenario_results:
+        comparison, detail = scenario_results
+        sheets.append(("Scenarios", [(comparison, *breakdown_style), (detail, *breakdown_style)], "C2"))
+    return xlsx_export.build_xlsx(sheets, on_part=lambda title, cached: profiling.record_cache("export sheet", cached))
+
+def upload_bytes(uploaded):
+    """Raw bytes of an uploaded (or session-provided) workbook"""
+    if hasattr(uploaded, "getvalue"):
+        return uploaded.getvalue()
+    uploaded.seek(0)
+    return uploaded.read()
+
+def parse_upload(uploaded):
+    """
+    Background parse job of an uploaded workbook.
+
+    The job is shared read-only by every rerun and session using the same file; reruns while it is
+    running pick it up instead of parsing again.
+    """
+    job, started = upload_worker.submit(upload_bytes(uploaded))
+    profiling.record_cache("upload parse", not started)
+    return job
+
+@st.fragment(run_every=PARSE_POLL_SECONDS)
+def render_parse_progress(key):
+    """Per-sheet progress of a background upload parse, refreshed on its own; reruns the app once the parse has finished"""
+    job = upload_worker.get(key)
+    if job is None or job.done:
+        st.rerun()
+    sheets_done = sum(state == "done" for state in job.status.values())
+    st.progress(job.progress(), text=f"Reading historical workbook... {sheets_done}/{len(job.sheets) or '?'} sheets ({job.duration:.0f} s)")
+    if job.sheets:
+        st.dataframe(upload_worker.progress_table(job), hide_index=True, use_container_width=True)
+
+@st.cache_data(show_spinner=False)
+def validation_csv(upload_key, _report):
+    return _report.to_csv(index=False).encode("utf-8")
+
+def render_validation_report(job):
+    """Findings of the ingest-time validation of an upload (computed once with the parse)"""
+    report = job.report
+    st.subheader("Data Validation:")
+    if report.empty:
+        st.success("No issues found: every sheet matches the template and all range values are numeric and consistent.")
+        return
+    errors = int((report["Severity"] == "error").sum())
+    st.warning(f"{len(report)} findings in {report['Sheet'].nunique()} sheets ({errors} errors). Text cells and zero weights are "
+               f"left out of the estimate and sheets without a WBS column cannot be analysed; check the cells below in your workbook.")
+    st.dataframe(upload_validation.summary(report, job.result), hide_index=True, use_container_width=True)
+    with st.expander("All findings (with Excel cells)", expanded=False):
+        render_paginated_table(report, key="validation_report", source=job.key)
+        st.download_button("Download findings (CSV)", validation_csv(job.key, report),
+                           file_name="CostSpirits_Data_Validation.csv", mime="text/csv", key="validation_download")
+
+@profiling.cached(st.cache_data(show_spinner=False), "merge suggestions")
+def cached_merge_suggestions(sheet_hash, threshold, _names, _counts):
+    """Merge-group suggestions for a sheet's WBS names, cached per sheet hash and threshold"""
+    return suggest_merge_groups(_names, _counts, threshold)
+
+@profiling.cached(st.cache_data(show_spinner=False), "database selection")
+def cached_db_selection(db_path, subsystem, mapping_items, revisions):
+    """
+    Selected WBS rows and aggregates from the local database.
+
+    revisions holds the aggregate revision of every WBS in the mapping, so appending missions
+    only invalidates the cached selections that include an affected WBS.
+    """
+    conn = history_db.connect(db_path)
+    try:
+        wbs_analysis_map = dict(mapping_items)
+        rows = history_db.query_wbs_rows(conn, subsystem, wbs_analysis_map.keys())
+        return rows, history_db.query_wbs_aggregates(conn, subsystem, wbs_analysis_map)
+    finally:
+        conn.close()
+
+@profiling.cached(st.cache_data(show_spinner=False), "scenario aggregates")
+def cached_sheet_aggregates(upload_key, _sheets):
+    """Per-WBS historical sums and counts of a parsed upload, shared by all scenarios (cached per upload)"""
+    return sheet_aggregates(_sheets)
+
+@profiling.cached(st.cache_data(show_spinner=False), "portfolio rates")
+def cached_portfolio_rates(upload_key, merge_items, _sheets):
+    """Historical cost per pound of a parsed upload with the given WBS merge groups (cached per upload and merges)"""
+    merge_groups = {}
+    for sheet, group, members in merge_items:
+        merge_groups.setdefault(sheet, {})[group] = list(members)
+    rates = historical_rates(_sheets, merge_groups)
+    # WBS of the compact sheets are categoricals; the portfolio table is joined on their values
+    if isinstance(rates["WBS"].dtype, pd.CategoricalDtype):
+        rates["WBS"] = rates["WBS"].astype(rates["WBS"].cat.categories.dtype)
+    return rates
+
+def database_aggregates(conn, subsystems):
+    """Per-WBS historical sums and counts of the local database, from its stored aggregates"""
+    frames = []
+    for subsystem in subsystems:
+        wbs_items = history_db.list_wbs(conn, subsystem)
+        frames.append(aggregate_frame(subsystem, *history_db.query_wbs_aggregates(conn, subsystem, {w: w for w in wbs_items})))
+    return pd.concat(frames) if frames else sheet_aggregates({})
+
+def currency_rates(currencies, rate_mode, target_year):
+    """Units per USD of the selected currencies: latest rates or the target year's rates"""
+    return currency.rates_for(currencies, target_year if rate_mode == "Target year rate" else None)
+
+def render_export_section():
+    st.markdown("---")
+    st.subheader("Export to Excel")
+    st.caption("Download an Excel file containing all your cost analysis results and breakdowns. Use this after you have completed your analysis.")
+    export_clicked = st.button("Export to Excel", key="export_to_excel")
+    if export_clicked:
+        uploaded = st.session_state.get('uploaded_file')
+        subsystem_results = session_memory.get('subsystem_results')
+        if not uploaded and not subsystem_results:
+            st.warning("Please upload a filled template before exporting to Excel.")
+        else:
+            # Currency tables are converted from the stored USD results with the selection of the Cost Analysis page
+            currency_params = st.session_state.get('currency_params', {})
+            currencies, rate_mode = st.session_state.get('export_currencies', (currency.DEFAULT_CURRENCIES, currency.RATE_MODES[0]))
+            currency_frames = {}
+            if currencies:
+                for sheet, result_df in (subsystem_results or {}).items():
+                    if sheet in currency_params:
+                        inflation_factor, target_year = currency_params[sheet]
+                        currency_frames[sheet] = currency.currency_table(result_df, inflation_factor, target_year, currencies,
+                                                                         currency_rates(currencies, rate_mode, target_year))
+            with profiling.stage("export workbook"):
+                data = create_cost_analysis_workbook(
+                    subsystem_results, currency_frames,
+                    user_mass_df=st.session_state.get('user_mass_df'),
+                    infl_df=st.session_state.get('infl_df'),
+                    phasing_results=session_memory.get('phasing_results'),
+                    scenario_results=session_memory.get('scenario_results')
+                )
+            st.download_button(
+                label="Download Cost Analysis Excel",
+                data=data,
+                file_name="CostSpirits_Cost_Analysis.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            )
+
+def current_upload_info():
+    """Name, size and SHA-1 of the historical workbook of this session, None without upload"""
+    uploaded = st.session_state.get('uploaded_file')
+    if not uploaded:
+        return None
+    data = upload_bytes(uploaded)
+    return {"name": getattr(uploaded, "name", "workbook.xlsx"), "size": len(data), "sha1": upload_worker.upload_key(data)}
+
+def render_project_section():
+    with st.expander("💾 Save / Load Project", expanded=False):
+        st.caption("A project file stores your Cost Analysis and Scenarios inputs (WBS selections, merge groups, masses, years, "
+                   "currencies) and which historical workbook they belong to. Restoring one brings all inputs back at once.")
+        col_save, col_load = st.columns(2)
+        with col_save:
+            include_results = st.checkbox("Include computed results", value=True, key="project_include_results",
+                                          help="Saved result tables can be exported again right after restoring, without re-uploading the workbook.")
+            if st.button("Save Project", key="project_save"):
+                results = {key: session_memory.get(key) for key in project_snapshot.RESULT_KEYS} if include_results else None
+                with profiling.stage("project snapshot"):
+                    data = project_snapshot.snapshot_bytes(st.session_state, current_upload_info(), results)
+                st.download_button(
+                    label=f"Download Project ({len(data) / 1024:.1f} KB)",
+                    data=data,
+                    file_name="CostSpirits_Project" + project_snapshot.SNAPSHOT_EXTENSION,
+                    mime="application/gzip"
+                )
+        with col_load:
+            project_file = st.file_uploader("Project file", type=["gz", "json"], key="project_file")
+            if project_file is not None:
+                try:
+                    snapshot = project_snapshot.load_snapshot(project_file.getvalue())
+                except ValueError as e:
+                    st.error(str(e))
+                else:
+                    st.caption(project_snapshot.snapshot_summary(snapshot))
+                    if st.button("Restore Project", key="project_restore"):
+                        project_snapshot.restore(st.session_state, snapshot)
+                        st.rerun()
+        project_upload = st.session_state.get(project_snapshot.PROJECT_KEY)
+        if project_upload:
+            current = current_upload_info()
+            if current is None:
+                st.info(f"Project restored. Upload '{project_upload['name']}' to continue the analysis; saved results can be exported already.")
+            elif current["sha1"] != project_upload["sha1"]:
+                st.warning(f"The uploaded workbook differs from the one this project was saved with ('{project_upload['name']}', "
+                           f"SHA-1 {project_upload['sha1'][:8]}). Selections of WBS elements that no longer exist are ignored.")
+
 # Streamlit app
 def main():
     st.set_page_config(page_title="CostSpirits: Subsystem Cost Estimator", layout="wide")
     st.title("CostSpirits: Subsystem Cost Estimator")
-    page = st.sidebar.radio("Select Page", ["Configure Calculator Page", "Generate Template", "Cost Analysis"])
+    page = st.sidebar.radio("Select Page", ["Configure Calculator Page", "Generate Template", "Cost Analysis", "Scenarios", "Portfolio"])
+    profiling.set_page(page)
     if page == "Generate Template":
         st.header("Step 1: Select Subsystems for Template")
         if 'selected_subsystems' not in st.session_state:
@@ -216,7 +442,7 @@ def main():
 
     elif page == "Configure Calculator Page":
         st.header("Step 2: Configure Calculator")
-        # --- Move Export, Save, Load buttons here ---
+        render_project_section()
         if 'show_upload_modal' not in st.session_state:
             st.session_state.show_upload_modal = True
         if st.session_state.show_upload_modal:
@@ -228,30 +454,40 @@ def main():
                 st.session_state.show_upload_modal = False
                 st.warning("Please go to the 'Generate Template' page, download the template, fill it with your historical data, and then return here.")
         if not st.session_state.show_upload_modal:
-            uploaded = st.file_uploader("Upload Excel file", type=["xlsx"])
+            uploaded = st.file_uploader("Upload Excel file", type=["xlsx"], key="history_upload")
             if uploaded:
                 st.session_state.uploaded_file = uploaded
-                st.success("File uploaded! Visualizing template content below:")
-                xls = pd.ExcelFile(uploaded)
-                # Prepare table data for all sheets
-                table_data = []
-                for sheet in xls.sheet_names:
-                    df = pd.read_excel(xls, sheet_name=sheet)
-                    mission_col = df.columns[0] if not df.empty else None
-                    num_missions = df[mission_col].nunique(dropna=True) if mission_col else 0
-                    table_data.append({"Subsystem/Component": sheet, "Number of Missions": num_missions, "Rows": len(df)})
-                st.subheader("Subsystem Sheets Found:")
-                st.table(table_data)
-                st.write("---")
-                st.subheader("Preview of Each Subsystem Sheet:")
-                for sheet in xls.sheet_names:
-                    df = pd.read_excel(xls, sheet_name=sheet)
-                    with st.expander(f"{sheet} ({df[df.columns[0]].nunique(dropna=True)} missions)", expanded=False):
-                        st.dataframe(df)
-                if st.button("Proceed to Cost Analysis"):
-                    st.session_state.page = "Cost Analysis"
-                    st.query_params["page"] = "Cost Analysis"
-                    st.success("Redirected to Cost Analysis. Please select the tab from the sidebar if not automatically redirected.")
+                upload_id = getattr(uploaded, "file_id", uploaded.name)
+                if st.session_state.get('_counted_upload') != upload_id:
+                    metrics.record_upload(uploaded.size)
+                    st.session_state['_counted_upload'] = upload_id
+                job = parse_upload(uploaded)
+                if not job.done:
+                    st.info("Reading the workbook in the background. You can keep configuring the analysis meanwhile; the sheet summary appears here when it is ready.")
+                    render_parse_progress(job.key)
+                elif job.error is not None:
+                    st.error(f"Could not read the uploaded workbook: {job.error}")
+                else:
+                    st.success("File uploaded! Visualizing template content below:")
+                    sheets = job.result
+                    # Prepare table data for all sheets
+                    table_data = []
+                    for sheet, df in sheets.items():
+                        mission_col = df.columns[0] if not df.empty else None
+                        num_missions = df[mission_col].nunique(dropna=True) if mission_col else 0
+                        table_data.append({"Subsystem/Component": sheet, "Number of Missions": num_missions, "Rows": len(df)})
+                    st.subheader("Subsystem Sheets Found:")
+                    st.table(table_data)
+                    render_validation_report(job)
+                    st.write("---")
+                    st.subheader("Preview of Each Subsystem Sheet:")
+                    for sheet, df in sheets.items():
+                        with st.expander(f"{sheet} ({df[df.columns[0]].nunique(dropna=True)} missions)", expanded=False):
+                            render_paginated_table(df, key=f"preview_{sheet}", source=job.key)
+                    if st.button("Proceed to Cost Analysis"):
+                        st.session_state.page = "Cost Analysis"
+                        st.query_params["page"] = "Cost Analysis"
+                        st.success("Redirected to Cost Analysis. Please select the tab from the sidebar if not automatically redirected.")
                 # Mass Budget Template button ONLY here
                 if st.button("Download Mass Budget Excel Template"):
                     wb = create_mass_budget_template(uploaded)
@@ -264,166 +500,123 @@ def main():
                         file_name="CostSpirits_Mass_Budget_Template.xlsx",
                         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                     )
+                # --- Backtest of the cost-per-pound estimate ---
+                st.write("---")
+                st.subheader("Backtest Estimate Accuracy")
+                st.caption("Re-estimates every mission's WBS costs from all the other missions (leave-one-mission-out) and reports how far the cost-per-pound estimate is from the actual D&D + flight unit cost.")
+                upload_id = getattr(uploaded, "file_id", uploaded.name)
+                # The backtest runs on the sheets of the background parse
+                if not job.done or job.error is not None:
+                    st.caption("The backtest is available once the workbook has been read.")
+                elif st.button("Run Leave-One-Mission-Out Backtest", key="run_backtest"):
+                    with profiling.stage("backtest"):
+                        session_memory.put('backtest_results', (upload_id, run_backtest(job.result)))
+                backtest_results = session_memory.get('backtest_results')
+                if backtest_results is not None and backtest_results[0] == upload_id:
+                    records = backtest_results[1]
+                    if records.empty:
+                        st.info("No mission/WBS combination has enough data (weight, D&D and flight unit cost, plus at least one other mission) to backtest.")
+                    else:
+                        st.markdown("**Accuracy per sheet** (errors of the estimated total cost, in %)")
+                        st.dataframe(error_metrics(records, ["Sheet"]), hide_index=True, use_container_width=True)
+                        st.markdown("**Accuracy per WBS**")
+                        st.dataframe(error_metrics(records, ["Sheet", "WBS"]), hide_index=True, use_container_width=True)
+                        with st.expander(f"Held-out estimates ({len(records)})", expanded=False):
+                            st.dataframe(records, hide_index=True, use_container_width=True)
+                        st.download_button(
+                            label="Download Backtest Results (CSV)",
+                            data=records.to_csv(index=False),
+                            file_name="CostSpirits_Backtest.csv",
+                            mime="text/csv"
+                        )
+        # --- Local historical database ---
+        st.write("---")
+        st.subheader("Local Historical Database")
+        st.caption(f"Historical data imported here is indexed by subsystem, mission and WBS item and can be used on the Cost Analysis page without re-uploading the workbook. Database file: {history_db.DEFAULT_DB_PATH}")
+        # The database file is only created by the first import
+        db_conn = history_db.shared_connection()
+        uploaded = st.session_state.get('uploaded_file')
+        if uploaded and st.button("Import uploaded workbook into database", key="import_history_db"):
+            uploaded.seek(0)
+            db_conn = history_db.shared_connection(create=True)
+            inserted = history_db.import_workbook(db_conn, uploaded)
+            st.success(f"Imported {sum(inserted.values())} rows from {len(inserted)} sheets (existing rows of these subsystems were replaced).")
+        db_subsystems = history_db.list_subsystems(db_conn)
+        if db_subsystems.empty:
+            st.info("The database is empty. Upload a filled template and import it.")
+        else:
+            st.dataframe(db_subsystems, hide_index=True, use_container_width=True)
+            # Append the actuals of new missions without re-importing the master workbook
+            st.markdown("**Append New Missions**")
+            st.caption("Upload a workbook in the template format containing only the new missions. Its rows are added to the database and only the affected WBS averages are updated.")
+            append_file = st.file_uploader("Upload new mission rows", type=["xlsx"], key="append_file")
+            if append_file:
+                append_sheets = pd.read_excel(append_file, sheet_name=None)
+                duplicates = history_db.existing_missions(db_conn, append_sheets)
+                for subsystem, missions in duplicates.items():
+                    st.warning(f"{subsystem}: missions already in the database: {', '.join(missions)}. Appending adds their rows again.")
+                if st.button("Append to database", key="append_history_db"):
+                    affected = history_db.append_sheets(db_conn, append_sheets)
+                    for subsystem, wbs_items in affected.items():
+                        st.success(f"{subsystem}: updated {', '.join(wbs_items)}")
         # --- Move all action buttons to the bottom, each in its own subsection ---
-        st.markdown("---")
-        st.subheader("Export to Excel")
-        st.caption("Download an Excel file containing all your cost analysis results and breakdowns. Use this after you have completed your analysis.")
-        export_clicked = st.button("Export to Excel", key="export_to_excel")
-        if export_clicked:
-            uploaded = st.session_state.get('uploaded_file')
-            if not uploaded:
-                st.warning("Please upload a filled template before exporting to Excel.")
-            else:
-                import io
-                from openpyxl import Workbook
-                from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
-                output = io.BytesIO()
-                wb = Workbook()
-                wb.remove(wb.active)
-                subsystem_results = st.session_state.get('subsystem_results', {})
-                # Define styles
-                header_fill = PatternFill(start_color="FFC000", end_color="FFC000", fill_type="solid")
-                header_font = Font(bold=True, color="FFFFFF")
-                header_align = Alignment(horizontal="center", vertical="center")
-                thin_border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
-                alt_fill = PatternFill(start_color="FFF2CC", end_color="FFF2CC", fill_type="solid")
-                # Color palette for sheets
-                sheet_colors = ["4F81BD", "C0504D", "9BBB59", "8064A2", "F79646", "2C4D75", "1F497D", "E46C0A", "00B050", "7030A0"]
-                for idx, (sheet, result_df) in enumerate(subsystem_results.items()):
-                    ws = wb.create_sheet(title=sheet[:31])
-                    color = sheet_colors[idx % len(sheet_colors)]
-                    sheet_header_fill = PatternFill(start_color=color, end_color=color, fill_type="solid")
-                    # Write headers
-                    for c_idx, col in enumerate(result_df.columns, 1):
-                        cell = ws.cell(row=1, column=c_idx, value=col)
-                        cell.fill = sheet_header_fill
-                        cell.font = header_font
-                        cell.alignment = header_align
-                        cell.border = thin_border
-                    # Write data rows with alternating fill
-                    for r_idx, row in enumerate(result_df.reset_index(drop=True).itertuples(index=False), 2):
-                        for c_idx, value in enumerate(row, 1):
-                            cell = ws.cell(row=r_idx, column=c_idx, value=value)
-                            cell.border = thin_border
-                            if r_idx % 2 == 0:
-                                cell.fill = alt_fill
-                    # Auto-fit columns
-                    for col in ws.columns:
-                        max_length = 0
-                        col_letter = col[0].column_letter
-                        for cell in col:
-                            try:
-                                if cell.value:
-                                    max_length = max(max_length, len(str(cell.value)))
-                            except:
-                                pass
-                        ws.column_dimensions[col_letter].width = min(max_length + 2, 40)
-                    # --- Add EUR table below main table ---
-                    eur_df = st.session_state.get(f"eur_df_{sheet}")
-                    if eur_df is not None:
-                        start_row = ws.max_row + 2
-                        for c_idx, col in enumerate(eur_df.columns, 1):
-                            cell = ws.cell(row=start_row, column=c_idx, value=col)
-                            cell.fill = PatternFill(start_color="92D050", end_color="92D050", fill_type="solid")
-                            cell.font = header_font
-                            cell.alignment = header_align
-                            cell.border = thin_border
-                        for r_idx, row in enumerate(eur_df.reset_index(drop=True).itertuples(index=False), start_row+1):
-                            for c_idx, value in enumerate(row, 1):
-                                cell = ws.cell(row=r_idx, column=c_idx, value=value)
-                                cell.border = thin_border
-                                if r_idx % 2 == 0:
-                                    cell.fill = PatternFill(start_color="E2EFDA", end_color="E2EFDA", fill_type="solid")
-                    # Auto-fit columns again
-                    for col in ws.columns:
-                        max_length = 0
-                        col_letter = col[0].column_letter
-                        for cell in col:
-                            try:
-                                if cell.value:
-                                    max_length = max(max_length, len(str(cell.value)))
-                            except:
-                                pass
-                        ws.column_dimensions[col_letter].width = min(max_length + 2, 40)
-                # Total Cost Breakdown sheet (distinct style)
-                if 'subsystem_results' in st.session_state:
-                    ws = wb.create_sheet(title="Total Cost Breakdown")
-                    user_mass_df = st.session_state.get('user_mass_df')
-                    infl_df = st.session_state.get('infl_df')
-                    breakdown_header_fill = PatternFill(start_color="005fa3", end_color="005fa3", fill_type="solid")
-                    breakdown_alt_fill = PatternFill(start_color="E3F0FF", end_color="E3F0FF", fill_type="solid")
-                    if user_mass_df is not None:
-                        for c_idx, col in enumerate(user_mass_df.columns, 1):
-                            cell = ws.cell(row=1, column=c_idx, value=col)
-                            cell.fill = breakdown_header_fill
-                            cell.font = header_font
-                            cell.alignment = header_align
-                            cell.border = thin_border
-                        for r_idx, row in enumerate(user_mass_df.reset_index(drop=True).itertuples(index=False), 2):
-                            for c_idx, value in enumerate(row, 1):
-                                cell = ws.cell(row=r_idx, column=c_idx, value=value)
-                                cell.border = thin_border
-                                if r_idx % 2 == 0:
-                                    cell.fill = breakdown_alt_fill
-                    if infl_df is not None:
-                        start_row = ws.max_row + 2
-                        for c_idx, col in enumerate(infl_df.columns, 1):
-                            cell = ws.cell(row=start_row, column=c_idx, value=col)
-                            cell.fill = breakdown_header_fill
-                            cell.font = header_font
-                            cell.alignment = header_align
-                            cell.border = thin_border
-                        for r_idx, row in enumerate(infl_df.reset_index(drop=True).itertuples(index=False), start_row+1):
-                            for c_idx, value in enumerate(row, 1):
-                                cell = ws.cell(row=r_idx, column=c_idx, value=value)
-                                cell.border = thin_border
-                                if r_idx % 2 == 0:
-                                    cell.fill = breakdown_alt_fill
-                    # Auto-fit columns
-                    for col in ws.columns:
-                        max_length = 0
-                        col_letter = col[0].column_letter
-                        for cell in col:
-                            try:
-                                if cell.value:
-                                    max_length = max(max_length, len(str(cell.value)))
-                            except:
-                                pass
-                        ws.column_dimensions[col_letter].width = min(max_length + 2, 40)
-                wb.save(output)
-                st.download_button(
-                    label="Download Cost Analysis Excel",
-                    data=output.getvalue(),
-                    file_name="CostSpirits_Cost_Analysis.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
+        render_export_section()
     elif page == "Cost Analysis":
         st.header("Cost Analysis")
         uploaded = st.session_state.get('uploaded_file')
-        if not uploaded:
+        db_conn = history_db.shared_connection()
+        db_subsystems = history_db.list_subsystems(db_conn)
+        source_options = (["Uploaded workbook"] if uploaded else []) + (["Local database"] if not db_subsystems.empty else [])
+        if not source_options:
             st.info("Please upload a filled template first on the 'Upload Filled Template' page.")
             return
+        data_source = st.radio("Historical data source", source_options, horizontal=True, key="data_source")
+        use_db = data_source == "Local database"
+        col1, col2 = st.columns([2, 1])
+        currency_options = currency.available_currencies()
+        # Defaults of input widgets are seeded in session state, where restored projects also put their values
+        st.session_state.setdefault("currencies", [c for c in currency.DEFAULT_CURRENCIES if c in currency_options])
+        currencies = col1.multiselect("Show inflation adjusted estimates in", currency_options, key="currencies")
+        rate_mode = col2.radio("Exchange rate", currency.RATE_MODES, horizontal=True, key="currency_rate_mode",
+                               help="Latest rate of exchange_rates.csv, or the rate of each sheet's target year")
+        st.session_state['export_currencies'] = (currencies, rate_mode)
         # --- Ensure subsystem_results is initialized ---
-        if 'subsystem_results' not in st.session_state:
-            st.session_state['subsystem_results'] = {}
-        xls = pd.ExcelFile(uploaded)
-        tab_names = xls.sheet_names
+        session_memory.setdefault('subsystem_results', {})
+        if use_db:
+            tab_names = list(db_subsystems["Subsystem"])
+        else:
+            job = parse_upload(uploaded)
+            if not job.done:
+                st.info("The uploaded workbook is still being read; Cost Analysis opens when it is ready.")
+                render_parse_progress(job.key)
+                return
+            if job.error is not None:
+                st.error(f"Could not read the uploaded workbook: {job.error}")
+                return
+            sheets = job.result
+            tab_names = list(sheets)
         tabs = st.tabs(tab_names)
         # --- Per-subsystem Tabs ---
         for i, sheet in enumerate(tab_names):
-            with tabs[i]:
+            with tabs[i], profiling.stage(f"{sheet}: tab total"):
                 st.subheader(f"Subsystem: {sheet}")
-                df = pd.read_excel(xls, sheet_name=sheet)
-                # Find unique WBS elements
-                wbs_col = None
-                for col in df.columns:
-                    if col.strip().lower() in ["wbs item", "wbs element", "wbs"]:
-                        wbs_col = col
-                        break
-                if wbs_col is None:
-                    st.warning("No WBS column found in this sheet.")
-                    continue
-                unique_wbs = sorted(df[wbs_col].dropna().unique())
+                if use_db:
+                    # Only the WBS list is read up front; rows and aggregates are queried for the selected WBS
+                    df = None
+                    wbs_col = "WBS Item"
+                    unique_wbs = history_db.list_wbs(db_conn, sheet)
+                else:
+                    df = sheets[sheet]
+                    # Find unique WBS elements
+                    sheet_issues = job.report[job.report["Sheet"] == sheet]
+                    if not sheet_issues.empty:
+                        st.warning(f"{len(sheet_issues)} data validation findings in this sheet "
+                                   f"({', '.join(sheet_issues['Check'].unique())}); see the report on the Configure Calculator page.")
+                    wbs_col = find_wbs_column(df)
+                    if wbs_col is None:
+                        st.warning("No WBS column found in this sheet.")
+                        continue
+                    unique_wbs = sorted(df[wbs_col].dropna().unique())
                 # Dynamic section numbering
                 section_num = 1
                 # --- WBS Merging UI ---
@@ -445,6 +638,34 @@ def main():
                                 st.session_state['wbs_merge_groups'][sheet] = {}
                             st.session_state['wbs_merge_groups'][sheet][merge_name] = list(wbs_to_merge)
                             st.success(f"Merged group '{merge_name}' created for: {', '.join(wbs_to_merge)}")
+                    # --- Suggested merge groups from fuzzy WBS name matching ---
+                    with st.expander("Suggested merge groups (similar WBS names)", expanded=False):
+                        st.session_state.setdefault(f"merge_threshold_{sheet}", DEFAULT_THRESHOLD)
+                        threshold = st.slider("Name similarity threshold", 0.3, 1.0, step=0.05, key=f"merge_threshold_{sheet}",
+                                              help="Trigram similarity of the normalized WBS names; lower values propose larger groups.")
+                        wbs_counts = None if df is None else df[wbs_col].value_counts().reindex(unique_wbs).tolist()
+                        suggestions = cached_merge_suggestions(names_hash(unique_wbs, wbs_counts), threshold, unique_wbs, wbs_counts)
+                        already_merged = {w for group in st.session_state.get('wbs_merge_groups', {}).get(sheet, {}).values() for w in group}
+                        suggestions = {name: members for name, members in suggestions.items() if not already_merged.intersection(members)}
+                        if not suggestions:
+                            st.caption("No similar WBS names found at this threshold.")
+                        else:
+                            suggestion_df = pd.DataFrame({
+                                "Apply": True,
+                                "Group Name": list(suggestions),
+                                "Members": [", ".join(map(str, members)) for members in suggestions.values()],
+                                "Size": [len(members) for members in suggestions.values()],
+                            })
+                            edited = st.data_editor(suggestion_df, hide_index=True, use_container_width=True,
+                                                    disabled=["Members", "Size"], key=f"merge_suggestions_{sheet}_{names_hash(list(suggestions))[:8]}")
+                            if st.button("Apply suggested merges", key=f"apply_suggested_{sheet}"):
+                                groups = st.session_state.setdefault('wbs_merge_groups', {}).setdefault(sheet, {})
+                                applied = 0
+                                for apply, group_name, members in zip(edited["Apply"], edited["Group Name"], suggestions.values()):
+                                    if apply and str(group_name).strip():
+                                        groups[str(group_name).strip()] = list(members)
+                                        applied += 1
+                                st.success(f"Applied {applied} merge groups.")
                 # Prepare WBS list for checklist (merged + unmerged)
                 merge_groups = st.session_state.get('wbs_merge_groups', {}).get(sheet, {})
                 merged_wbs_flat = [w for group in merge_groups.values() for w in group]
@@ -455,7 +676,8 @@ def main():
                 wbs_check_cols = st.columns(min(4, len(wbs_for_checklist)))
                 for idx, wbs in enumerate(wbs_for_checklist):
                     with wbs_check_cols[idx % len(wbs_check_cols)]:
-                        if st.checkbox(f"{wbs}", key=f"{sheet}_wbs_{wbs}", value=True):
+                        st.session_state.setdefault(f"{sheet}_wbs_{wbs}", True)
+                        if st.checkbox(f"{wbs}", key=f"{sheet}_wbs_{wbs}"):
                             wbs_selected.append(wbs)
                 if not wbs_selected:
                     st.info("Please select at least one WBS component to proceed.")
@@ -469,8 +691,15 @@ def main():
                     else:
                         wbs_analysis_map[wbs] = wbs
                 # Filter dataframe for selected WBS (including merged)
-                df_selected = df[df[wbs_col].isin(wbs_analysis_map.keys())].copy()
-                df_selected['WBS_Mapped'] = df_selected[wbs_col].map(wbs_analysis_map)
+                with profiling.stage(f"{sheet}: row selection"):
+                    if use_db:
+                        revisions = tuple(sorted(history_db.wbs_revisions(db_conn, sheet, wbs_analysis_map.keys()).items()))
+                        df_selected, db_aggregates = cached_db_selection(
+                            history_db.DEFAULT_DB_PATH, sheet, tuple(wbs_analysis_map.items()), revisions
+                        )
+                        df_selected = df_selected.assign(WBS_Mapped=df_selected[wbs_col].map(wbs_analysis_map))
+                    else:
+                        df_selected = select_wbs_rows(df, wbs_col, wbs_analysis_map)
                 # Mass entry section
                 if len(wbs_selected) == 1:
                     st.markdown(f"#### {section_num}. Enter Mass for {wbs_selected[0]}")
@@ -516,91 +745,34 @@ def main():
                 # --- Inflation configuration ---
                 st.markdown(f"#### {section_num}. Inflation Adjustment (Optional)")
                 # Load inflation table
-                infl_df = pd.read_excel('Inflation Table.xlsx', header=None)
-                # Get year row and index row
-                year_row = infl_df.iloc[5].tolist()[1:]
-                index_row = infl_df.iloc[7].tolist()[1:]
-                # Remove non-numeric years (e.g., 'TQ')
-                year_index_pairs = [(y, idx) for y, idx in zip(year_row, index_row) if isinstance(y, (int, float))]
-                years = [int(y) for y, _ in year_index_pairs]
-                indices = [float(idx) for _, idx in year_index_pairs]
-                year_to_index = dict(zip(years, indices))
+                years, year_to_index = load_inflation_index()
                 # Ask user for base year (template cost year) and target year
                 st.info("You can adjust all costs for inflation using the NASA New Start Inflation Index.")
                 # Set default index for base year to 1999 if present, else fallback to 2024 or 0
-                if 1999 in years:
-                    base_year_index = years.index(1999)
-                elif 2024 in years:
-                    base_year_index = years.index(2024)
-                else:
-                    base_year_index = 0
-                base_year = st.selectbox("Which year are the costs in your template entered for?", years, index=base_year_index, key=f"base_year_{sheet}")
-                target_year = st.selectbox("Which year do you want to escalate costs to?", years, index=years.index(2025) if 2025 in years else len(years)-1, key=f"target_year_{sheet}")
+                base_year_index, target_year_index = inflation_year_defaults(years)
+                st.session_state.setdefault(f"base_year_{sheet}", years[base_year_index])
+                st.session_state.setdefault(f"target_year_{sheet}", years[target_year_index])
+                base_year = st.selectbox("Which year are the costs in your template entered for?", years, key=f"base_year_{sheet}")
+                target_year = st.selectbox("Which year do you want to escalate costs to?", years, key=f"target_year_{sheet}")
                 # Compute inflation factor
                 base_index = year_to_index.get(base_year, 1)
                 target_index = year_to_index.get(target_year, 1)
                 inflation_factor = target_index / base_index if base_index else 1
                 st.caption(f"Inflation factor from {base_year} to {target_year}: {inflation_factor:.3f}")
-                # Compute averages and price per pound for each WBS (merged or not)
-                result_rows = []
-                for wbs in wbs_selected:
-                    # For merged groups, aggregate all original WBS in the group
-                    wbs_rows = df_selected[df_selected['WBS_Mapped'] == wbs]
-                    def safe_mean(col):
-                        vals = pd.to_numeric(wbs_rows.get(col, pd.Series(dtype=float)), errors='coerce')
-                        vals = vals.dropna()
-                        return vals.mean() if not vals.empty else None
-                    avg_weight = safe_mean("Higher Weight Range (lbs)")
-                    avg_dd_cost = safe_mean("Higher D&D Cost Range")
-                    avg_total_cost = safe_mean("Higher Total Cost Range")
-                    avg_flight_unit_cost = safe_mean("Higher Flight Unit Cost Range")
-                    count = len(wbs_rows)
-                    # Use merged group name for mass entry
+                # Compute averages and price per pound for each WBS (merged or not) from grouped sums and counts
+                with profiling.stage(f"{sheet}: aggregation"):
+                    if use_db:
+                        sums, counts, rows = db_aggregates
+                    else:
+                        sums, counts, rows = merged_wbs_aggregates(df, wbs_col, wbs_analysis_map)
                     if len(wbs_selected) == 1:
                         # Only one group, use total/individual mass
-                        if unit == "kg":
-                            mass_lbs = total_mass * 2.20462
-                        else:
-                            mass_lbs = total_mass
+                        masses_lbs = {wbs_selected[0]: total_mass * 2.20462 if unit == "kg" else total_mass}
                     else:
-                        mass_lbs = wbs_mass_dict[wbs] * 2.20462 if unit == "kg" else wbs_mass_dict[wbs]
-                    price_per_lb = avg_total_cost / avg_weight if avg_weight and avg_total_cost else None
-                    est_price = price_per_lb * mass_lbs if price_per_lb else None
-                    # Inflation-adjusted costs
-                    adj_avg_dd_cost = avg_dd_cost * inflation_factor if avg_dd_cost else None
-                    adj_avg_total_cost = avg_total_cost * inflation_factor if avg_total_cost else None
-                    adj_est_price = est_price * inflation_factor if est_price else None
-                    # New: Flight Unit Cost (reference and inflation-adjusted)
-                    flight_unit_cost_new = ((avg_flight_unit_cost / avg_weight) * mass_lbs) if avg_flight_unit_cost and avg_weight else None
-                    dd_cost_new = (avg_dd_cost / avg_weight * mass_lbs) if avg_dd_cost and avg_weight else None
-                    adj_flight_unit_cost_new = flight_unit_cost_new * inflation_factor if flight_unit_cost_new else None
-                    # Change Avg Higher Total Cost to be the sum of avg_dd_cost and avg_flight_unit_cost
-                    result_rows.append({
-                        "WBS": wbs,
-                        "Count": count,
-                        "Avg Higher Weight Range (lbs)": avg_weight,
-                        "Avg Higher D&D Cost Range": avg_dd_cost,
-                        "Avg Higher Flight Unit Cost": avg_flight_unit_cost,
-                        "Avg Higher Total Cost": (avg_dd_cost if avg_dd_cost else 0) + (avg_flight_unit_cost if avg_flight_unit_cost else 0),
-                        "User Mass (lbs)": mass_lbs,
-                        "Est. Price (from hist.)": est_price,
-                        "Total Cost": (flight_unit_cost_new if flight_unit_cost_new else 0) + (dd_cost_new if dd_cost_new else 0),  # Sum of flight unit cost and D&D cost for user system
-                        "Flight Unit Cost per lbs": (avg_flight_unit_cost / avg_weight) if avg_flight_unit_cost and avg_weight else None,
-                        "D&D Cost per lbs": (avg_dd_cost / avg_weight) if avg_dd_cost and avg_weight else None,
-                        "D&D Cost": dd_cost_new,
-                        "Flight Unit Cost (new, ref yr)": flight_unit_cost_new,
-                        # "Price/lb (from hist.)": price_per_lb,  # Commented out as requested
-                        # "Flight Unit Cost (new, ref yr)": (avg_flight_unit_cost / avg_weight * mass_lbs) if avg_flight_unit_cost and avg_weight else None,  # User system flight unit cost
-                        f"Flight Unit Cost (new, {target_year})": adj_flight_unit_cost_new,
-                        f"Adj. D&D Cost ({target_year})": adj_avg_dd_cost,
-                        f"Adj. Total Cost ({target_year})": adj_avg_total_cost,
-                        f"Adj. Est. Price ({target_year})": adj_est_price
-                    })
-                result_df = pd.DataFrame(result_rows)
+                        masses_lbs = {wbs: wbs_mass_dict[wbs] * 2.20462 if unit == "kg" else wbs_mass_dict[wbs] for wbs in wbs_selected}
+                    result_df = estimate_wbs_costs(sums, counts, rows, wbs_selected, masses_lbs, inflation_factor, target_year)
                 # Store result_df in session state for aggregation in Total Cost Breakdown
-                if 'subsystem_results' not in st.session_state:
-                    st.session_state['subsystem_results'] = {}
-                st.session_state['subsystem_results'][sheet] = result_df
+                session_memory.setdefault('subsystem_results', {})[sheet] = result_df
                 # Rename columns for display: remove 'Range' everywhere
                 result_df_display = result_df.rename(columns=lambda x: x.replace('Range', '').replace('range', '').replace('  ', ' ').replace('  ', ' ').strip())
                 # Remove duplicate 'Total Cost Range' column, keep only 'Avg Higher Total Cost'
@@ -623,26 +795,110 @@ def main():
                     "WBS", f"Adj. Est. Price ({target_year})", f"Flight Unit Cost (new, {target_year})",
                     f"Adj. Flight Unit Cost per lbs ({target_year})", f"Adj. D&D Cost per lbs ({target_year})"
                 ]
-                st.markdown(f"#### {section_num}.1 Historical Data (Averages)")
-                st.dataframe(result_df_display[hist_cols].set_index("WBS"), use_container_width=True)
-                st.markdown(f"#### {section_num}.2 User Mass & Estimates")
-                st.dataframe(result_df_display[user_cols].set_index("WBS"), use_container_width=True)
-                st.markdown(f"#### {section_num}.3 Inflation Adjusted Estimates")
-                st.dataframe(result_df_display[infl_cols].set_index("WBS"), use_container_width=True)
-                # --- 3.3 Inflation Adjusted Estimates (EUR) ---
-                EUR_CONV = 0.86  # Example: 1 USD = 0.86 EUR (update as needed)
-                infl_cols_eur = [
-                    col for col in infl_cols if col != "WBS"
-                ]
-                eur_df = result_df_display[["WBS"] + infl_cols_eur].copy()
-                for col in infl_cols_eur:
-                    eur_df[col] = eur_df[col].apply(lambda x: x * EUR_CONV if pd.notnull(x) else x)
-                eur_df = eur_df.rename(columns={c: c + " (EUR)" for c in infl_cols_eur})
-                st.markdown(f"#### {section_num}.4 Inflation Adjusted Estimates (EUR)")
-                st.dataframe(eur_df.set_index("WBS"), use_container_width=True)
-                # Store for Excel export
-                st.session_state[f"eur_df_{sheet}"] = eur_df
+                with profiling.stage(f"{sheet}: result tables"):
+                    st.markdown(f"#### {section_num}.1 Historical Data (Averages)")
+                    st.dataframe(result_df_display[hist_cols].set_index("WBS"), use_container_width=True)
+                    st.markdown(f"#### {section_num}.2 User Mass & Estimates")
+                    st.dataframe(result_df_display[user_cols].set_index("WBS"), use_container_width=True)
+                    st.markdown(f"#### {section_num}.3 Inflation Adjusted Estimates")
+                    st.dataframe(result_df_display[infl_cols].set_index("WBS"), use_container_width=True)
+                    # --- 3.4 Inflation Adjusted Estimates in the selected currencies ---
+                    if currencies:
+                        rates = currency_rates(currencies, rate_mode, target_year)
+                        currency_df = currency.currency_table(result_df, inflation_factor, target_year, currencies, rates)
+                        st.markdown(f"#### {section_num}.4 Inflation Adjusted Estimates ({', '.join(currencies)})")
+                        st.caption(currency.rate_caption(currencies, rates, "latest" if rate_mode == "Latest rate" else f"{target_year} rate"))
+                        st.dataframe(currency_df.set_index("WBS"), use_container_width=True)
+                # The export converts the stored USD results again with these parameters
+                st.session_state.setdefault('currency_params', {})[sheet] = (inflation_factor, target_year)
+                section_num += 1
+                # --- Production quantity (learning curve) ---
+                st.markdown(f"#### {section_num}. (Optional) Production Quantity / Learning Curve")
                 section_num += 1
+                if st.checkbox("Estimate cost of multiple flight units", key=f"lc_enable_{sheet}"):
+                    lc_col1, lc_col2, lc_col3 = st.columns(3)
+                    lc_method = lc_col1.radio("Learning curve theory", LEARNING_CURVE_METHODS, key=f"lc_method_{sheet}")
+                    st.session_state.setdefault(f"lc_slope_{sheet}", 90.0)
+                    lc_slope_pct = lc_col2.number_input("Learning curve slope (%)", min_value=50.5, max_value=100.0, step=0.5, key=f"lc_slope_{sheet}")
+                    lc_quantity = int(lc_col3.number_input("Number of flight units", min_value=1, step=1, key=f"lc_quantity_{sheet}"))
+                    lc_slope = lc_slope_pct / 100
+                    # First unit cost (T1) per WBS comes from the per-lb flight unit estimate
+                    first_unit_costs = result_df["Flight Unit Cost (new, ref yr)"]
+                    production_cost = production_cost_matrix(first_unit_costs, [lc_quantity], lc_slope, lc_method)[:, 0]
+                    result_df["Production Quantity"] = lc_quantity
+                    result_df["Production Cost (ref yr)"] = production_cost
+                    result_df[f"Production Cost ({target_year})"] = production_cost * inflation_factor
+                    result_df[f"Program Cost (D&D + Production, {target_year})"] = (
+                        pd.to_numeric(result_df["D&D Cost"], errors='coerce').fillna(0) + pd.Series(production_cost).fillna(0)
+                    ) * inflation_factor
+                    session_memory.setdefault('subsystem_results', {})[sheet] = result_df
+                    st.caption(f"{lc_method} learning curve, {lc_slope_pct:.1f}% slope, {lc_quantity} unit(s). Costs escalated to {target_year}.")
+                    st.dataframe(result_df[["WBS", "Production Quantity", "Production Cost (ref yr)", f"Production Cost ({target_year})",
+                                            f"Program Cost (D&D + Production, {target_year})"]].set_index("WBS"), use_container_width=True)
+                    st.session_state.setdefault(f"lc_trade_{sheet}", "1, 2, 5, 10, 25, 50, 100")
+                    lc_trade_text = st.text_input("Quantities to trade (comma separated)", key=f"lc_trade_{sheet}")
+                    try:
+                        trade_quantities = parse_quantity_list(lc_trade_text)
+                    except ValueError as e:
+                        st.warning(f"Invalid quantity list: {e}")
+                        trade_quantities = []
+                    if trade_quantities:
+                        trade_matrix = production_cost_matrix(first_unit_costs, trade_quantities, lc_slope, lc_method) * inflation_factor
+                        trade_df = pd.DataFrame(trade_matrix, index=result_df["WBS"], columns=[f"N={q}" for q in trade_quantities])
+                        trade_df.loc["Total"] = trade_df.sum(min_count=1)
+                        st.markdown(f"Production cost ({target_year}) by quantity")
+                        st.dataframe(trade_df, use_container_width=True)
+                # --- Time-phased budget ---
+                st.markdown(f"#### {section_num}. (Optional) Time-Phased Budget")
+                section_num += 1
+                phasing_results = session_memory.setdefault('phasing_results', {})
+                if st.checkbox("Spread costs over a development schedule (then-year budget)", key=f"phasing_enable_{sheet}"):
+                    first_year, last_year = years[0], years[-1]
+                    ph_col1, ph_col2, ph_col3, ph_col4 = st.columns(4)
+                    st.session_state.setdefault(f"phasing_dd_start_{sheet}", min(target_year, last_year))
+                    dd_start = int(ph_col1.number_input("D&D start year", min_value=first_year, max_value=last_year, step=1, key=f"phasing_dd_start_{sheet}"))
+                    st.session_state.setdefault(f"phasing_dd_end_{sheet}", min(dd_start + 4, last_year))
+                    dd_end = int(ph_col2.number_input("D&D end year", min_value=first_year, max_value=last_year, step=1, key=f"phasing_dd_end_{sheet}"))
+                    st.session_state.setdefault(f"phasing_fu_start_{sheet}", min(dd_start + 2, last_year))
+                    fu_start = int(ph_col3.number_input("Flight unit start year", min_value=first_year, max_value=last_year, step=1, key=f"phasing_fu_start_{sheet}"))
+                    st.session_state.setdefault(f"phasing_fu_end_{sheet}", min(dd_end + 2, last_year))
+                    fu_end = int(ph_col4.number_input("Flight unit end year", min_value=first_year, max_value=last_year, step=1, key=f"phasing_fu_end_{sheet}"))
+                    ph_col5, ph_col6, ph_col7 = st.columns(3)
+                    ph_profile = ph_col5.selectbox("Spending profile", PHASING_PROFILES, key=f"phasing_profile_{sheet}")
+                    profile_params = {}
+                    if ph_profile == "Beta":
+                        st.session_state.setdefault(f"phasing_alpha_{sheet}", 2.0)
+                        st.session_state.setdefault(f"phasing_beta_{sheet}", 2.0)
+                        profile_params["alpha"] = ph_col6.number_input("Beta shape α (early spend)", min_value=1.0, step=0.1, key=f"phasing_alpha_{sheet}")
+                        profile_params["beta"] = ph_col7.number_input("Beta shape β (late spend)", min_value=1.0, step=0.1, key=f"phasing_beta_{sheet}")
+                    elif ph_profile == "Trapezoidal":
+                        st.session_state.setdefault(f"phasing_ramp_up_{sheet}", 0.25)
+                        st.session_state.setdefault(f"phasing_ramp_down_{sheet}", 0.25)
+                        profile_params["ramp_up"] = ph_col6.number_input("Ramp-up fraction", min_value=0.0, max_value=1.0, step=0.05, key=f"phasing_ramp_up_{sheet}")
+                        profile_params["ramp_down"] = ph_col7.number_input("Ramp-down fraction", min_value=0.0, max_value=1.0, step=0.05, key=f"phasing_ramp_down_{sheet}")
+                    st.caption("Schedules can be overridden per WBS in the table below.")
+                    spans_df = st.data_editor(
+                        pd.DataFrame({"WBS": result_df["WBS"], "D&D Start": dd_start, "D&D End": dd_end, "FU Start": fu_start, "FU End": fu_end}),
+                        disabled=["WBS"], hide_index=True, use_container_width=True, key=f"phasing_spans_{sheet}"
+                    )
+                    flight_cost_col = "Production Cost (ref yr)" if "Production Cost (ref yr)" in result_df else "Flight Unit Cost (new, ref yr)"
+                    try:
+                        phasing_df = build_phasing_table(
+                            result_df["WBS"], result_df["D&D Cost"], result_df[flight_cost_col],
+                            (spans_df["D&D Start"], spans_df["D&D End"]), (spans_df["FU Start"], spans_df["FU End"]),
+                            year_to_index, base_year, ph_profile, **profile_params
+                        )
+                    except ValueError as e:
+                        st.warning(f"Cannot phase costs: {e}")
+                        phasing_results.pop(sheet, None)
+                    else:
+                        phasing_results[sheet] = phasing_df
+                        st.markdown(f"Then-year budget profile (costs entered in {base_year} $)")
+                        st.dataframe(phasing_df.rename(columns=str).set_index(["WBS", "Cost Element"]), use_container_width=True)
+                        year_totals = phasing_df.drop(columns=["WBS", "Cost Element", "Total"]).sum()
+                        st.bar_chart(pd.DataFrame({"Then-year budget": year_totals.values}, index=[str(y) for y in year_totals.index]))
+                else:
+                    phasing_results.pop(sheet, None)
                 st.markdown("<div style='margin-top:1em;'></div>", unsafe_allow_html=True)
                 selected_breakdown = st.selectbox(
                     "Select a WBS to view breakdown:",
@@ -653,14 +909,14 @@ def main():
                     st.markdown(f"<div style='margin-top:1em; padding:1em; border-radius:8px; background:#f3f6fa; border:1px solid #e0e0e0; font-weight:bold; color:#222;'>Breakdown for WBS: <span style='color:#005fa3'>{selected_breakdown}</span></div>", unsafe_allow_html=True)
                     wbs_rows = df_selected[df_selected['WBS_Mapped'] == selected_breakdown]
                     st.dataframe(wbs_rows, use_container_width=True)
-                with st.expander("Show/hide full data table", expanded=False):
-                    st.dataframe(df)
+                if df is not None:
+                    with st.expander("Show/hide full data table", expanded=False):
+                        render_paginated_table(df, key=f"full_table_{sheet}", source=job.key)
                 st.markdown("#### 4. Mass and Cost Trends Visualization")
                 # Prepare data for plotting: show historical mass vs. cost for all selected/merged WBS
                 import plotly.express as px
                 # Combine all rows for selected/merged WBS
-                plot_df = df_selected.copy()
-                plot_df['User Mass (lbs)'] = plot_df['WBS_Mapped'].map({w: result_df.set_index('WBS').loc[w, 'User Mass (lbs)'] for w in result_df['WBS']})
+                plot_df = df_selected.assign(**{'User Mass (lbs)': df_selected['WBS_Mapped'].map(result_df.set_index('WBS')['User Mass (lbs)'].to_dict())})
                 # Sliders for cost range
                 min_cost = pd.to_numeric(plot_df['Higher Total Cost Range'], errors='coerce').min()
                 max_cost = pd.to_numeric(plot_df['Higher Total Cost Range'], errors='coerce').max()
@@ -675,25 +931,23 @@ def main():
                     )
                 filtered_plot_df = plot_df[(pd.to_numeric(plot_df['Higher Total Cost Range'], errors='coerce') >= cost_range[0]) & (pd.to_numeric(plot_df['Higher Total Cost Range'], errors='coerce') <= cost_range[1])]
                 # Plot mass vs. cost for each WBS_Mapped
-                fig = px.scatter(filtered_plot_df, x='Higher Weight Range (lbs)', y='Higher Total Cost Range', color='WBS_Mapped',
-                    hover_data=['Mission', 'WBS_Mapped', 'Higher D&D Cost Range', 'Higher Total Cost Range', 'Higher Weight Range (lbs)'],
-                    title='Historical Mass vs. Total Cost by WBS', labels={'Higher Weight Range (lbs)': 'Mass (lbs)', 'Higher Total Cost Range': 'Total Cost'})
-                st.plotly_chart(fig, use_container_width=True)
+                with profiling.stage(f"{sheet}: plot mass vs. total cost"):
+                    fig = px.scatter(filtered_plot_df, x='Higher Weight Range (lbs)', y='Higher Total Cost Range', color='WBS_Mapped',
+                        hover_data=['Mission', 'WBS_Mapped', 'Higher D&D Cost Range', 'Higher Total Cost Range', 'Higher Weight Range (lbs)'],
+                        title='Historical Mass vs. Total Cost by WBS', labels={'Higher Weight Range (lbs)': 'Mass (lbs)', 'Higher Total Cost Range': 'Total Cost'})
+                    st.plotly_chart(fig, use_container_width=True)
                 # Optionally, show cost per unit mass trend
                 filtered_plot_df['Cost per lb'] = pd.to_numeric(filtered_plot_df['Higher Total Cost Range'], errors='coerce') / pd.to_numeric(filtered_plot_df['Higher Weight Range (lbs)'], errors='coerce')
-                fig2 = px.scatter(filtered_plot_df, x='Higher Weight Range (lbs)', y='Cost per lb', color='WBS_Mapped',
-                    hover_data=['Mission', 'WBS_Mapped', 'Higher D&D Cost Range', 'Higher Total Cost Range', 'Higher Weight Range (lbs)'],
-                    title='Historical Mass vs. Cost per Unit Mass by WBS', labels={'Higher Weight Range (lbs)': 'Mass (lbs)', 'Cost per lb': 'Cost per lb'})
-                st.plotly_chart(fig2, use_container_width=True)
+                with profiling.stage(f"{sheet}: plot cost per lb"):
+                    fig2 = px.scatter(filtered_plot_df, x='Higher Weight Range (lbs)', y='Cost per lb', color='WBS_Mapped',
+                        hover_data=['Mission', 'WBS_Mapped', 'Higher D&D Cost Range', 'Higher Total Cost Range', 'Higher Weight Range (lbs)'],
+                        title='Historical Mass vs. Cost per Unit Mass by WBS', labels={'Higher Weight Range (lbs)': 'Mass (lbs)', 'Cost per lb': 'Cost per lb'})
+                    st.plotly_chart(fig2, use_container_width=True)
                 st.markdown("#### 4. Mass vs. Cost Line Plot (Interactive)")
                 # Prepare data for line plot: x=mass, y=costs (3 lines)
                 import plotly.graph_objects as go
                 # Use all selected/merged WBS rows
-                plot_df = df_selected.copy()
-                plot_df['Higher Weight Range (lbs)'] = pd.to_numeric(plot_df['Higher Weight Range (lbs)'], errors='coerce')
-                plot_df['Higher D&D Cost Range'] = pd.to_numeric(plot_df['Higher D&D Cost Range'], errors='coerce')
-                plot_df['Higher Flight Unit Cost Range'] = pd.to_numeric(plot_df['Higher Flight Unit Cost Range'], errors='coerce')
-                plot_df['Higher Total Cost Range'] = pd.to_numeric(plot_df['Higher Total Cost Range'], errors='coerce')
+                plot_df = df_selected.assign(**numeric_columns(df_selected))
                 # Remove rows with missing mass
                 plot_df = plot_df.dropna(subset=['Higher Weight Range (lbs)'])
                 # Slider for mass range
@@ -710,151 +964,222 @@ def main():
                     )
                 filtered_plot_df = plot_df[(plot_df['Higher Weight Range (lbs)'] >= mass_range[0]) & (plot_df['Higher Weight Range (lbs)'] <= mass_range[1])]
                 filtered_plot_df = filtered_plot_df.sort_values('Higher Weight Range (lbs)')
-                fig = go.Figure()
-                fig.add_trace(go.Scatter(x=filtered_plot_df['Higher Weight Range (lbs)'], y=filtered_plot_df['Higher D&D Cost Range'],
-                                         mode='lines+markers', name='Higher D&D Cost'))
-                fig.add_trace(go.Scatter(x=filtered_plot_df['Higher Weight Range (lbs)'], y=filtered_plot_df['Higher Flight Unit Cost Range'],
-                                         mode='lines+markers', name='Higher Flight Unit Cost'))
-                fig.add_trace(go.Scatter(x=filtered_plot_df['Higher Weight Range (lbs)'], y=filtered_plot_df['Higher Total Cost Range'],
-                                         mode='lines+markers', name='Higher Total Cost'))
-                fig.update_layout(title='Mass vs. Cost (Historical Data)',
-                                  xaxis_title='Mass (lbs)',
-                                  yaxis_title='Cost',
-                                  legend_title='Cost Type',
-                                  hovermode='x unified')
-                st.plotly_chart(fig, use_container_width=True)
+                with profiling.stage(f"{sheet}: plot mass vs. cost lines"):
+                    fig = go.Figure()
+                    fig.add_trace(go.Scatter(x=filtered_plot_df['Higher Weight Range (lbs)'], y=filtered_plot_df['Higher D&D Cost Range'],
+                                             mode='lines+markers', name='Higher D&D Cost'))
+                    fig.add_trace(go.Scatter(x=filtered_plot_df['Higher Weight Range (lbs)'], y=filtered_plot_df['Higher Flight Unit Cost Range'],
+                                             mode='lines+markers', name='Higher Flight Unit Cost'))
+                    fig.add_trace(go.Scatter(x=filtered_plot_df['Higher Weight Range (lbs)'], y=filtered_plot_df['Higher Total Cost Range'],
+                                             mode='lines+markers', name='Higher Total Cost'))
+                    fig.update_layout(title='Mass vs. Cost (Historical Data)',
+                                      xaxis_title='Mass (lbs)',
+                                      yaxis_title='Cost',
+                                      legend_title='Cost Type',
+                                      hovermode='x unified')
+                    st.plotly_chart(fig, use_container_width=True)
         # --- Place Export to Excel button at the bottom, always visible ---
-        st.markdown("---")
-        st.subheader("Export to Excel")
-        st.caption("Download an Excel file containing all your cost analysis results and breakdowns. Use this after you have completed your analysis.")
-        export_clicked = st.button("Export to Excel", key="export_to_excel")
-        if export_clicked:
-            uploaded = st.session_state.get('uploaded_file')
-            if not uploaded:
-                st.warning("Please upload a filled template before exporting to Excel.")
+        render_export_section()
+    elif page == "Scenarios":
+        st.header("Scenarios: Compare Alternatives of One Spacecraft")
+        st.caption("Define named scenarios with their own WBS masses, merge groups and cost/target years. All scenarios are estimated together from the same historical aggregates and compared side by side with the first scenario as the baseline.")
+        uploaded = st.session_state.get('uploaded_file')
+        db_conn = history_db.shared_connection()
+        db_subsystems = history_db.list_subsystems(db_conn)
+        source_options = (["Uploaded workbook"] if uploaded else []) + (["Local database"] if not db_subsystems.empty else [])
+        if not source_options:
+            st.info("Please upload a filled template first on the 'Configure Calculator Page'.")
+            return
+        data_source = st.radio("Historical data source", source_options, horizontal=True, key="scenario_data_source")
+        with profiling.stage("scenario aggregates"):
+            if data_source == "Local database":
+                aggregates = database_aggregates(db_conn, db_subsystems["Subsystem"])
             else:
-                import io
-                from openpyxl import Workbook
-                from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
-                output = io.BytesIO()
-                wb = Workbook()
-                wb.remove(wb.active)
-                subsystem_results = st.session_state.get('subsystem_results', {})
-                # Define styles
-                header_fill = PatternFill(start_color="FFC000", end_color="FFC000", fill_type="solid")
-                header_font = Font(bold=True, color="FFFFFF")
-                header_align = Alignment(horizontal="center", vertical="center")
-                thin_border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
-                alt_fill = PatternFill(start_color="FFF2CC", end_color="FFF2CC", fill_type="solid")
-                # Color palette for sheets
-                sheet_colors = ["4F81BD", "C0504D", "9BBB59", "8064A2", "F79646", "2C4D75", "1F497D", "E46C0A", "00B050", "7030A0"]
-                for idx, (sheet, result_df) in enumerate(subsystem_results.items()):
-                    ws = wb.create_sheet(title=sheet[:31])
-                    color = sheet_colors[idx % len(sheet_colors)]
-                    sheet_header_fill = PatternFill(start_color=color, end_color=color, fill_type="solid")
-                    # Write headers
-                    for c_idx, col in enumerate(result_df.columns, 1):
-                        cell = ws.cell(row=1, column=c_idx, value=col)
-                        cell.fill = sheet_header_fill
-                        cell.font = header_font
-                        cell.alignment = header_align
-                        cell.border = thin_border
-                    # Write data rows with alternating fill
-                    for r_idx, row in enumerate(result_df.reset_index(drop=True).itertuples(index=False), 2):
-                        for c_idx, value in enumerate(row, 1):
-                            cell = ws.cell(row=r_idx, column=c_idx, value=value)
-                            cell.border = thin_border
-                            if r_idx % 2 == 0:
-                                cell.fill = alt_fill
-                    # Auto-fit columns
-                    for col in ws.columns:
-                        max_length = 0
-                        col_letter = col[0].column_letter
-                        for cell in col:
-                            try:
-                                if cell.value:
-                                    max_length = max(max_length, len(str(cell.value)))
-                            except:
-                                pass
-                        ws.column_dimensions[col_letter].width = min(max_length + 2, 40)
-                    # --- Add EUR table below main table ---
-                    eur_df = st.session_state.get(f"eur_df_{sheet}")
-                    if eur_df is not None:
-                        start_row = ws.max_row + 2
-                        for c_idx, col in enumerate(eur_df.columns, 1):
-                            cell = ws.cell(row=start_row, column=c_idx, value=col)
-                            cell.fill = PatternFill(start_color="92D050", end_color="92D050", fill_type="solid")
-                            cell.font = header_font
-                            cell.alignment = header_align
-                            cell.border = thin_border
-                        for r_idx, row in enumerate(eur_df.reset_index(drop=True).itertuples(index=False), start_row+1):
-                            for c_idx, value in enumerate(row, 1):
-                                cell = ws.cell(row=r_idx, column=c_idx, value=value)
-                                cell.border = thin_border
-                                if r_idx % 2 == 0:
-                                    cell.fill = PatternFill(start_color="E2EFDA", end_color="E2EFDA", fill_type="solid")
-                    # Auto-fit columns again
-                    for col in ws.columns:
-                        max_length = 0
-                        col_letter = col[0].column_letter
-                        for cell in col:
-                            try:
-                                if cell.value:
-                                    max_length = max(max_length, len(str(cell.value)))
-                            except:
-                                pass
-                        ws.column_dimensions[col_letter].width = min(max_length + 2, 40)
-                # Total Cost Breakdown sheet (distinct style)
-                if 'subsystem_results' in st.session_state:
-                    ws = wb.create_sheet(title="Total Cost Breakdown")
-                    user_mass_df = st.session_state.get('user_mass_df')
-                    infl_df = st.session_state.get('infl_df')
-                    breakdown_header_fill = PatternFill(start_color="005fa3", end_color="005fa3", fill_type="solid")
-                    breakdown_alt_fill = PatternFill(start_color="E3F0FF", end_color="E3F0FF", fill_type="solid")
-                    if user_mass_df is not None:
-                        for c_idx, col in enumerate(user_mass_df.columns, 1):
-                            cell = ws.cell(row=1, column=c_idx, value=col)
-                            cell.fill = breakdown_header_fill
-                            cell.font = header_font
-                            cell.alignment = header_align
-                            cell.border = thin_border
-                        for r_idx, row in enumerate(user_mass_df.reset_index(drop=True).itertuples(index=False), 2):
-                            for c_idx, value in enumerate(row, 1):
-                                cell = ws.cell(row=r_idx, column=c_idx, value=value)
-                                cell.border = thin_border
-                                if r_idx % 2 == 0:
-                                    cell.fill = breakdown_alt_fill
-                    if infl_df is not None:
-                        start_row = ws.max_row + 2
-                        for c_idx, col in enumerate(infl_df.columns, 1):
-                            cell = ws.cell(row=start_row, column=c_idx, value=col)
-                            cell.fill = breakdown_header_fill
-                            cell.font = header_font
-                            cell.alignment = header_align
-                            cell.border = thin_border
-                        for r_idx, row in enumerate(infl_df.reset_index(drop=True).itertuples(index=False), start_row+1):
-                            for c_idx, value in enumerate(row, 1):
-                                cell = ws.cell(row=r_idx, column=c_idx, value=value)
-                                cell.border = thin_border
-                                if r_idx % 2 == 0:
-                                    cell.fill = breakdown_alt_fill
-                    # Auto-fit columns
-                    for col in ws.columns:
-                        max_length = 0
-                        col_letter = col[0].column_letter
-                        for cell in col:
-                            try:
-                                if cell.value:
-                                    max_length = max(max_length, len(str(cell.value)))
-                            except:
-                                pass
-                        ws.column_dimensions[col_letter].width = min(max_length + 2, 40)
-                wb.save(output)
-                st.download_button(
-                    label="Download Cost Analysis Excel",
-                    data=output.getvalue(),
-                    file_name="CostSpirits_Cost_Analysis.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
+                job = parse_upload(uploaded)
+                if not job.done:
+                    st.info("The uploaded workbook is still being read; scenarios open when it is ready.")
+                    render_parse_progress(job.key)
+                    return
+                if job.error is not None:
+                    st.error(f"Could not read the uploaded workbook: {job.error}")
+                    return
+                aggregates = cached_sheet_aggregates(job.key, job.result)
+        if aggregates.empty:
+            st.warning("No WBS items found in the historical data.")
+            return
+        years, year_to_index = load_inflation_index()
+        base_year_index, target_year_index = inflation_year_defaults(years)
+        # Step 1: scenario settings
+        st.markdown("#### 1. Scenarios")
+        st.caption("One row per scenario. The first scenario is the baseline of the deltas.")
+        settings_df = st.data_editor(
+            default_scenarios(years[base_year_index], years[target_year_index]), num_rows="dynamic", hide_index=True,
+            use_container_width=True, key="scenario_settings",
+            column_config={
+                "Base Year": st.column_config.SelectboxColumn("Base Year", options=years, required=True, help="Year the template costs are entered for"),
+                "Target Year": st.column_config.SelectboxColumn("Target Year", options=years, required=True, help="Year to escalate the costs to"),
+            }
+        )
+        try:
+            settings_df = validate_scenarios(settings_df, year_to_index)
+        except ValueError as e:
+            st.warning(str(e))
+            return
+        names = list(settings_df["Scenario"])
+        # Step 2: masses per scenario; new scenarios start from the baseline's masses
+        st.markdown("#### 2. WBS Masses (lbs)")
+        st.caption("Enter the mass of every WBS present in each scenario; WBS left at 0 are not part of the scenario. A merged group's mass is the sum of its members' masses.")
+        masses = st.session_state.get('scenario_masses')
+        if masses is None or not masses.index.equals(aggregates.index):
+            masses = pd.DataFrame(0.0, index=aggregates.index, columns=[])
+        for name in names:
+            if name not in masses.columns:
+                masses[name] = masses[names[0]] if names[0] in masses.columns else 0.0
+        masses = masses[names]
+        masses = st.data_editor(masses.reset_index(), hide_index=True, use_container_width=True, disabled=["Subsystem", "WBS"],
+                                key=f"scenario_masses_{names_hash(names)[:8]}").set_index(["Subsystem", "WBS"])
+        masses = masses.apply(pd.to_numeric, errors='coerce').fillna(0.0).clip(lower=0.0)
+        st.session_state['scenario_masses'] = masses
+        # Step 3: merge groups per scenario
+        st.markdown("#### 3. (Optional) WBS Merge Groups")
+        st.caption("One row per group member: the scenario, the subsystem, the group name and a WBS of that subsystem.")
+        merges = st.data_editor(
+            pd.DataFrame(columns=MERGE_COLUMNS), num_rows="dynamic", hide_index=True, use_container_width=True, key="scenario_merges",
+            column_config={
+                "Scenario": st.column_config.SelectboxColumn("Scenario", options=names),
+                "Subsystem": st.column_config.SelectboxColumn("Subsystem", options=list(aggregates.index.get_level_values("Subsystem").unique())),
+                "WBS": st.column_config.SelectboxColumn("WBS", options=sorted(aggregates.index.get_level_values("WBS").unique())),
+            }
+        ).dropna(subset=MERGE_COLUMNS)
+        unknown = [f"{sub} / {wbs}" for sub, wbs in zip(merges["Subsystem"], merges["WBS"]) if (sub, wbs) not in aggregates.index]
+        if unknown:
+            st.warning(f"Ignored merge rows whose WBS is not in the subsystem: {', '.join(unknown)}")
+        # Step 4: evaluate all scenarios at once
+        st.markdown("#### 4. Scenario Comparison")
+        with profiling.stage("scenario matrix"):
+            detail = evaluate_scenarios(aggregates, masses, settings_df, year_to_index, merges)
+        if detail.empty:
+            session_memory.put('scenario_results', None)
+            st.info("Enter WBS masses to compare the scenarios.")
+            return
+        matrix, delta = scenario_matrix(detail, settings_df)
+        comparison = side_by_side(matrix, delta)
+        session_memory.put('scenario_results', (comparison, detail))
+        totals = matrix.loc[("Total", "")]
+        total_cols = st.columns(min(len(names), 4))
+        for idx, (name, column) in enumerate(zip(names, matrix.columns)):
+            delta_text = None if idx == 0 else f"{delta.loc[('Total', ''), f'Δ {name} vs. {names[0]}']:,.2f}"
+            total_cols[idx % len(total_cols)].metric(column, f"{totals[column]:,.2f}", delta=delta_text, delta_color="inverse")
+        st.markdown("Total cost per WBS (target year of each scenario) and delta to the baseline")
+        st.dataframe(comparison, hide_index=True, use_container_width=True)
+        missing = detail[detail["D&D Cost"].isna() & detail["Flight Unit Cost"].isna()]
+        if not missing.empty:
+            st.warning(f"{len(missing)} scenario WBS entries have no usable historical costs and are estimated as zero: "
+                       + ", ".join(f"{sc} / {w}" for sc, w in missing[["Scenario", "WBS"]].head(10).itertuples(index=False)))
+        with st.expander("Per-scenario detail", expanded=False):
+            st.dataframe(detail, hide_index=True, use_container_width=True)
+        st.caption("The scenario comparison is also included in the Cost Analysis Excel export.")
+        render_export_section()
+    elif page == "Portfolio":
+        st.header("Portfolio: Estimate Many Spacecraft")
+        uploaded = st.session_state.get('uploaded_file')
+        if not uploaded:
+            st.info("Please upload a filled template first on the 'Configure Calculator Page'.")
+            return
+        st.caption("Estimate a table of spacecraft (point designs), each with its own per-WBS masses, against the uploaded historical workbook in one run. WBS merge groups created on the Cost Analysis page are applied.")
+        job = parse_upload(uploaded)
+        if not job.done:
+            st.info("The uploaded workbook is still being read; the portfolio opens when it is ready.")
+            render_parse_progress(job.key)
+            return
+        if job.error is not None:
+            st.error(f"Could not read the uploaded workbook: {job.error}")
+            return
+        merge_items = tuple((sheet, group, tuple(members))
+                            for sheet, groups in sorted((st.session_state.get('wbs_merge_groups') or {}).items())
+                            for group, members in sorted(groups.items()))
+        rates = cached_portfolio_rates(job.key, merge_items, job.result)
+        # Step 1: portfolio table
+        st.markdown("#### 1. Portfolio Table")
+        st.write("One row per spacecraft, subsystem and WBS with columns: " + ", ".join(f"`{c}`" for c in PORTFOLIO_COLUMNS) + " (or `Mass (kg)`).")
+        template_bio = BytesIO()
+        portfolio_template(rates).to_excel(template_bio, index=False, sheet_name="Portfolio")
+        st.download_button(
+            label="Download Portfolio Template",
+            data=template_bio.getvalue(),
+            file_name="CostSpirits_Portfolio_Template.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
+        portfolio_file = st.file_uploader("Upload portfolio table", type=["xlsx", "csv"], key="portfolio_file")
+        if portfolio_file is None:
+            st.info("Upload a filled portfolio table to continue.")
+            return
+        try:
+            if portfolio_file.name.lower().endswith(".csv"):
+                config = prepare_portfolio(pd.read_csv(portfolio_file))
+            else:
+                config = prepare_portfolio(pd.read_excel(portfolio_file))
+        except ValueError as e:
+            st.error(f"Invalid portfolio table: {e}")
+            return
+        st.success(f"{config['Spacecraft'].nunique()} spacecraft, {len(config)} WBS entries.")
+        # Step 2: inflation
+        st.markdown("#### 2. Inflation Adjustment")
+        years, year_to_index = load_inflation_index()
+        base_year_index, target_year_index = inflation_year_defaults(years)
+        col1, col2 = st.columns(2)
+        base_year = col1.selectbox("Which year are the costs in your template entered for?", years, index=base_year_index, key="portfolio_base_year")
+        target_year = col2.selectbox("Which year do you want to escalate costs to?", years, index=target_year_index, key="portfolio_target_year")
+        base_index = year_to_index.get(base_year, 1)
+        inflation_factor = year_to_index.get(target_year, 1) / base_index if base_index else 1
+        # Step 3: run
+        st.markdown("#### 3. Results")
+        if st.button("Estimate Portfolio", key="run_portfolio"):
+            with profiling.stage("portfolio estimate"):
+                detail = run_portfolio(config, rates, inflation_factor)
+                comparison = comparison_table(detail, target_year)
+            # The export is built once with the results instead of on every rerun
+            with profiling.stage("portfolio export"):
+                breakdown_style = (xlsx_export.BREAKDOWN_HEADER, xlsx_export.BREAKDOWN_ALT_FILL)
+                data = xlsx_export.build_xlsx([(title, [(table, *breakdown_style)], None)
+                                               for title, table in [("Portfolio Comparison", comparison), ("Portfolio Detail", detail)]],
+                                              on_part=lambda title, cached: profiling.record_cache("export sheet", cached))
+            session_memory.put('portfolio_results', (detail, comparison, data))
+        portfolio_results = session_memory.get('portfolio_results')
+        if portfolio_results is not None:
+            detail, comparison, data = portfolio_results
+            st.markdown("**Spacecraft comparison**")
+            st.dataframe(comparison.set_index("Spacecraft"), use_container_width=True)
+            missing = detail[~detail["Has Historical Data"]][["Subsystem", "WBS"]].drop_duplicates()
+            if not missing.empty:
+                st.warning(f"{len(missing)} subsystem/WBS entries have no historical data and are estimated as zero: "
+                           + ", ".join(f"{s} / {w}" for s, w in missing.head(10).itertuples(index=False)))
+            with st.expander("Per-WBS detail", expanded=False):
+                st.dataframe(detail, hide_index=True, use_container_width=True)
+            st.download_button(
+                label="Download Portfolio Excel",
+                data=data,
+                file_name="CostSpirits_Portfolio.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            )
+def run():
+    metrics.install()
+    profiling.start_run("CostSpirits")
+    # Restored projects and inputs of widgets on other pages are set before any widget is created
+    project_snapshot.restore_inputs(st.session_state)
+    # Reruns ended early by st.rerun() or an exception are recorded too
+    try:
+        main()
+    finally:
+        # Every rerun runs on a new thread; its database connection is not reused
+        history_db.close_shared_connections()
+        project_snapshot.remember_inputs(st.session_state)
+        # Release this session's least recently used large artifacts if it is over its memory budget
+        with profiling.stage("memory budget"):
+            session_memory.enforce_budget()
+        profiling.finish_run()
+        profiling.render_panel()
+        session_memory.render_debug_panel()
+
 if __name__ == "__main__":
-    main()
+    run()
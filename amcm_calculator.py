@@ -3,6 +3,11 @@ import pandas as pd
 import numpy as np
 import math
 import os
+import json
+from datetime import datetime
+import reference_data
+import profiling
+import metrics
 
 # AMCM Model Data
 class AMCMModel:
@@ -41,23 +46,95 @@ E = 1.68051e-52
 F = -0.355322218
 G = 1.554982942
 
+class AMCMProfile:
+    """A named set of AMCM constants (A-G) and mission type specification factors"""
+    def __init__(self, name, constants, models, fit=None, created=None):
+        self.name = name
+        self.constants = dict(constants)
+        self.models = list(models)
+        self.fit = fit or {}
+        self.created = created
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "constants": self.constants,
+            "models": [{"mission_type": m.mission_type, "number": m.number, "spec": m.spec, "sd": m.sd} for m in self.models],
+            "fit": self.fit,
+            "created": self.created,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        models = [AMCMModel(m["mission_type"], m["number"], m["spec"], m["sd"]) for m in data["models"]]
+        return cls(data["name"], data["constants"], models, data.get("fit"), data.get("created"))
+
+DEFAULT_PROFILE_NAME = "Paper (default)"
+DEFAULT_PROFILE = AMCMProfile(DEFAULT_PROFILE_NAME, {"A": A, "B": B, "C": C, "D": D, "E": E, "F": F, "G": G}, AMCM_MODELS)
+
+# Calibrated profiles are stored as JSON files, one per profile
+PROFILES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'amcm_profiles')
+
+def _profile_path(name):
+    safe_name = "".join(c if c.isalnum() or c in "-_ " else "_" for c in name).strip()
+    if not safe_name:
+        raise ValueError("Profile name must contain at least one letter or digit")
+    return os.path.join(PROFILES_DIR, f"{safe_name}.json")
+
+def list_profiles():
+    """Names of all available profiles, default first"""
+    names = []
+    if os.path.isdir(PROFILES_DIR):
+        for file_name in sorted(os.listdir(PROFILES_DIR)):
+            if file_name.endswith('.json'):
+                try:
+                    with open(os.path.join(PROFILES_DIR, file_name), 'r', encoding='utf-8') as f:
+                        names.append(json.load(f)["name"])
+                except (OSError, ValueError, KeyError):
+                    continue
+    return [DEFAULT_PROFILE_NAME] + [n for n in names if n != DEFAULT_PROFILE_NAME]
+
+def load_profile(name=None):
+    """Load a saved profile by name; None or the default name returns the paper constants"""
+    if name is None or name == DEFAULT_PROFILE_NAME:
+        return DEFAULT_PROFILE
+    with open(_profile_path(name), 'r', encoding='utf-8') as f:
+        return AMCMProfile.from_dict(json.load(f))
+
+def save_profile(profile):
+    """
+    Save a profile as JSON and return the file path.
+
+    Names may only contain letters, digits, spaces, '-' and '_', so that every name has its own file;
+    a file already holding a profile of another name (e.g. differing only in case) is not overwritten.
+    """
+    if profile.name == DEFAULT_PROFILE_NAME:
+        raise ValueError(f"'{DEFAULT_PROFILE_NAME}' is reserved for the paper constants")
+    if profile.name != profile.name.strip() or not all(c.isalnum() or c in "-_ " for c in profile.name):
+        raise ValueError("Profile names may only contain letters, digits, spaces, '-' and '_' "
+                         "and must not start or end with a space")
+    path = _profile_path(profile.name)
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                existing = json.load(f).get("name")
+        except (OSError, ValueError, AttributeError):
+            existing = None
+        if existing != profile.name:
+            raise ValueError(f"The profile file {os.path.basename(path)} is already used by profile '{existing}'")
+    os.makedirs(PROFILES_DIR, exist_ok=True)
+    if profile.created is None:
+        profile.created = datetime.now().isoformat(timespec='seconds')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(profile.to_dict(), f, indent=2)
+    return path
+
 def load_inflation_data():
     """Load inflation data from Excel file"""
     try:
-        if os.path.exists('Inflation Table.xlsx'):
-            df = pd.read_excel('Inflation Table.xlsx', header=None)
-            # Get year row and index row (rows 5 and 7 as per the existing code)
-            year_row = df.iloc[5].tolist()[1:]  # Skip first column
-            index_row = df.iloc[7].tolist()[1:]  # Skip first column
-            
-            # Remove non-numeric years (e.g., 'TQ')
-            year_index_pairs = [(y, idx) for y, idx in zip(year_row, index_row) 
-                              if isinstance(y, (int, float)) and not pd.isna(y)]
-            
-            years = [int(y) for y, _ in year_index_pairs]
-            indices = [float(idx) for _, idx in year_index_pairs]
-            
-            return dict(zip(years, indices))
+        if os.path.exists(reference_data.INFLATION_TABLE_PATH):
+            # Shared process-wide parse, reloaded when the file changes
+            return reference_data.inflation_index()[1]
         else:
             # Fallback inflation data if file not found
             st.warning("Inflation Table.xlsx not found. Using fallback data.")
@@ -73,28 +150,32 @@ def load_inflation_data():
         st.error(f"Error loading inflation data: {e}")
         return {2024: 1.857, 2025: 1.906}  # Minimal fallback
 
-def calculate_amcm_cost(quantity, weight, mission_type_index, ioc_year, block_number, difficulty_index):
+@profiling.timed("calculate_amcm_cost")
+def calculate_amcm_cost(quantity, weight, mission_type_index, ioc_year, block_number, difficulty_index, profile=None):
     """
     Calculate AMCM cost using the formula from the paper.
     
     Formula: a * Q^b * W^c * d^S * e^(1/(IOC-1900)) * B^f * g^D
+    A calibrated profile replaces the paper constants and specification factors.
     """
     try:
+        profile = profile or DEFAULT_PROFILE
+        k = profile.constants
         # Get mission type specifications
-        model = AMCM_MODELS[mission_type_index]
+        model = profile.models[mission_type_index]
         S = model.spec
         
         # Difficulty adjustment (-2 to +2, where 0 is average)
         difficulty_factor = difficulty_index - 2
         
         # Calculate cost using the original formula
-        cost = (A * 
-                math.pow(quantity, B) * 
-                math.pow(weight, C) * 
-                math.pow(D, S) *  # D is the constant from above
-                math.pow(E, 1/(ioc_year - 1900)) * 
-                math.pow(block_number, F) * 
-                math.pow(G, difficulty_factor) # difficulty_factor is -2 to +2
+        cost = (k["A"] * 
+                math.pow(quantity, k["B"]) * 
+                math.pow(weight, k["C"]) * 
+                math.pow(k["D"], S) *  # D is the constant from above
+                math.pow(k["E"], 1/(ioc_year - 1900)) * 
+                math.pow(block_number, k["F"]) * 
+                math.pow(k["G"], difficulty_factor) # difficulty_factor is -2 to +2
                 )
         
         return cost
@@ -102,6 +183,27 @@ def calculate_amcm_cost(quantity, weight, mission_type_index, ioc_year, block_nu
         st.error(f"Error in cost calculation: {e}")
         return 0
 
+@profiling.timed("calculate_amcm_costs")
+def calculate_amcm_costs(quantity, weight, mission_type_index, ioc_year, block_number, difficulty_index, profile=None):
+    """
+    Vectorized AMCM cost for arrays of inputs (broadcast together), evaluated in log space.
+
+    Same formula and arguments as calculate_amcm_cost, but raises on invalid input instead of reporting to the UI.
+    """
+    profile = profile or DEFAULT_PROFILE
+    k = profile.constants
+    specs = np.array([m.spec for m in profile.models])
+    S = specs[np.asarray(mission_type_index, dtype=int)]
+    difficulty_factor = np.asarray(difficulty_index, dtype=float) - 2
+    log_cost = (math.log(k["A"])
+                + k["B"] * np.log(np.asarray(quantity, dtype=float))
+                + k["C"] * np.log(np.asarray(weight, dtype=float))
+                + S * math.log(k["D"])
+                + math.log(k["E"]) / (np.asarray(ioc_year, dtype=float) - 1900)
+                + k["F"] * np.log(np.asarray(block_number, dtype=float))
+                + difficulty_factor * math.log(k["G"]))
+    return np.exp(log_cost)
+
 def main():
     st.set_page_config(
         page_title="AMCM Calculator with Inflation Adjustment",
@@ -117,6 +219,17 @@ def main():
     The model can be used for estimating the development and production cost of spacecrafts.
     """)
     
+    # Model profile: paper constants or a calibrated profile
+    profile_names = list_profiles()
+    profile_name = st.sidebar.selectbox("Model Profile", profile_names, help="Paper constants or a profile calibrated on your own historical data")
+    try:
+        profile = load_profile(profile_name)
+    except (OSError, ValueError, KeyError) as e:
+        st.sidebar.error(f"Could not load profile '{profile_name}': {e}")
+        profile = DEFAULT_PROFILE
+    if profile.fit:
+        st.sidebar.caption(f"Calibrated on {profile.fit.get('programs')} programs, R² (log) = {profile.fit.get('r_squared_log', float('nan')):.3f}")
+    
     # Load inflation data
     inflation_data = load_inflation_data()
     available_years = sorted(inflation_data.keys())
@@ -160,7 +273,7 @@ def main():
         )
         
         # Mission type selection (space-related only)
-        mission_types = [model.mission_type for model in AMCM_MODELS]
+        mission_types = [model.mission_type for model in profile.models]
         mission_type_index = st.selectbox(
             "Mission Type",
             range(len(mission_types)),
@@ -199,7 +312,7 @@ def main():
         st.header("💰 Cost Results")
         
         # Calculate base cost (1999 dollars)
-        base_cost = calculate_amcm_cost(quantity, weight_lbs, mission_type_index, ioc_year, block_number, difficulty_index)
+        base_cost = calculate_amcm_cost(quantity, weight_lbs, mission_type_index, ioc_year, block_number, difficulty_index, profile)
         
         # Display base cost
         st.metric("Base Cost (1999 $)", f"${base_cost:.2f} million")
@@ -258,7 +371,7 @@ def main():
     
     with col3:
         st.subheader("Selected Mission Type Details")
-        selected_model = AMCM_MODELS[mission_type_index]
+        selected_model = profile.models[mission_type_index]
         model_info = {
             "Mission Type": selected_model.mission_type,
             "Number of Data Points": selected_model.number,
@@ -282,6 +395,98 @@ def main():
         for key, value in calc_params.items():
             st.write(f"**{key}:** {value}")
     
+    # Inverse mode: what fits a budget
+    st.markdown("---")
+    with st.expander("🎯 Inverse Mode: What Fits a Budget?"):
+        import amcm_inverse
+        st.markdown("Solve for one input given a budget, with the other inputs as entered above. "
+                    f"Budgets are in {target_year} $ millions and are de-escalated to {base_year} dollars with the inflation index.")
+        inputs = {"quantity": quantity, "weight": weight_lbs, "mission_type_index": mission_type_index,
+                  "ioc_year": ioc_year, "block_number": block_number, "difficulty_index": difficulty_index}
+        inv_col1, inv_col2 = st.columns(2)
+        with inv_col1:
+            solve_for = st.selectbox("Solve for", list(amcm_inverse.SOLVE_FOR), format_func=amcm_inverse.SOLVE_FOR.get, key="inverse_solve_for")
+            budget = st.number_input(f"Budget ({target_year} $ millions)", min_value=0.01, value=float(max(adjusted_cost, 0.01)), key="inverse_budget")
+        options = {}
+        with inv_col2:
+            if solve_for == "ioc_year" and st.checkbox("Budget in then-year dollars of the IOC year", key="inverse_then_year",
+                                                       help="Escalate each candidate year's cost with that year's own index instead of the target year's"):
+                options = {"year_to_index": inflation_data, "base_year": base_year}
+        kind = amcm_inverse.bound_kind(solve_for, profile)
+        fixed = {k: v for k, v in inputs.items() if k != solve_for}
+        bound = float(amcm_inverse.solve(solve_for, budget, inflation_factor, profile, **fixed, **options))
+        with inv_col2:
+            label = f"{'Maximum' if kind == 'max' else 'Minimum'} {amcm_inverse.SOLVE_FOR[solve_for]}"
+            if np.isnan(bound):
+                st.metric(label, "No feasible value")
+                st.caption("The budget does not cover the cost at any value of this input.")
+            elif solve_for == "weight":
+                st.metric(label, f"{bound:,.1f} lbs", help=f"{bound / 2.20462:,.1f} kg")
+            else:
+                st.metric(label, f"{bound:.0f}" if solve_for == "ioc_year" else f"{bound:,.0f}")
+        if kind == "min" and solve_for == "block_number":
+            st.caption("The cost falls with the block number in this profile, so the budget sets the lowest block number that fits.")
+
+        st.subheader("Feasible Region")
+        grid_cols = st.columns(4)
+        budget_from = grid_cols[0].number_input("Budget from ($M)", min_value=0.01, value=float(max(round(budget / 4, 2), 0.01)), key="inverse_grid_from")
+        budget_to = grid_cols[1].number_input("Budget to ($M)", min_value=0.01, value=float(round(budget * 4, 2)), key="inverse_grid_to")
+        budget_steps = grid_cols[2].number_input("Budget steps", min_value=2, max_value=200, value=10, key="inverse_grid_steps")
+        vary_choices = {"mission_type_index": "Mission Type", "difficulty_index": "Difficulty", "quantity": "Quantity", "block_number": "Block Number"}
+        vary_choices.pop(solve_for, None)
+        vary = grid_cols[3].selectbox("Columns", list(vary_choices), format_func=vary_choices.get, key="inverse_grid_vary")
+        if vary == "mission_type_index":
+            values, labels = list(range(len(mission_types))), mission_types
+        elif vary == "difficulty_index":
+            values, labels = list(range(len(difficulty_options))), difficulty_options
+        else:
+            values = list(range(1, 11)) if vary == "quantity" else list(range(1, 6))
+            labels = [f"{vary_choices[vary]} {v}" for v in values]
+        budgets = np.linspace(budget_from, budget_to, int(budget_steps))
+        region = amcm_inverse.feasible_region(solve_for, budgets, vary, values, inputs, inflation_factor, profile, labels, **options)
+        number_format = {"weight": "{:,.1f}", "ioc_year": "{:.0f}"}.get(solve_for, "{:,.0f}")
+        st.dataframe(region.style.format(number_format, na_rep="–"), use_container_width=True)
+        st.download_button("Download Feasible Region (CSV)", region.to_csv().encode("utf-8"),
+                           file_name=f"amcm_feasible_{solve_for}.csv", mime="text/csv", key="inverse_grid_download")
+
+    # Calibration section
+    st.markdown("---")
+    with st.expander("🧮 Calibrate Model Constants on Historical Data"):
+        from amcm_calibration import CALIBRATION_COLUMNS, calibrate_amcm, compare_profiles
+        st.markdown(
+            "Upload a CSV or Excel file with one row per historical program and the columns: "
+            + ", ".join(f"`{c}`" for c in CALIBRATION_COLUMNS.values())
+            + ". Difficulty may be a label (Very Low ... Very High) or a factor from -2 to +2."
+        )
+        calibration_file = st.file_uploader("Historical programs", type=["csv", "xlsx"], key="calibration_file")
+        new_profile_name = st.text_input("Profile name", value="Calibrated", key="calibration_profile_name",
+                                         help="Letters, digits, spaces, - and _")
+        if calibration_file is not None and st.button("Run Calibration", key="run_calibration"):
+            try:
+                if calibration_file.name.lower().endswith(".csv"):
+                    history_df = pd.read_csv(calibration_file)
+                else:
+                    history_df = pd.read_excel(calibration_file)
+                st.session_state["calibrated_profile"] = calibrate_amcm(history_df, new_profile_name, profile)
+            except ValueError as e:
+                st.error(f"Calibration failed: {e}")
+        if "calibrated_profile" in st.session_state:
+            calibrated, fit = st.session_state["calibrated_profile"]
+            fit_cols = st.columns(4)
+            fit_cols[0].metric("Programs", fit["programs"], help=f"{fit['dropped_rows']} rows dropped (missing or non-positive values)")
+            fit_cols[1].metric("R² (log cost)", f"{fit['r_squared_log']:.3f}")
+            fit_cols[2].metric("Std. error (log)", f"{fit['standard_error_log']:.4f}")
+            fit_cols[3].metric("MAPE", f"{fit['mape_pct']:.1f}%")
+            if fit["fixed_constants"]:
+                st.caption(f"Kept from '{profile.name}' (no variation in the data): {', '.join(fit['fixed_constants'])}")
+            st.dataframe(compare_profiles(profile, calibrated), use_container_width=True, hide_index=True)
+            if st.button(f"Save profile '{calibrated.name}'", key="save_calibration"):
+                try:
+                    path = save_profile(calibrated)
+                    st.success(f"Profile saved to {path}. Select it under 'Model Profile' in the sidebar.")
+                except ValueError as e:
+                    st.error(str(e))
+    
     # Definitions section
     st.markdown("---")
     with st.expander("📖 Definitions and Help"):
@@ -330,5 +535,15 @@ def main():
     </div>
     """, unsafe_allow_html=True)
 
+def run():
+    metrics.install()
+    profiling.start_run("AMCM Calculator")
+    # Reruns ended early by st.rerun() or an exception are recorded too
+    try:
+        main()
+    finally:
+        profiling.finish_run()
+        profiling.render_panel()
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run()
\ No newline at end of file
@@ -0,0 +1,164 @@
+import math
+import numpy as np
+import pandas as pd
+from amcm_calculator import AMCMModel, AMCMProfile, DEFAULT_PROFILE
+
+# Calibration of the AMCM constants against a historical database
+# Taking logs of Cost = A * Q^B * W^C * D^S * E^(1/(IOC-1900)) * Block^F * G^Diff gives a linear model:
+#   ln Cost = [ln A + S_m ln D] + B ln Q + C ln W + ln E / (IOC-1900) + F ln Block + Diff ln G
+# The bracketed term is one intercept per mission type m, so the whole model is fitted with a single
+# least-squares solve over mission type dummies. ln A and ln D are then recovered by regressing the
+# intercepts on the base profile's specification factors, and S_m = (intercept_m - ln A) / ln D.
+
+# Expected columns of the historical dataset
+CALIBRATION_COLUMNS = {
+    "quantity": "Quantity",
+    "weight": "Dry Weight (lbs)",
+    "mission_type": "Mission Type",
+    "ioc_year": "IOC Year",
+    "block_number": "Block Number",
+    "difficulty": "Difficulty",
+    "cost": "Cost (1999 $M)",
+}
+
+DIFFICULTY_LEVELS = {"Very Low": -2, "Low": -1, "Average": 0, "High": 1, "Very High": 2}
+
+# Slope terms: (dataset column key, constant name, transform of the raw values)
+_SLOPE_TERMS = [
+    ("quantity", "B", np.log),
+    ("weight", "C", np.log),
+    ("ioc_year", "E", lambda v: 1.0 / (v - 1900)),
+    ("block_number", "F", np.log),
+    ("difficulty", "G", lambda v: v),
+]
+# Constants whose slope is fitted directly are stored as exponents, the rest as bases of a power
+_EXPONENT_CONSTANTS = {"B", "C", "F"}
+
+
+def _difficulty_values(series):
+    # Accept labels ("High") or difficulty factors (-2 to +2)
+    numeric = pd.to_numeric(series, errors='coerce')
+    labels = series.astype(str).str.strip().map(DIFFICULTY_LEVELS)
+    values = numeric.fillna(labels)
+    if values.isna().any():
+        bad = series[values.isna()].unique()[:5]
+        raise ValueError(f"Unrecognized difficulty values: {list(bad)}")
+    return values.to_numpy(dtype=float)
+
+
+def prepare_calibration_data(df):
+    """Validate a historical dataset and return its columns as arrays plus the number of dropped rows"""
+    missing = [col for col in CALIBRATION_COLUMNS.values() if col not in df.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    data = {}
+    for key, col in CALIBRATION_COLUMNS.items():
+        if key == "mission_type":
+            data[key] = df[col].astype(str).str.strip().to_numpy()
+        elif key == "difficulty":
+            data[key] = _difficulty_values(df[col])
+        else:
+            data[key] = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float)
+    valid = np.ones(len(df), dtype=bool)
+    for key in ("quantity", "weight", "block_number", "cost"):
+        valid &= np.isfinite(data[key]) & (data[key] > 0)
+    valid &= np.isfinite(data["ioc_year"]) & (data["ioc_year"] > 1900)
+    dropped = int((~valid).sum())
+    data = {key: values[valid] for key, values in data.items()}
+    if len(data["cost"]) == 0:
+        raise ValueError("No valid rows to calibrate on")
+    return data, dropped
+
+
+def calibrate_amcm(df, name, base_profile=None):
+    """
+    Refit the AMCM constants and per-mission-type specification factors on a historical dataset.
+
+    Terms whose input does not vary in the dataset (e.g. every program has block number 1) cannot be
+    identified and keep the base profile's value. Mission types not present in the base profile are
+    added as new types. Returns the calibrated AMCMProfile and a dict of goodness-of-fit statistics.
+    """
+    base_profile = base_profile or DEFAULT_PROFILE
+    base = base_profile.constants
+    data, dropped = prepare_calibration_data(df)
+    n = len(data["cost"])
+    y = np.log(data["cost"])
+
+    # Split slope terms into fitted and fixed (no variation in the data)
+    fitted_terms, offset = [], np.zeros(n)
+    for key, const, transform in _SLOPE_TERMS:
+        x = transform(data[key])
+        base_slope = base[const] if const in _EXPONENT_CONSTANTS else math.log(base[const])
+        if np.ptp(x) > 0:
+            fitted_terms.append((const, x))
+        else:
+            offset += base_slope * x
+    # Mission type dummies carry the per-type intercepts
+    type_names, type_codes = np.unique(data["mission_type"], return_inverse=True)
+    dummies = np.zeros((n, len(type_names)))
+    dummies[np.arange(n), type_codes] = 1.0
+    X = np.column_stack([x for _, x in fitted_terms] + [dummies])
+    coef, _, rank, _ = np.linalg.lstsq(X, y - offset, rcond=None)
+    if rank < X.shape[1]:
+        raise ValueError("Dataset is rank deficient: inputs are collinear, add more varied programs")
+
+    constants = dict(base)
+    for (const, _), value in zip(fitted_terms, coef):
+        constants[const] = float(value) if const in _EXPONENT_CONSTANTS else float(math.exp(value))
+    intercepts = coef[len(fitted_terms):]
+
+    # Recover ln A and ln D from the intercepts of mission types known to the base profile
+    base_specs = {m.mission_type: m.spec for m in base_profile.models}
+    known = np.array([t in base_specs for t in type_names])
+    counts = np.bincount(type_codes, minlength=len(type_names)).astype(float)
+    known_specs = np.array([base_specs[t] for t in type_names[known]])
+    if known.sum() >= 2 and np.ptp(known_specs) > 0:
+        slope, ln_a = np.polyfit(known_specs, intercepts[known], 1, w=np.sqrt(counts[known]))
+        if slope <= 0:
+            slope = math.log(base["D"])
+            ln_a = np.average(intercepts[known] - slope * known_specs, weights=counts[known])
+    else:
+        # Not enough distinct specification factors: keep D and absorb the level into A
+        slope = math.log(base["D"])
+        if known.any():
+            ln_a = np.average(intercepts[known] - slope * known_specs, weights=counts[known])
+        else:
+            ln_a = math.log(base["A"])
+    constants["A"] = float(math.exp(ln_a))
+    constants["D"] = float(math.exp(slope))
+    fitted_specs = (intercepts - ln_a) / slope
+
+    # Goodness of fit on the log scale and on the cost scale
+    residuals = (y - offset) - X @ coef
+    ss_res = float(residuals @ residuals)
+    ss_tot = float(((y - y.mean()) ** 2).sum())
+    dof = max(n - X.shape[1], 1)
+    type_sd = np.sqrt(np.bincount(type_codes, weights=residuals ** 2, minlength=len(type_names)) / np.maximum(counts - 1, 1))
+    predicted = np.exp(y - residuals)
+    fit = {
+        "programs": n,
+        "dropped_rows": dropped,
+        "parameters": int(X.shape[1]),
+        "r_squared_log": 1 - ss_res / ss_tot if ss_tot > 0 else float('nan'),
+        "rmse_log": math.sqrt(ss_res / n),
+        "standard_error_log": math.sqrt(ss_res / dof),
+        "mape_pct": float(np.mean(np.abs(predicted / data["cost"] - 1)) * 100),
+        "fixed_constants": sorted(set(base) - {c for c, _ in fitted_terms} - {"A", "D"}),
+    }
+
+    # Mission types in the data are refitted; the others keep their base specification factor on the new scale
+    fitted_models = {t: AMCMModel(t, int(counts[i]), float(fitted_specs[i]), float(type_sd[i]) if counts[i] > 1 else 0.0)
+                     for i, t in enumerate(type_names)}
+    models = [fitted_models.pop(m.mission_type, m) for m in base_profile.models]
+    models += [fitted_models[t] for t in sorted(fitted_models)]
+    return AMCMProfile(name, constants, models, fit), fit
+
+
+def compare_profiles(base_profile, calibrated_profile):
+    """Side-by-side table of constants and specification factors"""
+    rows = [{"Parameter": k, base_profile.name: base_profile.constants[k], calibrated_profile.name: calibrated_profile.constants[k]}
+            for k in "ABCDEFG"]
+    base_specs = {m.mission_type: m.spec for m in base_profile.models}
+    for m in calibrated_profile.models:
+        rows.append({"Parameter": f"S: {m.mission_type}", base_profile.name: base_specs.get(m.mission_type), calibrated_profile.name: m.spec})
+    return pd.DataFrame(rows)
@@ -0,0 +1,139 @@
+import math
+import numpy as np
+import pandas as pd
+from amcm_calculator import DEFAULT_PROFILE
+
+# Inverse AMCM: the largest (or smallest) value of one input whose cost fits a budget
+# The model is log-linear in quantity, weight and block number:
+#   ln Cost = ln A + B ln Q + C ln W + S ln D + ln E / (IOC-1900) + F ln Block + Diff ln G
+# so with the other inputs fixed, Cost <= Budget solves in closed form as x^k <= Budget / rest, where k is
+# the input's exponent: x <= (Budget / rest)^(1/k) when k > 0 (a maximum) and x >= ... when k < 0 (a
+# minimum, e.g. block number with the paper's F < 0). Quantity and block number are rounded to whole
+# units on the feasible side. The IOC year is solved by evaluating every candidate year at once, since
+# with a then-year budget the inflation index of the IOC year itself enters the cost.
+# Budgets are in target-year $ millions and are de-escalated to base-year dollars with the inflation
+# index before solving. All arguments broadcast together, so a grid of budgets solves in one call.
+
+SOLVE_FOR = {
+    "weight": "Dry Weight (lbs)",
+    "quantity": "Quantity",
+    "block_number": "Block Number",
+    "ioc_year": "IOC Year",
+}
+# Exponent constant of each closed-form input
+_EXPONENTS = {"quantity": "B", "weight": "C", "block_number": "F"}
+_WHOLE_UNITS = {"quantity", "block_number"}
+# Candidate IOC years (the calculator's input range)
+IOC_YEARS = np.arange(1901, 2101)
+# Tolerance of the whole-unit rounding against floating point error
+_ROUND_EPS = 1e-9
+
+
+def deescalate(budget, inflation_factor):
+    """Base-year value of target-year budgets (inflation_factor = target index / base index)"""
+    return np.asarray(budget, dtype=float) / inflation_factor
+
+
+def _log_terms(profile, quantity=None, weight=None, mission_type_index=0, ioc_year=None, block_number=None, difficulty_index=2):
+    # ln Cost without the terms of the inputs passed as None
+    k = profile.constants
+    specs = np.array([m.spec for m in profile.models])
+    log_cost = (math.log(k["A"])
+                + specs[np.asarray(mission_type_index, dtype=int)] * math.log(k["D"])
+                + (np.asarray(difficulty_index, dtype=float) - 2) * math.log(k["G"]))
+    if quantity is not None:
+        log_cost = log_cost + k["B"] * np.log(np.asarray(quantity, dtype=float))
+    if weight is not None:
+        log_cost = log_cost + k["C"] * np.log(np.asarray(weight, dtype=float))
+    if ioc_year is not None:
+        log_cost = log_cost + math.log(k["E"]) / (np.asarray(ioc_year, dtype=float) - 1900)
+    if block_number is not None:
+        log_cost = log_cost + k["F"] * np.log(np.asarray(block_number, dtype=float))
+    return log_cost
+
+
+def bound_kind(solve_for, profile=None):
+    """'max' if the cost grows with the input (the budget caps it), 'min' if it falls with it"""
+    k = (profile or DEFAULT_PROFILE).constants
+    if solve_for == "ioc_year":
+        return "max" if math.log(k["E"]) < 0 else "min"
+    return "max" if k[_EXPONENTS[solve_for]] > 0 else "min"
+
+
+def solve_closed_form(solve_for, budget, inflation_factor=1.0, profile=None, **inputs):
+    """
+    Bound on weight (lbs), quantity or block number such that the cost fits the budget.
+
+    budget: target-year $ millions (scalar or array); inputs: the other calculate_amcm_costs
+    arguments, broadcast together with the budget. Returns an array of bounds (see bound_kind);
+    NaN where no value fits (e.g. a budget below the cost of a single unit).
+    """
+    profile = profile or DEFAULT_PROFILE
+    exponent = profile.constants[_EXPONENTS[solve_for]]
+    if exponent == 0:
+        raise ValueError(f"The cost does not depend on {SOLVE_FOR[solve_for]} in profile '{profile.name}'")
+    inputs = {**inputs, solve_for: None}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rhs = np.log(deescalate(budget, inflation_factor)) - _log_terms(profile, **inputs)
+        bound = np.exp(rhs / exponent)
+    if solve_for not in _WHOLE_UNITS:
+        return np.where(bound > 0, bound, np.nan)
+    if exponent > 0:
+        # Largest whole number not above the bound, at least one unit
+        bound = np.floor(bound + _ROUND_EPS)
+        return np.where(bound >= 1, bound, np.nan)
+    # Smallest whole number not below the bound; block 1 when every block fits
+    return np.maximum(np.ceil(bound - _ROUND_EPS), 1.0)
+
+
+def solve_ioc_year(budget, inflation_factor=1.0, profile=None, year_to_index=None, base_year=None, **inputs):
+    """
+    Latest (see bound_kind) IOC year whose cost fits the budget, NaN where no year fits.
+
+    With year_to_index and base_year the budget is in then-year dollars of the IOC year itself: each
+    candidate year's cost is escalated from base_year with its own index (years outside the table use
+    the closest year's index) and inflation_factor is ignored.
+    """
+    profile = profile or DEFAULT_PROFILE
+    rest = _log_terms(profile, **{**inputs, "ioc_year": None})
+    budget = np.asarray(budget, dtype=float)
+    shape = np.broadcast_shapes(budget.shape, np.shape(rest))
+    # Candidate years along a trailing axis
+    log_cost = np.broadcast_to(rest, shape)[..., None] + math.log(profile.constants["E"]) / (IOC_YEARS - 1900)
+    if year_to_index is not None and base_year is not None:
+        years = np.array(sorted(year_to_index), dtype=float)
+        indexes = np.array([year_to_index[y] for y in sorted(year_to_index)], dtype=float)
+        log_cost = log_cost + np.log(np.interp(IOC_YEARS, years, indexes) / year_to_index[base_year])
+    else:
+        log_cost = log_cost + math.log(inflation_factor)
+    with np.errstate(divide="ignore"):
+        fits = log_cost <= np.log(np.broadcast_to(budget, shape))[..., None]
+    if bound_kind("ioc_year", profile) == "max":
+        bound = np.where(fits, IOC_YEARS, -1).max(axis=-1)
+    else:
+        bound = np.where(fits, IOC_YEARS, IOC_YEARS[-1] + 1).min(axis=-1)
+    return np.where(fits.any(axis=-1), bound, np.nan)
+
+
+def solve(solve_for, budget, inflation_factor=1.0, profile=None, **inputs):
+    """Bound on one input (a SOLVE_FOR key) for the budget; see solve_closed_form and solve_ioc_year"""
+    if solve_for == "ioc_year":
+        return solve_ioc_year(budget, inflation_factor, profile, **inputs)
+    if solve_for not in _EXPONENTS:
+        raise ValueError(f"Cannot solve for '{solve_for}', expected one of {', '.join(SOLVE_FOR)}")
+    return solve_closed_form(solve_for, budget, inflation_factor, profile, **inputs)
+
+
+def feasible_region(solve_for, budgets, vary, values, inputs, inflation_factor=1.0, profile=None, labels=None, **options):
+    """
+    Table of the bound on `solve_for` for every budget (rows) and every value of the input `vary` (columns).
+
+    inputs: the fixed inputs (those other than solve_for); the budgets x values grid is solved in one
+    broadcast call. labels name the columns (default: the values).
+    """
+    grid_inputs = {**{k: v for k, v in inputs.items() if k != solve_for},
+                   vary: np.asarray(values)[None, :]}
+    bounds = solve(solve_for, np.asarray(budgets, dtype=float)[:, None], inflation_factor, profile, **grid_inputs, **options)
+    return pd.DataFrame(np.broadcast_to(bounds, (len(budgets), len(values))),
+                        index=pd.Index(budgets, name="Budget ($M)"),
+                        columns=list(labels) if labels is not None else list(values))
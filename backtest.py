@@ -0,0 +1,113 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from cost_engine import (DD_COST_COL, FLIGHT_UNIT_COST_COL, WEIGHT_COL, find_mission_column, find_wbs_column,
+                         group_sums, numeric_columns)
+
+# Leave-one-mission-out backtest of the Cost Analysis cost-per-pound estimate
+# For every mission and WBS the estimate is rebuilt from all other missions:
+#   estimate = (avg D&D + avg flight unit cost) / avg weight * mission weight
+# The leave-one-out averages come from per-WBS totals minus the mission's own sums and counts,
+# so each held-out estimate is O(1) instead of a re-aggregation.
+
+BACKTEST_COLS = [WEIGHT_COL, DD_COST_COL, FLIGHT_UNIT_COST_COL]
+# Sheets with fewer rows than this are backtested in-process (not worth a worker process)
+PARALLEL_MIN_ROWS = 20000
+
+
+def backtest_sheet(sheet, df):
+    """Held-out estimates for every (mission, WBS) of one sheet with complete weight and cost data"""
+    wbs_col = find_wbs_column(df)
+    mission_col = find_mission_column(df)
+    if wbs_col is None or mission_col is None:
+        return pd.DataFrame()
+    values = numeric_columns(df, BACKTEST_COLS)
+    keys = [df[mission_col].rename("Mission"), df[wbs_col].rename("WBS")]
+    sums, counts, rows = group_sums(values, keys)
+    # Only mission/WBS groups whose rows all have weight and both costs can be compared
+    complete = (counts[BACKTEST_COLS].to_numpy() == rows.to_numpy()[:, None]).all(axis=1)
+    # Per-WBS totals broadcast back to each (mission, WBS) group
+    wbs_level = sums.index.get_level_values("WBS")
+    total_sums = sums.groupby(level="WBS", sort=False, observed=True).transform("sum")
+    total_counts = counts.groupby(level="WBS", sort=False, observed=True).transform("sum")
+    loo_counts = (total_counts - counts).to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        loo_means = np.where(loo_counts > 0, (total_sums - sums).to_numpy() / loo_counts, np.nan)
+    avg_weight, avg_dd, avg_fu = loo_means.T
+    mission_weight = sums[WEIGHT_COL].to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        est_dd = avg_dd / avg_weight * mission_weight
+        est_fu = avg_fu / avg_weight * mission_weight
+    actual_dd = sums[DD_COST_COL].to_numpy()
+    actual_fu = sums[FLIGHT_UNIT_COST_COL].to_numpy()
+    result = pd.DataFrame({
+        "Sheet": sheet,
+        # Plain labels (the keys of compact sheets are categoricals)
+        "Mission": np.asarray(sums.index.get_level_values("Mission")),
+        "WBS": np.asarray(wbs_level),
+        "Other Missions Rows": (total_counts[WEIGHT_COL] - counts[WEIGHT_COL]).to_numpy(),
+        "Mission Weight (lbs)": mission_weight,
+        "Actual D&D Cost": actual_dd,
+        "Est. D&D Cost": est_dd,
+        "Actual Flight Unit Cost": actual_fu,
+        "Est. Flight Unit Cost": est_fu,
+        "Actual Total Cost": actual_dd + actual_fu,
+        "Est. Total Cost": est_dd + est_fu,
+    })
+    result["Error %"] = (result["Est. Total Cost"] / result["Actual Total Cost"] - 1) * 100
+    keep = complete & np.isfinite(result["Error %"].to_numpy()) & (result["Actual Total Cost"].to_numpy() > 0)
+    return result[keep].reset_index(drop=True)
+
+
+def _backtest_sheet_task(args):
+    return backtest_sheet(*args)
+
+
+def run_backtest(sheets, max_workers=None):
+    """
+    Backtest every sheet of a workbook ({sheet name: DataFrame}) and return all held-out estimates.
+
+    Large sheets are fanned out across worker processes; only the columns the backtest needs are sent.
+    """
+    tasks = []
+    for sheet, df in sheets.items():
+        wbs_col = find_wbs_column(df)
+        mission_col = find_mission_column(df)
+        if wbs_col is None or mission_col is None:
+            continue
+        cols = list(dict.fromkeys([mission_col, wbs_col] + [c for c in BACKTEST_COLS if c in df.columns]))
+        tasks.append((sheet, df[cols]))
+    total_rows = sum(len(df) for _, df in tasks)
+    workers = min(max_workers or os.cpu_count() or 1, len(tasks))
+    if workers > 1 and total_rows >= PARALLEL_MIN_ROWS:
+        # Spawned, not forked, from the multi-threaded Streamlit server (see xlsx_export._render_pool)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            frames = list(pool.map(_backtest_sheet_task, tasks))
+    else:
+        frames = [backtest_sheet(sheet, df) for sheet, df in tasks]
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+
+def error_metrics(records, by):
+    """MAPE, bias and error percentiles of held-out total cost estimates, grouped by the given columns"""
+    if records.empty:
+        return pd.DataFrame()
+    abs_errors = records["Error %"].abs()
+    errors = records.assign(**{"Abs Error %": abs_errors, "Within 30 %": (abs_errors <= 30) * 100.0})
+    grouped = errors.groupby(by, sort=True)
+    metrics = pd.DataFrame({
+        "Estimates": grouped.size(),
+        "MAPE %": grouped["Abs Error %"].mean(),
+        "Bias %": grouped["Error %"].mean(),
+        "Median APE %": grouped["Abs Error %"].median(),
+        "P10 Error %": grouped["Error %"].quantile(0.10),
+        "P50 Error %": grouped["Error %"].quantile(0.50),
+        "P90 Error %": grouped["Error %"].quantile(0.90),
+        "Within 30 %": grouped["Within 30 %"].mean(),
+    })
+    return metrics.reset_index()
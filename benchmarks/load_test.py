@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Concurrent-session load test of the Streamlit apps
+
+Drives CostSpirits.py and amcm_calculator.py headlessly with Streamlit's testing API (AppTest):
+every simulated session replays a realistic script (CostSpirits: upload a workbook on the Configure
+page, open Cost Analysis, deselect a WBS, enter masses, export to Excel; AMCM: change the inputs one
+by one). Two modes:
+
+- shared (default): all sessions are threads of one process, like the sessions of one server, so
+  they share the module-level and st.cache_* caches and one process's memory. AppTest swaps process
+  globals (runtime instance, config) for every run, so the reruns are serialized by a lock: latency
+  is the rerun itself, the time spent waiting for other sessions' reruns is reported separately as
+  queue wait, and throughput is bounded by one rerun at a time.
+- processes: every session runs in its own process, so reruns overlap and compete for the CPUs,
+  but each session warms its own caches; cache sharing and contention between sessions is not
+  measured.
+
+For each session count it reports p50/p90/p99 rerun latency, throughput and peak RSS above the
+baseline of an idle process that has imported the test harness (summed over the session processes
+in processes mode), and writes the results as JSON together with the limitations of the mode. A
+real `streamlit run` server would be needed to measure concurrent reruns with shared caches. Runs
+fully offline.
+
+    python benchmarks/load_test.py --sessions 1,5,10,25
+    python benchmarks/load_test.py --app amcm --sessions 10 --iterations 5 --mode processes
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+from io import BytesIO
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, APP_DIR)
+import streamlit.logger
+# Headless sessions have no browser connection; keep Streamlit's warnings about that quiet
+streamlit.logger.set_log_level("error")
+from streamlit.testing.v1 import AppTest
+import metrics
+from run_benchmarks import RESULTS_DIR, environment
+from synthetic_workbook import generate_workbook, workbook_bytes
+
+APPS = {"costspirits": "CostSpirits.py", "amcm": "amcm_calculator.py"}
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+# Seconds a single rerun may take before AppTest gives up
+RERUN_TIMEOUT = 600
+# Polls of the background upload parse before a session gives up waiting
+PARSE_POLLS = 600
+PARSE_POLL_SECONDS = 0.5
+# How often the peak RSS sampler polls the process
+RSS_SAMPLE_SECONDS = 0.05
+MODES = ["shared", "processes"]
+# What each mode cannot measure; written to the results with every run
+LIMITATIONS = {
+    "shared": "Sessions share one process and its caches, but AppTest reruns are serialized by a lock: "
+              "reruns never overlap, latency excludes the queue wait (reported separately) and throughput "
+              "is bounded by a single rerun at a time. Caches warmed by earlier session counts are kept.",
+    "processes": "Every session runs in its own process and warms its own module-level and st.cache_* caches: "
+                 "shared-cache contention and the memory saved by sharing are not measured. RSS is reported "
+                 "above an idle-process baseline, summed over the session processes.",
+}
+
+
+def costspirits_script(at, workbook, rng):
+    """(step, action) pairs of a Cost Analysis session; actions run one rerun each"""
+    yield "open", at.run
+    yield "confirm filled sheet", lambda: at.button(key="modal_yes").click().run()
+    # The workbook uploader by key (the page also has an uploader for project files)
+    uploaders = [u for u in getattr(at, "file_uploader", []) if u.key == "history_upload"]
+    if uploaders and hasattr(uploaders[0], "set_value"):
+        yield "upload", lambda: uploaders[0].set_value(("history.xlsx", workbook, XLSX_MIME)).run()
+    else:
+        # Streamlit versions whose testing API cannot upload files: hand the workbook to the session directly
+        at.session_state["uploaded_file"] = BytesIO(workbook)
+    # The workbook is parsed in the background; the browser polls the progress (AppTest does not run
+    # fragments on their own, so the session reruns instead)
+    for _ in range(PARSE_POLLS):
+        if not at.get("progress"):
+            break
+        time.sleep(PARSE_POLL_SECONDS)
+        yield "parse progress", at.run
+    yield "cost analysis", lambda: at.sidebar.radio[0].set_value("Cost Analysis").run()
+    wbs_boxes = [c for c in at.checkbox if c.key and "_wbs_" in c.key]
+    if len(wbs_boxes) > 1:
+        sheet = wbs_boxes[0].key.split("_wbs_")[0]
+        last = [c for c in wbs_boxes if c.key.startswith(sheet + "_wbs_")][-1]
+        yield "select wbs", lambda: last.uncheck().run()
+    mass_inputs = [n for n in at.number_input if n.key and n.key.startswith(("mass_", "total_mass_"))]
+    for mass_input in mass_inputs[:3]:
+        value = float(rng.uniform(10, 500))
+        yield "enter mass", lambda m=mass_input, v=value: m.set_value(v).run()
+    yield "export", lambda: at.button(key="export_to_excel").click().run()
+
+
+def amcm_script(at, workbook, rng):
+    """(step, action) pairs of an AMCM calculator session"""
+    yield "open", at.run
+
+    def number(label):
+        return next(n for n in at.number_input if n.label.startswith(label))
+
+    def select(label):
+        return next(s for s in at.selectbox if s.label == label)
+
+    yield "weight", lambda: number("Dry Weight").set_value(float(rng.uniform(100, 20000))).run()
+    yield "quantity", lambda: number("Quantity").set_value(int(rng.integers(1, 20))).run()
+    yield "mission type", lambda: select("Mission Type").set_value(int(rng.integers(0, 16))).run()
+    yield "difficulty", lambda: select("Difficulty").set_value(int(rng.integers(0, 5))).run()
+
+
+SCRIPTS = {"costspirits": costspirits_script, "amcm": amcm_script}
+
+
+def run_session(app, workbook, iterations, seed, start, rerun_lock=None):
+    """
+    One simulated user: replay the app's script `iterations` times in fresh sessions.
+
+    rerun_lock serializes the reruns of sessions sharing a process. Returns (samples, errors); a
+    sample is (app, step, rerun seconds, seconds waited for the lock).
+    """
+    rng = np.random.default_rng(seed)
+    samples, errors = [], []
+    start.wait()
+    for _ in range(iterations):
+        at = AppTest.from_file(os.path.join(APP_DIR, APPS[app]), default_timeout=RERUN_TIMEOUT)
+        try:
+            for step, action in SCRIPTS[app](at, workbook, rng):
+                queued = time.perf_counter()
+                with rerun_lock or contextlib.nullcontext():
+                    t0 = time.perf_counter()
+                    action()
+                    samples.append((app, step, time.perf_counter() - t0, t0 - queued))
+                if at.exception:
+                    errors.append(f"{app}/{step}: {at.exception[0].message}")
+        except Exception as e:
+            # A widget missing or a timeout ends this session's script; the load keeps running
+            errors.append(f"{app}: {type(e).__name__}: {e}")
+    return samples, errors
+
+
+def session_process(app, workbook, iterations, seed, start, results):
+    """
+    run_session in its own process (processes mode).
+
+    Puts (samples, errors, idle baseline RSS bytes, peak RSS bytes) on the results queue.
+    """
+    # The harness is imported (and the workbook received) when the process starts
+    baseline = metrics.process_rss_bytes()
+    sampler = RssSampler()
+    sampler.start()
+    samples, errors = run_session(app, workbook, iterations, seed, start)
+    sampler.stopped.set()
+    sampler.join()
+    results.put((samples, errors, baseline, max(sampler.peak, metrics.process_rss_bytes())))
+
+
+class RssSampler(threading.Thread):
+    """Background thread recording the peak resident memory of the process"""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak = metrics.process_rss_bytes()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(RSS_SAMPLE_SECONDS):
+            self.peak = max(self.peak, metrics.process_rss_bytes())
+
+
+def latency_summary(latencies):
+    values = np.asarray(latencies)
+    return {
+        "reruns": len(values),
+        "p50_s": float(np.percentile(values, 50)),
+        "p90_s": float(np.percentile(values, 90)),
+        "p99_s": float(np.percentile(values, 99)),
+        "max_s": float(values.max()),
+    }
+
+
+def run_shared(sessions, apps, workbook, iterations, seed):
+    """Run `sessions` concurrent sessions as threads of this process; returns (samples, errors, peak RSS bytes, seconds)"""
+    start = threading.Barrier(sessions + 1)
+    rerun_lock = threading.Lock()
+    outcomes = [None] * sessions
+
+    def session(i):
+        outcomes[i] = run_session(apps[i % len(apps)], workbook, iterations, seed + i, start, rerun_lock)
+
+    threads = [threading.Thread(target=session, args=(i,), daemon=True) for i in range(sessions)]
+    sampler = RssSampler()
+    sampler.start()
+    for thread in threads:
+        thread.start()
+    start.wait()
+    t0 = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - t0
+    sampler.stopped.set()
+    sampler.join()
+    samples, errors = [], []
+    for outcome in outcomes:
+        if outcome is None:
+            errors.append("a session thread exited without results")
+            continue
+        samples += outcome[0]
+        errors += outcome[1]
+    return samples, errors, max(sampler.peak, metrics.process_rss_bytes()), elapsed
+
+
+def run_processes(sessions, apps, workbook, iterations, seed):
+    """Run `sessions` concurrent session processes; returns (samples, errors, [(baseline, peak RSS bytes)], seconds)"""
+    # Spawned, not forked: the parent may already hold Streamlit and pandas state and threads
+    ctx = multiprocessing.get_context("spawn")
+    start = ctx.Barrier(sessions + 1)
+    results = ctx.Queue()
+    processes = [ctx.Process(target=session_process, args=(apps[i % len(apps)], workbook, iterations, seed + i, start, results))
+                 for i in range(sessions)]
+    for process in processes:
+        process.start()
+    # The sessions start together once every process has imported the apps
+    start.wait()
+    t0 = time.perf_counter()
+    samples, errors, rss = [], [], []
+    while len(rss) < sessions:
+        try:
+            session_samples, session_errors, baseline, peak = results.get(timeout=1)
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                errors.append(f"{sessions - len(rss)} session process(es) exited without results")
+                break
+            continue
+        samples += session_samples
+        errors += session_errors
+        rss.append((baseline, peak))
+    elapsed = time.perf_counter() - t0
+    for process in processes:
+        process.join()
+    return samples, errors, rss, elapsed
+
+
+def run_level(mode, sessions, apps, workbook, iterations, seed, baseline):
+    """
+    Run `sessions` concurrent sessions (apps assigned round-robin) and summarize them.
+
+    baseline: RSS bytes of this process when idle after import (shared mode).
+    """
+    if mode == "shared":
+        samples, errors, peak, elapsed = run_shared(sessions, apps, workbook, iterations, seed)
+        above = max(peak - baseline, 0)
+        rss = {"baseline_rss_mb": baseline / 1e6, "peak_rss_mb": peak / 1e6, "session_rss_mb_total": above / 1e6,
+               "session_rss_mb_per_session": above / sessions / 1e6}
+    else:
+        samples, errors, peaks, elapsed = run_processes(sessions, apps, workbook, iterations, seed)
+        above = [max(peak - idle, 0) for idle, peak in peaks]
+        rss = {"baseline_rss_mb": float(np.mean([idle for idle, _ in peaks])) / 1e6 if peaks else 0.0,
+               "peak_rss_mb": max((peak for _, peak in peaks), default=0) / 1e6,
+               "session_rss_mb_total": sum(above) / 1e6,
+               "session_rss_mb_per_session": max(above, default=0) / 1e6}
+    level = {"sessions": sessions, "elapsed_s": elapsed, "errors": len(errors), "error_examples": errors[:5], **rss}
+    if samples:
+        level.update(latency_summary([s[2] for s in samples]))
+        level["reruns_per_s"] = len(samples) / elapsed
+        if mode == "shared":
+            level["queue_wait"] = latency_summary([s[3] for s in samples])
+        level["per_step"] = {f"{app}/{step}": latency_summary([s[2] for s in samples if s[:2] == (app, step)])
+                             for app, step in dict.fromkeys(s[:2] for s in samples)}
+    return level
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-session load test of the CostSpirits Streamlit apps")
+    parser.add_argument("--sessions", default="1,5,10,25", help="comma separated concurrent session counts")
+    parser.add_argument("--app", choices=["costspirits", "amcm", "both"], default="both")
+    parser.add_argument("--iterations", type=int, default=2, help="times each session replays its script")
+    parser.add_argument("--rows", type=int, default=5000, help="rows of the synthetic workbook uploaded by CostSpirits sessions")
+    parser.add_argument("--sheets", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mode", choices=MODES, default="shared",
+                        help="shared: sessions as threads of one process (shared caches, serialized reruns); "
+                             "processes: one process per session (overlapping reruns, separate caches)")
+    parser.add_argument("-o", "--output", help="result file (default: benchmarks/results/load-<time>-<commit>.json)")
+    args = parser.parse_args()
+    levels = [int(s) for s in args.sessions.split(",") if s.strip()]
+    apps = list(APPS) if args.app == "both" else [args.app]
+    workbook = workbook_bytes(generate_workbook(args.rows, args.sheets, missions=50, wbs_items=8, seed=args.seed))
+    # Idle baseline of the shared process: harness imported, workbook generated, no session run yet
+    baseline = metrics.process_rss_bytes()
+
+    run = {"environment": environment(), "config": {k: v for k, v in vars(args).items() if k != "output"},
+           "limitations": LIMITATIONS[args.mode], "levels": []}
+    print(f"Mode {args.mode}: {LIMITATIONS[args.mode]}\n")
+    print(f"{'sessions':>8} {'reruns':>7} {'p50 s':>8} {'p90 s':>8} {'p99 s':>8} {'reruns/s':>9} {'RSS MB/session':>15} {'errors':>7}")
+    for sessions in levels:
+        level = run_level(args.mode, sessions, apps, workbook, args.iterations, args.seed, baseline)
+        run["levels"].append(level)
+        if "p50_s" in level:
+            print(f"{sessions:>8} {level['reruns']:>7} {level['p50_s']:>8.3f} {level['p90_s']:>8.3f} {level['p99_s']:>8.3f} "
+                  f"{level['reruns_per_s']:>9.2f} {level['session_rss_mb_per_session']:>15.0f} {level['errors']:>7}")
+        else:
+            print(f"{sessions:>8} {0:>7} {'-':>8} {'-':>8} {'-':>8} {'-':>9} {level['session_rss_mb_per_session']:>15.0f} {level['errors']:>7}")
+        for error in level["error_examples"]:
+            print(f"         {error}")
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"load-{datetime.now():%Y%m%d-%H%M%S}-{run['environment']['commit'] or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(run, f, indent=2)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
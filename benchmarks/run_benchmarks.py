@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+CostSpirits benchmark suite
+
+Times the real code paths of the app on synthetic template workbooks of increasing size and writes
+the results as JSON, so runs of different versions can be compared:
+
+    python benchmarks/run_benchmarks.py                          # 1k, 10k, 100k and 1M rows
+    python benchmarks/run_benchmarks.py --sizes 1000,10000 --repeat 5
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/<earlier run>.json
+
+Generated workbooks are cached in benchmarks/data/ (the 1M-row workbook takes minutes to write).
+Stages: upload parse, aggregation (Cost Analysis per-WBS estimate), inflation load and lookup,
+create_template, create_mass_budget_template, export workbook and calculate_amcm_cost
+(plus the vectorized calculate_amcm_costs over the same inputs).
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from io import BytesIO
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+import streamlit.logger
+# The app modules run without a Streamlit server here; keep its "no runtime" warnings quiet
+streamlit.logger.set_log_level("error")
+import CostSpirits
+import amcm_calculator
+import currency
+import reference_data
+import upload_worker
+import xlsx_export
+from cost_engine import find_wbs_column, merged_wbs_aggregates, estimate_wbs_costs
+from synthetic_workbook import generate_workbook, workbook_bytes
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+DATA_DIR = os.path.join(BENCH_DIR, "data")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+# Slowdowns of stages faster than this are timer noise, not regressions
+NOISE_FLOOR_S = 0.01
+# Cost year and target year used for the inflation factor
+BASE_YEAR, TARGET_YEAR = 1999, 2025
+
+
+def measure(func, repeat, budget):
+    """Wall times of up to `repeat` calls of func, stopping early once `budget` seconds are spent"""
+    times = []
+    while len(times) < repeat:
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+        if sum(times) > budget:
+            break
+    return times
+
+
+def load_workbook_bytes(rows, args):
+    """Synthetic workbook content for a size, from the data cache when it was generated before"""
+    name = f"synthetic_{rows}_{args.sheets}s_{args.missions}m_{args.wbs_items}w_{args.seed}.xlsx"
+    path = os.path.join(DATA_DIR, name)
+    if os.path.exists(path) and not args.no_cache:
+        with open(path, "rb") as f:
+            return f.read()
+    data = workbook_bytes(generate_workbook(rows, args.sheets, args.missions, args.wbs_items, args.seed))
+    if not args.no_cache:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+    return data
+
+
+def load_inflation_table():
+    # A fresh reference file (not the process-wide one) so every call parses the table
+    return reference_data.ReferenceFile(reference_data.INFLATION_TABLE_PATH, reference_data._parse_inflation_table).get()
+
+
+def inflation_factor():
+    years, year_to_index = CostSpirits.load_inflation_index()
+    base_index = year_to_index.get(BASE_YEAR, 1)
+    return year_to_index.get(TARGET_YEAR, 1) / base_index if base_index else 1
+
+
+def estimate_sheets(sheets, factor):
+    """Cost Analysis estimate of every WBS of every sheet (each WBS analysed under its own name, 100 lbs each)"""
+    results = {}
+    for sheet, df in sheets.items():
+        wbs_col = find_wbs_column(df)
+        wbs_selected = list(df[wbs_col].dropna().unique())
+        wbs_analysis_map = {w: w for w in wbs_selected}
+        sums, counts, rows = merged_wbs_aggregates(df, wbs_col, wbs_analysis_map)
+        results[sheet] = estimate_wbs_costs(sums, counts, rows, wbs_selected, dict.fromkeys(wbs_selected, 100.0), factor, TARGET_YEAR)
+    return results
+
+
+def export_workbook(results, factor):
+    currencies = currency.DEFAULT_CURRENCIES
+    rates = currency.rates_for(currencies)
+    currency_frames = {sheet: currency.currency_table(df, factor, TARGET_YEAR, currencies, rates) for sheet, df in results.items()}
+    # Cold export: every sheet part is rendered
+    xlsx_export.clear_cache()
+    return CostSpirits.create_cost_analysis_workbook(results, currency_frames)
+
+
+def amcm_inputs(n, seed):
+    rng = np.random.default_rng(seed)
+    return (rng.integers(1, 10, n), rng.lognormal(7.0, 1.0, n), rng.integers(0, len(amcm_calculator.AMCM_MODELS), n),
+            rng.integers(1990, 2030, n), rng.integers(1, 4, n), rng.integers(0, 5, n))
+
+
+def amcm_loop(inputs):
+    quantity, weight, mission_type, ioc_year, block, difficulty = (a.tolist() for a in inputs)
+    for args in zip(quantity, weight, mission_type, ioc_year, block, difficulty):
+        amcm_calculator.calculate_amcm_cost(*args)
+
+
+def size_independent_stages(args):
+    """Stages whose work does not depend on the historical workbook size"""
+    subsystems = [name for group in CostSpirits.AVAILABLE_SUBSYSTEMS.values() for name in group]
+    # The lookup is timed against the already parsed (process-wide) table, as in a running server
+    inflation_factor()
+    return [
+        ("inflation load", None, load_inflation_table),
+        ("inflation lookup", None, inflation_factor),
+        ("create_template", len(subsystems), lambda: CostSpirits.create_template(subsystems)),
+    ]
+
+
+def size_stages(rows, data, args):
+    """(stage, items, callable) for one workbook size; the callables run on the same parsed data"""
+    parse = upload_worker.parse_workbook
+    sheets = parse(data)
+    factor = inflation_factor()
+    results = estimate_sheets(sheets, factor)
+    inputs = amcm_inputs(rows, args.seed)
+    wbs_total = sum(len(df) for df in results.values())
+    return [
+        ("upload parse", rows, lambda: parse(data)),
+        ("aggregation", rows, lambda: estimate_sheets(sheets, factor)),
+        ("create_mass_budget_template", rows, lambda: CostSpirits.create_mass_budget_template(BytesIO(data))),
+        ("export workbook", wbs_total, lambda: export_workbook(results, factor)),
+        ("calculate_amcm_cost", rows, lambda: amcm_loop(inputs)),
+        ("calculate_amcm_costs", rows, lambda: amcm_calculator.calculate_amcm_costs(*inputs)),
+    ]
+
+
+def result_entry(stage, rows, items, times):
+    median = statistics.median(times)
+    return {
+        "stage": stage,
+        "rows": rows,
+        "items": items,
+        "runs": len(times),
+        "min_s": min(times),
+        "median_s": median,
+        "max_s": max(times),
+        "items_per_s": items / median if items and median else None,
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "time": datetime.now().isoformat(timespec='seconds'),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+    }
+
+
+def compare(current, baseline, threshold):
+    """Print median time ratios against a baseline run; returns the regressed (stage, rows) pairs"""
+    previous = {(r["stage"], r["rows"]): r for r in baseline["results"]}
+    regressions = []
+    print(f"\nComparison with {baseline['environment'].get('commit')} ({baseline['environment']['time']}):")
+    print(f"{'stage':<30} {'rows':>9} {'before s':>10} {'now s':>10} {'ratio':>7}")
+    for r in current["results"]:
+        old = previous.get((r["stage"], r["rows"]))
+        if old is None:
+            continue
+        ratio = r["median_s"] / old["median_s"] if old["median_s"] else float("inf")
+        flag = ""
+        if ratio > 1 + threshold and r["median_s"] > NOISE_FLOOR_S:
+            regressions.append((r["stage"], r["rows"]))
+            flag = "  slower"
+        print(f"{r['stage']:<30} {r['rows'] or '-':>9} {old['median_s']:>10.4f} {r['median_s']:>10.4f} {ratio:>7.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the CostSpirits code paths on synthetic workbooks")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="comma separated total row counts")
+    parser.add_argument("--sheets", type=int, default=5)
+    parser.add_argument("--missions", type=int, default=200, help="missions per sheet")
+    parser.add_argument("--wbs-items", type=int, default=25, help="WBS items per sheet")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage (median is reported)")
+    parser.add_argument("--budget", type=float, default=30.0, help="stop repeating a stage after this many seconds")
+    parser.add_argument("--no-cache", action="store_true", help="regenerate the workbooks instead of using benchmarks/data/")
+    parser.add_argument("-o", "--output", help="result file (default: benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--compare", help="earlier result file to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown reported as a regression")
+    args = parser.parse_args()
+    sizes = [int(float(s)) for s in args.sizes.split(",") if s.strip()]
+
+    run = {"environment": environment(), "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+           "results": []}
+    print(f"{'stage':<30} {'rows':>9} {'items':>9} {'median s':>10} {'min s':>10} {'runs':>5}")
+
+    def record(stage, rows, items, func):
+        entry = result_entry(stage, rows, items, measure(func, args.repeat, args.budget))
+        run["results"].append(entry)
+        print(f"{stage:<30} {rows or '-':>9} {items or '-':>9} {entry['median_s']:>10.4f} {entry['min_s']:>10.4f} {entry['runs']:>5}")
+
+    for stage, items, func in size_independent_stages(args):
+        record(stage, None, items, func)
+    for rows in sizes:
+        start = time.perf_counter()
+        data = load_workbook_bytes(rows, args)
+        print(f"-- {rows} rows: workbook ready in {time.perf_counter() - start:.1f} s ({len(data) / 1e6:.1f} MB)")
+        for stage, items, func in size_stages(rows, data, args):
+            record(stage, rows, items, func)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{run['environment']['commit'] or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(run, f, indent=2)
+    print(f"\nResults written to {output}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(run, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
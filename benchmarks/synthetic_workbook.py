@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Synthetic historical cost workbooks in the CostSpirits template format
+
+Sheets are named after subsystems in subsystem_headers.json and use their headers. Every row is
+one WBS item of one mission: weights are log-normal per WBS, costs follow a per-WBS cost per pound
+with mission-level scatter, and the "Lower" columns are a fraction of the "Higher" ones. A small
+share of cells is left blank, zero or filled with stray text, like hand-filled templates.
+
+    python benchmarks/synthetic_workbook.py --rows 100000 --sheets 5 -o synthetic.xlsx
+"""
+
+import argparse
+import os
+import sys
+from io import BytesIO
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import reference_data
+
+# Largest number of data rows an .xlsx sheet can hold
+EXCEL_MAX_ROWS = 1048575
+# Stray entries found in hand-filled templates
+STRAY_TEXT = ["TBD", "n/a", "-", "see note"]
+
+
+def template_headers(sheets):
+    """(sheet name, headers) for the first subsystems of subsystem_headers.json, cycled if more are asked for"""
+    headers = reference_data.subsystem_headers()
+    if not headers:
+        raise FileNotFoundError(reference_data.SUBSYSTEM_HEADERS_PATH)
+    names = list(headers)
+    result = []
+    for i in range(sheets):
+        name = names[i % len(names)]
+        sheet_name = name if i < len(names) else f"{name[:27]} {i // len(names) + 1}"
+        result.append((sheet_name, headers[name]))
+    return result
+
+
+def _mess_up(values, rng, missing):
+    # Blank, zero and text entries in about `missing` of the cells
+    column = pd.Series(values, dtype=object)
+    draw = rng.random(len(column))
+    column[draw < missing * 0.6] = None
+    column[(draw >= missing * 0.6) & (draw < missing * 0.8)] = 0.0
+    text = draw >= missing * 0.8
+    text &= draw < missing
+    column[text] = rng.choice(STRAY_TEXT, int(text.sum()))
+    return column
+
+
+def generate_sheet(headers, rows, missions, wbs_items, rng, missing=0.02, sheet_label=""):
+    """One historical sheet with the given headers and number of rows"""
+    wbs_names = np.array([f"{sheet_label} WBS {i + 1:03d}".strip() for i in range(wbs_items)])
+    mission_names = np.array([f"Mission {i + 1:04d}" for i in range(missions)])
+    wbs = rng.integers(0, wbs_items, rows)
+    mission = rng.integers(0, missions, rows)
+    # Per-WBS typical weight and cost per pound, scattered per row
+    wbs_weight = rng.lognormal(5.0, 1.0, wbs_items)
+    wbs_dd_rate = rng.lognormal(3.0, 0.5, wbs_items)
+    wbs_fu_rate = rng.lognormal(2.0, 0.5, wbs_items)
+    weight = wbs_weight[wbs] * rng.lognormal(0.0, 0.3, rows)
+    dd = weight * wbs_dd_rate[wbs] * rng.lognormal(0.0, 0.25, rows)
+    fu = weight * wbs_fu_rate[wbs] * rng.lognormal(0.0, 0.25, rows)
+    low = rng.uniform(0.7, 0.95, rows)
+    values = {
+        "Higher Weight Range (lbs)": weight,
+        "Lower Weight Range (lbs)": weight * low,
+        "Higher D&D Cost Range": dd,
+        "Lower D&D Cost Range": dd * low,
+        "Higher Flight Unit Cost Range": fu,
+        "Lower Flight Unit Cost Range": fu * low,
+        "Higher Total Cost Range": dd + fu,
+        "Lower Total Cost Range": (dd + fu) * low,
+    }
+    columns = {}
+    for header in headers:
+        if header == "Mission":
+            columns[header] = mission_names[mission]
+        elif header.lower() in ("wbs item", "wbs element", "wbs"):
+            columns[header] = wbs_names[wbs]
+        elif header in values:
+            columns[header] = _mess_up(values[header], rng, missing) if missing else values[header]
+        else:
+            columns[header] = np.full(rows, np.nan)
+    return pd.DataFrame(columns)
+
+
+def generate_workbook(rows, sheets=5, missions=200, wbs_items=25, seed=0, missing=0.02):
+    """
+    {sheet name: DataFrame} with `rows` data rows spread evenly over `sheets` template sheets.
+
+    missions and wbs_items are per sheet; the same seed always gives the same workbook.
+    """
+    rng = np.random.default_rng(seed)
+    per_sheet = np.full(sheets, rows // sheets)
+    per_sheet[:rows % sheets] += 1
+    if per_sheet.max() > EXCEL_MAX_ROWS:
+        raise ValueError(f"{rows} rows do not fit in {sheets} sheets (max {EXCEL_MAX_ROWS} rows per sheet)")
+    return {name: generate_sheet(headers, int(n), missions, wbs_items, rng, missing, name)
+            for (name, headers), n in zip(template_headers(sheets), per_sheet)}
+
+
+def workbook_bytes(sheets):
+    """.xlsx file content of a {sheet name: DataFrame} workbook"""
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine="openpyxl") as writer:
+        for name, df in sheets.items():
+            df.to_excel(writer, sheet_name=name[:31], index=False)
+    return output.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic historical cost workbook")
+    parser.add_argument("--rows", type=int, default=10000, help="total data rows over all sheets")
+    parser.add_argument("--sheets", type=int, default=5)
+    parser.add_argument("--missions", type=int, default=200, help="missions per sheet")
+    parser.add_argument("--wbs-items", type=int, default=25, help="WBS items per sheet")
+    parser.add_argument("--missing", type=float, default=0.02, help="share of blank/zero/text cost cells")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default="synthetic_history.xlsx")
+    args = parser.parse_args()
+    sheets = generate_workbook(args.rows, args.sheets, args.missions, args.wbs_items, args.seed, args.missing)
+    with open(args.output, "wb") as f:
+        f.write(workbook_bytes(sheets))
+    print(f"Wrote {args.rows} rows in {len(sheets)} sheets to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+
+# Time-phased budget spreading
+# Each cost is spread over its [start year, end year] span with a spending profile, giving a
+# (cost element x year) matrix in constant base-year dollars. Multiplying by the per-year
+# inflation factors of the NASA New Start Inflation Index turns it into then-year dollars.
+PHASING_PROFILES = ["Beta", "Trapezoidal", "Uniform"]
+
+# Resolution of the numerically integrated profile CDFs
+_CDF_POINTS = 2049
+
+
+def _profile_cdf(profile, alpha=2.0, beta=2.0, ramp_up=0.25, ramp_down=0.25):
+    # Cumulative spending fraction on a normalized [0, 1] program duration
+    x = np.linspace(0.0, 1.0, _CDF_POINTS)
+    if profile == "Beta":
+        if alpha < 1 or beta < 1:
+            raise ValueError("Beta profile shape parameters must be >= 1")
+        pdf = x ** (alpha - 1) * (1 - x) ** (beta - 1)
+    elif profile == "Trapezoidal":
+        if ramp_up < 0 or ramp_down < 0 or ramp_up + ramp_down > 1:
+            raise ValueError("Trapezoidal ramp fractions must be >= 0 and sum to at most 1")
+        pdf = np.ones_like(x)
+        if ramp_up > 0:
+            pdf = np.minimum(pdf, x / ramp_up)
+        if ramp_down > 0:
+            pdf = np.minimum(pdf, (1 - x) / ramp_down)
+    elif profile == "Uniform":
+        pdf = np.ones_like(x)
+    else:
+        raise ValueError(f"Unknown phasing profile: {profile}")
+    cdf = np.concatenate(([0.0], np.cumsum((pdf[1:] + pdf[:-1]) / 2)))
+    return x, cdf / cdf[-1]
+
+
+def phasing_weights(start_years, end_years, years, profile="Beta", **profile_params):
+    """
+    Fraction of each cost spent in each year, as a (cost element x year) matrix whose rows sum to 1.
+
+    start_years/end_years are inclusive fiscal years per cost element; years is the column axis.
+    """
+    starts = np.asarray(start_years, dtype=float)[:, None]
+    ends = np.asarray(end_years, dtype=float)[:, None]
+    if np.any(ends < starts):
+        raise ValueError("End year must not be before start year")
+    years = np.asarray(years, dtype=float)[None, :]
+    duration = ends - starts + 1
+    # Normalized position of the start and end of every fiscal year within each span
+    t0 = np.clip((years - starts) / duration, 0.0, 1.0)
+    t1 = np.clip((years + 1 - starts) / duration, 0.0, 1.0)
+    grid, cdf = _profile_cdf(profile, **profile_params)
+    return np.interp(t1, grid, cdf) - np.interp(t0, grid, cdf)
+
+
+def then_year_factors(years, year_to_index, base_year):
+    """Inflation factor from base_year to each year (NaN where the index has no entry)"""
+    base_index = year_to_index.get(base_year)
+    if not base_index:
+        raise ValueError(f"No inflation index for base year {base_year}")
+    return np.array([year_to_index.get(int(y), np.nan) for y in years], dtype=float) / base_index
+
+
+def phase_costs(costs, start_years, end_years, years, year_to_index, base_year, profile="Beta", **profile_params):
+    """
+    Spread base-year costs over their spans and escalate each year to then-year dollars.
+
+    Returns a (cost element x year) matrix: costs[:, None] * weights * factors[None, :]
+    Missing costs (None/NaN) are treated as zero.
+    """
+    costs = np.nan_to_num(np.asarray(costs, dtype=float))
+    weights = phasing_weights(start_years, end_years, years, profile, **profile_params)
+    factors = then_year_factors(years, year_to_index, base_year)
+    return costs[:, None] * weights * factors[None, :]
+
+
+def _span_years(values, year_to_index, label):
+    # Whole years covered by the inflation index; the spans editor allows empty (None/NaN) cells
+    years = pd.to_numeric(pd.Series(list(values), dtype=object), errors="coerce").to_numpy(dtype=float)
+    if np.isnan(years).any():
+        raise ValueError(f"Every {label} year must be filled in")
+    if np.any(years != np.round(years)):
+        raise ValueError(f"Every {label} year must be a whole year")
+    outside = np.unique(years[~np.isin(years, list(year_to_index))])
+    if outside.size:
+        raise ValueError(f"No inflation index for {label} year(s) {', '.join(f'{y:g}' for y in outside)}")
+    return years.astype(int)
+
+
+def build_phasing_table(wbs, dd_costs, fu_costs, dd_spans, fu_spans, year_to_index, base_year, profile="Beta", **profile_params):
+    """
+    Then-year budget profile for a set of WBS items.
+
+    dd_spans/fu_spans: (start_years, end_years) sequences, one entry per WBS
+    Returns a DataFrame with one row per WBS and cost element, one column per fiscal year and a Total column.
+    """
+    wbs = list(wbs)
+    n = len(wbs)
+    starts = np.concatenate([_span_years(dd_spans[0], year_to_index, "D&D start"), _span_years(fu_spans[0], year_to_index, "flight unit start")])
+    ends = np.concatenate([_span_years(dd_spans[1], year_to_index, "D&D end"), _span_years(fu_spans[1], year_to_index, "flight unit end")])
+    costs = np.concatenate([np.asarray(dd_costs, dtype=float), np.asarray(fu_costs, dtype=float)])
+    if n == 0:
+        return pd.DataFrame(columns=["WBS", "Cost Element", "Total"])
+    years = np.arange(starts.min(), ends.max() + 1)
+    # D&D and flight unit rows are phased together in a single matrix operation
+    matrix = phase_costs(costs, starts, ends, years, year_to_index, base_year, profile, **profile_params)
+    table = pd.DataFrame(matrix, columns=[int(y) for y in years])
+    table.insert(0, "Cost Element", ["D&D"] * n + ["Flight Units"] * n)
+    table.insert(0, "WBS", wbs + wbs)
+    table["Total"] = matrix.sum(axis=1)
+    # Group the two cost elements of each WBS together
+    order = np.ravel(np.column_stack([np.arange(n), np.arange(n) + n]))
+    return table.iloc[order].reset_index(drop=True)
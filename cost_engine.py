@@ -0,0 +1,221 @@
+import numpy as np
+import pandas as pd
+
+# Shared historical-data logic behind the Cost Analysis cost-per-pound estimate
+
+# Template columns used by the estimate
+MISSION_COL = "Mission"
+WEIGHT_COL = "Higher Weight Range (lbs)"
+DD_COST_COL = "Higher D&D Cost Range"
+FLIGHT_UNIT_COST_COL = "Higher Flight Unit Cost Range"
+TOTAL_COST_COL = "Higher Total Cost Range"
+AGGREGATE_COLS = [WEIGHT_COL, DD_COST_COL, FLIGHT_UNIT_COST_COL, TOTAL_COST_COL]
+# All numeric range columns of the historical template
+RANGE_COLUMNS = [
+    "Lower Weight Range (lbs)", "Higher Weight Range (lbs)",
+    "Lower D&D Cost Range", "Higher D&D Cost Range",
+    "Lower Flight Unit Cost Range", "Higher Flight Unit Cost Range",
+    "Lower Total Cost Range", "Higher Total Cost Range",
+]
+
+# Accepted spellings of the WBS column header (compared stripped and lower-case)
+WBS_COLUMN_NAMES = ["wbs item", "wbs element", "wbs"]
+
+
+def find_wbs_column(df):
+    """Name of the WBS column of a sheet, or None"""
+    for col in df.columns:
+        if str(col).strip().lower() in WBS_COLUMN_NAMES:
+            return col
+    return None
+
+
+def find_mission_column(df):
+    """Name of the mission column of a sheet (the 'Mission' header, else the first column), or None"""
+    if MISSION_COL in df.columns:
+        return MISSION_COL
+    return df.columns[0] if len(df.columns) else None
+
+
+def numeric_columns(df, cols=None):
+    """Numeric copy of the aggregate columns: text becomes NaN and missing columns are all-NaN"""
+    cols = AGGREGATE_COLS if cols is None else cols
+    return pd.DataFrame(
+        {col: pd.to_numeric(df[col], errors='coerce') if col in df.columns else np.nan for col in cols},
+        index=df.index, dtype=float
+    )
+
+
+def group_sums(values, keys):
+    """
+    Per-group sums and non-null counts of numeric columns.
+
+    Returns (sums, counts, rows): sums and counts share the columns of values; rows is the group size.
+    Means are sums / counts, which lets callers combine or subtract groups without re-aggregating.
+    """
+    # Categorical keys (compact sheets): only the combinations that occur, not their full product
+    grouped = values.groupby(keys, sort=False, observed=True)
+    return grouped.sum(), grouped.count(), grouped.size()
+
+
+def compact_sheet(df):
+    """
+    Compact in-memory copy of a historical sheet.
+
+    The mission and WBS columns (and other text columns with repeated values) become categoricals,
+    the template range columns become float64 (stray text becomes NaN).
+    """
+    wbs_col = find_wbs_column(df)
+    mission_col = find_mission_column(df)
+    compact = {}
+    for col in df.columns:
+        values = df[col]
+        if col in RANGE_COLUMNS:
+            compact[col] = pd.to_numeric(values, errors='coerce').astype(float)
+        elif col in (wbs_col, mission_col) or (pd.api.types.is_string_dtype(values.dtype) and values.nunique() <= len(values) // 2):
+            compact[col] = values.astype("category")
+        else:
+            compact[col] = values
+    return pd.DataFrame(compact, index=df.index)
+
+
+def compact_workbook(sheets):
+    """compact_sheet for every sheet of a workbook ({sheet name: DataFrame})"""
+    return {sheet: compact_sheet(df) for sheet, df in sheets.items()}
+
+
+def wbs_code_remap(categories, wbs_analysis_map):
+    """
+    Integer remap from WBS category codes to mapped-WBS group codes.
+
+    Returns (remap, groups): remap[code] is the index in groups of the WBS the category is analysed
+    under, or -1 when it is not selected.
+    """
+    groups = list(dict.fromkeys(wbs_analysis_map.values()))
+    group_codes = {group: i for i, group in enumerate(groups)}
+    remap = np.array([group_codes[wbs_analysis_map[c]] if c in wbs_analysis_map else -1 for c in categories], dtype=np.intp)
+    return remap, groups
+
+
+def _mapped_codes(wbs, wbs_analysis_map):
+    # Group code of every row of a categorical WBS column (-1 for unselected or missing WBS)
+    remap, groups = wbs_code_remap(wbs.cat.categories, wbs_analysis_map)
+    codes = wbs.cat.codes.to_numpy()
+    return np.where(codes >= 0, remap[codes] if len(remap) else -1, -1), groups
+
+
+def select_wbs_rows(df, wbs_col, wbs_analysis_map):
+    """Rows of the selected WBS with a categorical 'WBS_Mapped' column holding the analysed WBS"""
+    if not isinstance(df[wbs_col].dtype, pd.CategoricalDtype):
+        selected = df[df[wbs_col].isin(wbs_analysis_map.keys())].copy()
+        selected['WBS_Mapped'] = selected[wbs_col].map(wbs_analysis_map)
+        return selected
+    mapped, groups = _mapped_codes(df[wbs_col], wbs_analysis_map)
+    keep = mapped >= 0
+    return df[keep].assign(WBS_Mapped=pd.Categorical.from_codes(mapped[keep], categories=groups))
+
+
+def merged_wbs_aggregates(df, wbs_col, wbs_analysis_map):
+    """
+    Grouped sums and counts per mapped WBS for the selected rows of a sheet.
+
+    wbs_analysis_map maps original WBS names to the (possibly merged) WBS they are analysed under;
+    rows whose WBS is not in the map are ignored. Compact (categorical) sheets are aggregated with
+    an integer code remap and bincount instead of mapping strings.
+    """
+    if isinstance(df[wbs_col].dtype, pd.CategoricalDtype):
+        return _code_aggregates(df, wbs_col, wbs_analysis_map)
+    mapped = df[wbs_col].map(wbs_analysis_map)
+    selected = mapped.notna()
+    return group_sums(numeric_columns(df[selected]), mapped[selected].rename("WBS"))
+
+
+def _code_aggregates(df, wbs_col, wbs_analysis_map):
+    mapped, groups = _mapped_codes(df[wbs_col], wbs_analysis_map)
+    keep = mapped >= 0
+    keys = mapped[keep]
+    n_groups = len(groups)
+    rows = np.bincount(keys, minlength=n_groups)
+    values = numeric_columns(df).to_numpy()[keep]
+    sums = np.zeros((n_groups, len(AGGREGATE_COLS)))
+    counts = np.zeros((n_groups, len(AGGREGATE_COLS)), dtype=np.int64)
+    for j in range(len(AGGREGATE_COLS)):
+        valid = ~np.isnan(values[:, j])
+        sums[:, j] = np.bincount(keys[valid], weights=values[valid, j], minlength=n_groups)
+        counts[:, j] = np.bincount(keys[valid], minlength=n_groups)
+    # Same shape as a groupby: only groups that have rows
+    present = rows > 0
+    index = pd.Index(groups, name="WBS")[present]
+    return (pd.DataFrame(sums[present], index=index, columns=AGGREGATE_COLS),
+            pd.DataFrame(counts[present], index=index, columns=AGGREGATE_COLS),
+            pd.Series(rows[present], index=index))
+
+
+def combine_groups(sums, counts, rows, wbs_analysis_map):
+    """Combine per-WBS aggregates into merged WBS groups without going back to the rows"""
+    mapping = pd.Series(wbs_analysis_map)
+    mapping = mapping[mapping.index.isin(rows.index)]
+    keys = mapping.rename("WBS")
+    return (sums.loc[mapping.index].groupby(keys.values).sum().rename_axis("WBS"),
+            counts.loc[mapping.index].groupby(keys.values).sum().rename_axis("WBS"),
+            rows.loc[mapping.index].groupby(keys.values).sum().rename_axis("WBS"))
+
+
+def _truthy(values):
+    # The estimate treats missing and zero averages alike ("no data")
+    return values.notna() & (values != 0)
+
+
+def wbs_rates(sums, counts):
+    """Historical averages and cost per pound per WBS from grouped sums and counts"""
+    means = sums / counts.where(counts > 0)
+    avg_weight = means[WEIGHT_COL]
+    has_weight = _truthy(avg_weight)
+    rates = pd.DataFrame({
+        "Avg Higher Weight Range (lbs)": avg_weight,
+        "Avg Higher D&D Cost Range": means[DD_COST_COL],
+        "Avg Higher Flight Unit Cost": means[FLIGHT_UNIT_COST_COL],
+        "Avg Higher Total Cost Range": means[TOTAL_COST_COL],
+    })
+    rates["Total Cost per lbs"] = (means[TOTAL_COST_COL] / avg_weight).where(has_weight & _truthy(means[TOTAL_COST_COL]))
+    rates["Flight Unit Cost per lbs"] = (means[FLIGHT_UNIT_COST_COL] / avg_weight).where(has_weight & _truthy(means[FLIGHT_UNIT_COST_COL]))
+    rates["D&D Cost per lbs"] = (means[DD_COST_COL] / avg_weight).where(has_weight & _truthy(means[DD_COST_COL]))
+    return rates
+
+
+def estimate_wbs_costs(sums, counts, rows, wbs_selected, masses_lbs, inflation_factor, target_year):
+    """
+    Cost Analysis result table: historical averages and the user-system estimate for each selected WBS.
+
+    masses_lbs: user mass per WBS (pounds); inflation_factor escalates from the template cost year to target_year.
+    """
+    wbs_selected = list(wbs_selected)
+    rates = wbs_rates(sums, counts).reindex(wbs_selected)
+    mass = pd.Series([masses_lbs[w] for w in wbs_selected], index=rates.index, dtype=float)
+    est_price = rates["Total Cost per lbs"] * mass
+    flight_unit_cost_new = rates["Flight Unit Cost per lbs"] * mass
+    dd_cost_new = rates["D&D Cost per lbs"] * mass
+    avg_dd = rates["Avg Higher D&D Cost Range"]
+    avg_fu = rates["Avg Higher Flight Unit Cost"]
+    avg_total = rates["Avg Higher Total Cost Range"]
+    result = pd.DataFrame({
+        "WBS": wbs_selected,
+        "Count": rows.reindex(wbs_selected).fillna(0).astype(int).to_numpy(),
+        "Avg Higher Weight Range (lbs)": rates["Avg Higher Weight Range (lbs)"].to_numpy(),
+        "Avg Higher D&D Cost Range": avg_dd.to_numpy(),
+        "Avg Higher Flight Unit Cost": avg_fu.to_numpy(),
+        "Avg Higher Total Cost": (avg_dd.where(_truthy(avg_dd), 0) + avg_fu.where(_truthy(avg_fu), 0)).to_numpy(),
+        "User Mass (lbs)": mass.to_numpy(),
+        "Est. Price (from hist.)": est_price.to_numpy(),
+        # Sum of flight unit cost and D&D cost for user system
+        "Total Cost": (flight_unit_cost_new.where(_truthy(flight_unit_cost_new), 0) + dd_cost_new.where(_truthy(dd_cost_new), 0)).to_numpy(),
+        "Flight Unit Cost per lbs": rates["Flight Unit Cost per lbs"].to_numpy(),
+        "D&D Cost per lbs": rates["D&D Cost per lbs"].to_numpy(),
+        "D&D Cost": dd_cost_new.to_numpy(),
+        "Flight Unit Cost (new, ref yr)": flight_unit_cost_new.to_numpy(),
+        f"Flight Unit Cost (new, {target_year})": (flight_unit_cost_new * inflation_factor).where(_truthy(flight_unit_cost_new)).to_numpy(),
+        f"Adj. D&D Cost ({target_year})": (avg_dd * inflation_factor).where(_truthy(avg_dd)).to_numpy(),
+        f"Adj. Total Cost ({target_year})": (avg_total * inflation_factor).where(_truthy(avg_total)).to_numpy(),
+        f"Adj. Est. Price ({target_year})": (est_price * inflation_factor).where(_truthy(est_price)).to_numpy(),
+    })
+    return result
@@ -0,0 +1,14 @@
+import streamlit as st
+import CostSpirits
+import amcm_calculator
+
+# Combined launcher: CostSpirits and the AMCM calculator as pages of one Streamlit server
+# Both apps share the process, so module-level and st.cache_* caches (parsed workbooks,
+# reference data) are loaded once instead of once per server.
+#   streamlit run costspirits_app.py
+
+pages = [
+    st.Page(CostSpirits.run, title="CostSpirits Estimator", icon="📊", url_path="costspirits", default=True),
+    st.Page(amcm_calculator.run, title="AMCM Calculator", icon="🚀", url_path="amcm"),
+]
+st.navigation(pages).run()
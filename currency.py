@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import reference_data
+
+# Conversion of the USD Cost Analysis estimates into other currencies
+# Rates (units of currency per USD) come from the local dated table exchange_rates.csv, shared by all
+# sessions and reloaded when it changes. The rate of a year is the mean of the rates dated in that
+# year, else the closest earlier year's (the earliest year's for years before the table).
+# A result table is converted into all selected currencies at once: (rows x columns) values times
+# (currencies) rates in one broadcast multiply.
+
+BASE_CURRENCY = "USD"
+DEFAULT_CURRENCIES = ["EUR"]
+RATE_MODES = ["Latest rate", "Target year rate"]
+# Used when exchange_rates.csv is missing
+FALLBACK_RATES = {"EUR": 0.86}
+
+
+def available_currencies():
+    """Currencies with a rate in the exchange rate table"""
+    rates = reference_data.exchange_rates()
+    return list(FALLBACK_RATES) if rates is None else list(rates["latest"].index)
+
+
+def rates_for(currencies, year=None):
+    """
+    Units per USD of each currency as an array: the latest rates, or the rates for a year.
+
+    Raises KeyError for a currency without rates.
+    """
+    currencies = list(currencies)
+    rates = reference_data.exchange_rates()
+    if rates is None:
+        return np.array([FALLBACK_RATES[c] for c in currencies], dtype=float)
+    if year is None:
+        return rates["latest"].loc[currencies].to_numpy(dtype=float)
+    by_year = rates["by_year"][currencies]
+    earlier = by_year.loc[:year].ffill()
+    # Missing years take the closest earlier year's rate, years before the table the first rate
+    row = earlier.iloc[-1] if len(earlier) else by_year.bfill().iloc[0]
+    return row.fillna(by_year.bfill().iloc[0]).to_numpy(dtype=float)
+
+
+def rate_caption(currencies, rates, label):
+    """One-line description of the rates used, e.g. '1 USD = 0.860 EUR, 144.000 JPY (latest)'"""
+    return f"1 {BASE_CURRENCY} = " + ", ".join(f"{rate:,.3f} {c}" for c, rate in zip(currencies, rates)) + f" ({label})"
+
+
+def inflation_adjusted_usd(result_df, inflation_factor, target_year):
+    """The inflation adjusted estimates of a Cost Analysis result table (USD), indexed like the table"""
+    return pd.DataFrame({
+        f"Adj. Est. Price ({target_year})": result_df[f"Adj. Est. Price ({target_year})"],
+        f"Flight Unit Cost (new, {target_year})": result_df[f"Flight Unit Cost (new, {target_year})"],
+        f"Adj. Flight Unit Cost per lbs ({target_year})": result_df["Flight Unit Cost per lbs"] * inflation_factor,
+        f"Adj. D&D Cost per lbs ({target_year})": result_df["D&D Cost per lbs"] * inflation_factor,
+    })
+
+
+def currency_table(result_df, inflation_factor, target_year, currencies, rates):
+    """
+    Inflation adjusted estimates of a Cost Analysis result table in every given currency.
+
+    rates: units per USD, one per currency (see rates_for). Columns are grouped by currency and
+    suffixed with it, e.g. 'Adj. Est. Price (2025) (EUR)'.
+    """
+    currencies = list(currencies)
+    usd = inflation_adjusted_usd(result_df, inflation_factor, target_year)
+    values = usd.to_numpy(dtype=float)[:, None, :] * np.asarray(rates, dtype=float)[None, :, None]
+    table = pd.DataFrame(values.reshape(len(usd), -1), index=usd.index,
+                         columns=[f"{col} ({c})" for c in currencies for col in usd.columns])
+    table.insert(0, "WBS", result_df["WBS"].to_numpy())
+    return table
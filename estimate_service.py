@@ -0,0 +1,495 @@
+#!/usr/bin/env python3
+"""
+Local JSON HTTP service for AMCM and Cost Analysis estimates
+
+    python estimate_service.py --port 8765 --history "Historical Data.xlsx"
+    python estimate_service.py --port 8765 --db costspirits_history.db
+    python estimate_service.py --selftest --requests 5000 --concurrency 32
+
+Endpoints (JSON in and out):
+    GET  /health             liveness
+    GET  /v1/reference       mission types, difficulty levels, inflation years, subsystems, profiles
+    GET  /v1/stats           requests, batches and mean batch size per endpoint
+    POST /v1/amcm            {"quantity", "weight_lbs" | "weight_kg", "mission_type", "ioc_year",
+                              "block_number", "difficulty", "profile", "base_year", "target_year"}
+    POST /v1/cost-analysis   {"subsystem", "wbs", "mass_lbs" | "mass_kg", "base_year", "target_year"}
+
+POST bodies are one estimate object or {"items": [...]}; the response is one result object or
+{"results": [...]}. Estimates of concurrent requests are coalesced: requests arriving within
+BATCH_WINDOW_SECONDS of each other (up to MAX_BATCH items) are evaluated in one vectorized call
+(calculate_amcm_costs, or one merge against the historical rates). The AMCM profiles, the inflation
+index, the subsystem headers and the historical per-WBS rates are loaded once and kept in memory.
+"""
+
+import argparse
+import asyncio
+import http.client
+import json
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import streamlit.logger
+# The estimate functions are shared with the Streamlit apps; no Streamlit server runs here
+streamlit.logger.set_log_level("error")
+import amcm_calculator
+import history_db
+import reference_data
+import upload_worker
+from cost_engine import wbs_rates
+from portfolio import estimate_spacecraft, historical_rates
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = int(os.environ.get("COSTSPIRITS_SERVICE_PORT", 8765))
+# Requests arriving this close together are evaluated as one batch
+BATCH_WINDOW_SECONDS = 0.002
+MAX_BATCH = 4096
+MAX_BODY_BYTES = 16 * 1024 * 1024
+DEFAULT_BASE_YEAR, DEFAULT_TARGET_YEAR = 1999, 2025
+DIFFICULTY_LEVELS = ["Very Low", "Low", "Average", "High", "Very High"]
+LBS_PER_KG = 2.20462
+
+
+class RequestError(ValueError):
+    """Invalid request; reported to the client with HTTP 400"""
+
+
+class Batcher:
+    """Coalesces the items of concurrent requests into one evaluate(items) call returning one result per item"""
+
+    def __init__(self, evaluate, window=BATCH_WINDOW_SECONDS, max_batch=MAX_BATCH):
+        self.evaluate = evaluate
+        self.window = window
+        self.max_batch = max_batch
+        self.pending = []
+        self.pending_items = 0
+        self._timer = None
+        self.requests = 0
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, items):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((items, future))
+        self.pending_items += len(items)
+        self.requests += 1
+        if self.pending_items >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self.pending, self.pending_items = self.pending, [], 0
+        if not batch:
+            return
+        items = [item for request_items, _ in batch for item in request_items]
+        self.batches += 1
+        self.items += len(items)
+        try:
+            results = self.evaluate(items)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        start = 0
+        for request_items, future in batch:
+            future.set_result(results[start:start + len(request_items)])
+            start += len(request_items)
+
+    def stats(self):
+        return {"requests": self.requests, "batches": self.batches, "items": self.items,
+                "mean_batch_items": self.items / self.batches if self.batches else None}
+
+
+def _historical_rates_from_db(path):
+    # Per-WBS rates of every subsystem from the stored aggregates, in portfolio.historical_rates' format
+    conn = history_db.connect(path)
+    try:
+        frames = []
+        for subsystem in history_db.list_subsystems(conn)["Subsystem"]:
+            wbs_items = history_db.list_wbs(conn, subsystem)
+            sums, counts, rows = history_db.query_wbs_aggregates(conn, subsystem, {w: w for w in wbs_items})
+            rates = wbs_rates(sums, counts)[["D&D Cost per lbs", "Flight Unit Cost per lbs"]].copy()
+            rates["Historical Count"] = rows
+            frames.append(rates.reset_index().assign(Subsystem=subsystem))
+    finally:
+        conn.close()
+    return pd.concat(frames, ignore_index=True) if frames else historical_rates({})
+
+
+def load_historical_rates(history=None, db_path=None):
+    """Per-(Subsystem, WBS) cost per pound from a historical workbook or the local database (empty without either)"""
+    if history:
+        with open(history, "rb") as f:
+            return historical_rates(upload_worker.parse_workbook(f.read()))
+    if db_path and os.path.exists(db_path):
+        return _historical_rates_from_db(db_path)
+    return historical_rates({})
+
+
+class EstimateService:
+    """Reference data held in memory, request validation and the batched estimate evaluations"""
+
+    def __init__(self, rates=None, profiles=None):
+        self.profiles = {p.name: p for p in profiles} if profiles else {
+            name: amcm_calculator.load_profile(name) for name in amcm_calculator.list_profiles()}
+        self.years, self.year_to_index = reference_data.inflation_index()
+        self.headers = reference_data.subsystem_headers()
+        self.rates = rates if rates is not None else historical_rates({})
+        self.rate_keys = set(zip(self.rates["Subsystem"], self.rates["WBS"]))
+        self.amcm = Batcher(self.evaluate_amcm)
+        self.cost_analysis = Batcher(self.evaluate_cost_analysis)
+        self.started = time.time()
+
+    def reference(self):
+        default = self.profiles.get(amcm_calculator.DEFAULT_PROFILE_NAME) or next(iter(self.profiles.values()))
+        return {
+            "mission_types": [m.mission_type for m in default.models],
+            "difficulty_levels": DIFFICULTY_LEVELS,
+            "profiles": list(self.profiles),
+            "inflation_years": [int(y) for y in self.years],
+            "subsystems": list(self.headers),
+            "historical_subsystems": sorted(self.rates["Subsystem"].unique().tolist()),
+            "historical_wbs": len(self.rate_keys),
+        }
+
+    def stats(self):
+        return {"uptime_s": time.time() - self.started, "amcm": self.amcm.stats(), "cost_analysis": self.cost_analysis.stats()}
+
+    @staticmethod
+    def _number(value, name):
+        # Finite number of a request field ("nan", 1e400 and Infinity would give invalid JSON results)
+        value = float(value)
+        if not math.isfinite(value):
+            raise RequestError(f"'{name}' must be a finite number")
+        return value
+
+    @classmethod
+    def _integer(cls, value, name):
+        # Integral value of a request field (2.7 must not be truncated to 2)
+        value = cls._number(value, name)
+        if not value.is_integer():
+            raise RequestError(f"'{name}' must be an integer")
+        return int(value)
+
+    def _factor(self, item):
+        base_year = self._integer(item.get("base_year", DEFAULT_BASE_YEAR), "base_year")
+        target_year = self._integer(item.get("target_year", DEFAULT_TARGET_YEAR), "target_year")
+        for year in (base_year, target_year):
+            if year not in self.year_to_index:
+                raise RequestError(f"No inflation index for {year} (table covers {self.years[0]}-{self.years[-1]})")
+        return target_year, self.year_to_index[target_year] / self.year_to_index[base_year]
+
+    @classmethod
+    def _mass(cls, item, lbs_key, kg_key):
+        if lbs_key in item:
+            return cls._number(item[lbs_key], lbs_key)
+        if kg_key in item:
+            return cls._number(item[kg_key], kg_key) * LBS_PER_KG
+        raise RequestError(f"Missing '{lbs_key}' or '{kg_key}'")
+
+    def parse_amcm(self, item):
+        """(profile, quantity, weight, mission type index, IOC, block, difficulty index, target year, factor) of a request item"""
+        profile_name = item.get("profile", amcm_calculator.DEFAULT_PROFILE_NAME)
+        profile = self.profiles.get(profile_name)
+        if profile is None:
+            raise RequestError(f"Unknown profile '{profile_name}'")
+        mission_type = item.get("mission_type", 0)
+        mission_types = [m.mission_type for m in profile.models]
+        if isinstance(mission_type, str):
+            if mission_type not in mission_types:
+                raise RequestError(f"Unknown mission type '{mission_type}'")
+            mission_type = mission_types.index(mission_type)
+        difficulty = item.get("difficulty", 2)
+        if isinstance(difficulty, str):
+            if difficulty not in DIFFICULTY_LEVELS:
+                raise RequestError(f"Unknown difficulty '{difficulty}', expected one of {', '.join(DIFFICULTY_LEVELS)}")
+            difficulty = DIFFICULTY_LEVELS.index(difficulty)
+        values = (self._number(item.get("quantity", 1), "quantity"), self._mass(item, "weight_lbs", "weight_kg"),
+                  self._integer(mission_type, "mission_type"), self._number(item.get("ioc_year", DEFAULT_TARGET_YEAR), "ioc_year"),
+                  self._number(item.get("block_number", 1), "block_number"), self._integer(difficulty, "difficulty"))
+        quantity, weight, mission_type, ioc_year, block_number, difficulty = values
+        if quantity < 1 or weight <= 0 or block_number < 1:
+            raise RequestError("quantity and block_number must be at least 1 and the weight positive")
+        if not 0 <= mission_type < len(mission_types) or not 0 <= difficulty < len(DIFFICULTY_LEVELS):
+            raise RequestError("mission_type or difficulty out of range")
+        if not 1900 < ioc_year <= 2100:
+            raise RequestError("ioc_year must be between 1901 and 2100")
+        return (profile,) + values + self._factor(item)
+
+    def evaluate_amcm(self, items):
+        """Results of parsed AMCM items; one calculate_amcm_costs call per profile in the batch"""
+        costs = np.empty(len(items))
+        by_profile = {}
+        for i, item in enumerate(items):
+            by_profile.setdefault(item[0].name, []).append(i)
+        for positions in by_profile.values():
+            columns = list(zip(*(items[i][1:7] for i in positions)))
+            costs[positions] = amcm_calculator.calculate_amcm_costs(*map(np.asarray, columns), profile=items[positions[0]][0])
+        return [{"cost_base_musd": float(cost), "inflation_factor": item[8], "target_year": item[7],
+                 "cost_target_musd": float(cost * item[8])} for cost, item in zip(costs, items)]
+
+    def parse_cost_analysis(self, item):
+        """(subsystem, WBS, mass in lbs, target year, factor) of a request item"""
+        try:
+            subsystem, wbs = str(item["subsystem"]), str(item["wbs"])
+        except KeyError as e:
+            raise RequestError(f"Missing '{e.args[0]}'")
+        mass = self._mass(item, "mass_lbs", "mass_kg")
+        if mass < 0:
+            raise RequestError("The mass must not be negative")
+        return (subsystem, wbs, mass) + self._factor(item)
+
+    def evaluate_cost_analysis(self, items):
+        """Results of parsed Cost Analysis items with one merge against the historical rates"""
+        config = pd.DataFrame(items, columns=["Subsystem", "WBS", "Mass (lbs)", "Target Year", "Inflation Factor"])
+        detail = estimate_spacecraft(config, self.rates, config["Inflation Factor"].to_numpy())
+
+        def number(value):
+            return None if pd.isna(value) else float(value)
+
+        return [{
+            "dd_cost": number(row["D&D Cost"]),
+            "flight_unit_cost": number(row["Flight Unit Cost"]),
+            "total_cost": float(row["Total Cost"]),
+            "total_cost_target": float(row["Total Cost (escalated)"]),
+            "target_year": int(row["Target Year"]),
+            "inflation_factor": float(row["Inflation Factor"]),
+            "historical_count": int(row["Historical Count"]) if pd.notna(row["Historical Count"]) else 0,
+            "has_historical_data": bool(row["Has Historical Data"]),
+        } for row in detail.to_dict("records")]
+
+    async def handle(self, method, path, body):
+        """(status, JSON-serializable response) of a request"""
+        path = path.split("?")[0].rstrip("/") or "/"
+        if method == "GET":
+            if path == "/health":
+                return 200, {"status": "ok"}
+            if path == "/v1/reference":
+                return 200, self.reference()
+            if path == "/v1/stats":
+                return 200, self.stats()
+            return 404, {"error": f"Not found: {path}"}
+        if method != "POST":
+            return 405, {"error": f"Method {method} not allowed"}
+        endpoints = {"/v1/amcm": (self.parse_amcm, self.amcm), "/v1/cost-analysis": (self.parse_cost_analysis, self.cost_analysis)}
+        if path not in endpoints:
+            return 404, {"error": f"Not found: {path}"}
+        parse, batcher = endpoints[path]
+        try:
+            payload = json.loads(body or b"{}")
+            single = not (isinstance(payload, dict) and "items" in payload)
+            raw_items = [payload] if single else payload["items"]
+            if not isinstance(raw_items, list) or not all(isinstance(i, dict) for i in raw_items):
+                raise RequestError("Expected an estimate object or {\"items\": [objects]}")
+            items = []
+            for i, raw in enumerate(raw_items):
+                try:
+                    items.append(parse(raw))
+                except (TypeError, ValueError) as e:
+                    raise RequestError(str(e) if single else f"Item {i}: {e}")
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        results = await batcher.submit(items) if items else []
+        return 200, results[0] if single else {"results": results}
+
+
+async def _handle_connection(service, reader, writer):
+    # Minimal HTTP/1.1 with keep-alive: one request at a time per connection
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            try:
+                method, path, version = request_line.decode("latin-1").split()
+            except ValueError:
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+            try:
+                length = int(headers.get("content-length", 0))
+                if length < 0:
+                    raise ValueError
+            except ValueError:
+                # The end of the body is unknown, so the connection cannot be reused
+                status, response, keep_alive = 400, {"error": "Invalid Content-Length"}, False
+            else:
+                if length > MAX_BODY_BYTES:
+                    # Answer without reading (or buffering) the body, then close the connection
+                    status, response, keep_alive = 413, {"error": "Request body too large"}, False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    try:
+                        status, response = await service.handle(method.upper(), path, body)
+                    except Exception as e:
+                        status, response = 500, {"error": f"{type(e).__name__}: {e}"}
+            data = json.dumps(response).encode("utf-8")
+            writer.write(f"HTTP/1.1 {status} {http.client.responses.get(status, '')}\r\n"
+                         f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                         f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + data)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+        # Client gone or server shutting down
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(service, host=DEFAULT_HOST, port=DEFAULT_PORT, ready=None):
+    """Serve until cancelled; ready(server) is called once listening"""
+    server = await asyncio.start_server(lambda r, w: _handle_connection(service, r, w), host, port)
+    if ready is not None:
+        ready(server)
+    async with server:
+        await server.serve_forever()
+
+
+def serve_in_thread(service, host=DEFAULT_HOST, port=0):
+    """Start the service on a daemon thread (port 0 picks a free port); returns (host, port, stop)"""
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    bound = {}
+
+    def ready(server):
+        bound["port"] = server.sockets[0].getsockname()[1]
+        started.set()
+
+    task = loop.create_task(serve(service, host, port, ready))
+
+    def run():
+        # The loop is this thread's current loop (asyncio.gather and the streams look it up)
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            # Close the connections still open before the loop
+            handlers = asyncio.all_tasks(loop)
+            for handler in handlers:
+                handler.cancel()
+            if handlers:
+                loop.run_until_complete(asyncio.gather(*handlers, return_exceptions=True))
+            loop.close()
+
+    thread = threading.Thread(target=run, name="costspirits-service", daemon=True)
+    thread.start()
+    if not started.wait(10):
+        raise RuntimeError("Estimate service did not start")
+
+    def stop():
+        loop.call_soon_threadsafe(task.cancel)
+        thread.join(5)
+
+    return host, bound["port"], stop
+
+
+class EstimateClient:
+    """Blocking JSON client of the estimate service over one keep-alive connection (one per thread)"""
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=30):
+        self.connection = http.client.HTTPConnection(host, port, timeout=timeout)
+
+    def request(self, method, path, payload=None):
+        body = None if payload is None else json.dumps(payload)
+        self.connection.request(method, path, body, {"Content-Type": "application/json"})
+        response = self.connection.getresponse()
+        data = json.loads(response.read() or b"null")
+        if response.status != 200:
+            raise RuntimeError(f"{response.status}: {data.get('error') if isinstance(data, dict) else data}")
+        return data
+
+    def amcm(self, **inputs):
+        return self.request("POST", "/v1/amcm", inputs)
+
+    def cost_analysis(self, **inputs):
+        return self.request("POST", "/v1/cost-analysis", inputs)
+
+    def batch(self, path, items):
+        return self.request("POST", path, {"items": list(items)})["results"]
+
+    def reference(self):
+        return self.request("GET", "/v1/reference")
+
+    def stats(self):
+        return self.request("GET", "/v1/stats")
+
+    def close(self):
+        self.connection.close()
+
+
+def selftest(service, requests, concurrency, seed=0):
+    """Fire single-estimate requests from `concurrency` client threads at an in-process server and check them"""
+    host, port, stop = serve_in_thread(service)
+    rng = np.random.default_rng(seed)
+    inputs = [{"quantity": int(q), "weight_lbs": float(w), "mission_type": int(m), "ioc_year": int(y), "difficulty": int(d)}
+              for q, w, m, y, d in zip(rng.integers(1, 10, requests), rng.lognormal(7.0, 1.0, requests),
+                                       rng.integers(0, len(amcm_calculator.AMCM_MODELS), requests),
+                                       rng.integers(1990, 2030, requests), rng.integers(0, 5, requests))]
+    local = threading.local()
+
+    def call(item):
+        if not hasattr(local, "client"):
+            local.client = EstimateClient(host, port)
+        return local.client.amcm(**item)["cost_base_musd"]
+
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            costs = np.array(list(pool.map(call, inputs)))
+        elapsed = time.perf_counter() - start
+        columns = [np.array([item[k] for item in inputs]) for k in ("quantity", "weight_lbs", "mission_type", "ioc_year")]
+        expected = amcm_calculator.calculate_amcm_costs(*columns, 1, np.array([item["difficulty"] for item in inputs]))
+        stats = EstimateClient(host, port).stats()["amcm"]
+    finally:
+        stop()
+    print(f"{requests} requests from {concurrency} clients in {elapsed:.2f} s "
+          f"({requests / elapsed:,.0f} requests/s, {requests / elapsed * 60:,.0f} per minute)")
+    print(f"{stats['batches']} batches, {stats['mean_batch_items']:.1f} items per batch on average")
+    if not np.allclose(costs, expected, rtol=1e-12):
+        raise SystemExit("Service results differ from calculate_amcm_costs")
+    print("Results match calculate_amcm_costs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local JSON HTTP service for AMCM and Cost Analysis estimates")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--history", help="historical workbook for the Cost Analysis endpoint")
+    parser.add_argument("--db", default=history_db.DEFAULT_DB_PATH,
+                        help="local historical database used when no workbook is given")
+    parser.add_argument("--selftest", action="store_true", help="run concurrent requests against an in-process server and exit")
+    parser.add_argument("--requests", type=int, default=5000, help="requests of the self test")
+    parser.add_argument("--concurrency", type=int, default=32, help="client threads of the self test")
+    args = parser.parse_args()
+    service = EstimateService(load_historical_rates(args.history, args.db))
+    if args.selftest:
+        selftest(service, args.requests, args.concurrency)
+        return
+    reference = service.reference()
+    print(f"Serving estimates on http://{args.host}:{args.port} ({len(reference['profiles'])} AMCM profiles, "
+          f"{reference['historical_wbs']} historical WBS items)")
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+import json
+import os
+import sqlite3
+import threading
+import pandas as pd
+from cost_engine import AGGREGATE_COLS, find_mission_column, find_wbs_column
+
+# Local historical cost database (SQLite)
+# Holds the rows of the historical template workbooks keyed by subsystem (sheet), mission and WBS item,
+# so Cost Analysis can query and aggregate only the WBS items it needs instead of parsing the whole workbook.
+
+DEFAULT_DB_PATH = os.environ.get(
+    "COSTSPIRITS_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "costspirits_history.db")
+)
+
+# Template column -> database column for the numeric range columns
+NUMERIC_COLUMNS = {
+    "Lower Weight Range (lbs)": "lower_weight",
+    "Higher Weight Range (lbs)": "higher_weight",
+    "Lower D&D Cost Range": "lower_dd_cost",
+    "Higher D&D Cost Range": "higher_dd_cost",
+    "Lower Flight Unit Cost Range": "lower_fu_cost",
+    "Higher Flight Unit Cost Range": "higher_fu_cost",
+    "Lower Total Cost Range": "lower_total_cost",
+    "Higher Total Cost Range": "higher_total_cost",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history_records (
+    id INTEGER PRIMARY KEY,
+    subsystem TEXT NOT NULL,
+    mission TEXT,
+    wbs_item TEXT NOT NULL,
+    {numeric},
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_records_subsystem_wbs ON history_records (subsystem, wbs_item);
+CREATE INDEX IF NOT EXISTS idx_records_subsystem_mission ON history_records (subsystem, mission);
+CREATE TABLE IF NOT EXISTS wbs_aggregates (
+    subsystem TEXT NOT NULL,
+    wbs_item TEXT NOT NULL,
+    n_rows INTEGER NOT NULL,
+    {aggregates},
+    revision INTEGER NOT NULL,
+    PRIMARY KEY (subsystem, wbs_item)
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+""".format(
+    numeric=",\n    ".join(f"{col} REAL" for col in NUMERIC_COLUMNS.values()),
+    aggregates=",\n    ".join(f"sum_{NUMERIC_COLUMNS[col]} REAL NOT NULL, count_{NUMERIC_COLUMNS[col]} INTEGER NOT NULL"
+                             for col in AGGREGATE_COLS),
+)
+# Per-WBS running aggregates: row count plus sum and non-null count of each column used by the estimate.
+# Every write bumps the database version; the touched WBS groups get it as their revision,
+# so cached results only need to be invalidated for those groups.
+_AGGREGATE_DB_COLS = [NUMERIC_COLUMNS[col] for col in AGGREGATE_COLS]
+SUBSYSTEM_COLUMNS = ["Subsystem", "Rows", "Missions"]
+# Connections of the running script thread (sqlite3 connections cannot be shared across threads).
+# Streamlit runs every rerun on a new thread, so they are closed at the end of each run.
+_local = threading.local()
+
+
+def connect(path=None):
+    """Open (and create if needed) the historical database"""
+    conn = sqlite3.connect(path or DEFAULT_DB_PATH)
+    conn.executescript(_SCHEMA)
+    # Databases created before the aggregates table existed get it built once
+    has_records = conn.execute("SELECT EXISTS (SELECT 1 FROM history_records)").fetchone()[0]
+    has_aggregates = conn.execute("SELECT EXISTS (SELECT 1 FROM wbs_aggregates)").fetchone()[0]
+    if has_records and not has_aggregates:
+        with conn:
+            _update_aggregates(conn, "1", [], _next_version(conn))
+    return conn
+
+
+def shared_connection(path=None, create=False):
+    """
+    This thread's connection to the historical database, opened on first use and reused until
+    close_shared_connections() is called at the end of the run.
+
+    Returns None while the database file does not exist, unless create is set.
+    """
+    path = path or DEFAULT_DB_PATH
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    if path not in connections:
+        if not create and not os.path.exists(path):
+            return None
+        connections[path] = connect(path)
+    return connections[path]
+
+
+def close_shared_connections():
+    """Close the connections opened by shared_connection() on this thread"""
+    connections = getattr(_local, "connections", None) or {}
+    _local.connections = {}
+    for conn in connections.values():
+        conn.close()
+
+
+def _next_version(conn):
+    # Bump and return the database version (called inside a write transaction)
+    conn.execute("INSERT INTO meta (key, value) VALUES ('version', 1) "
+                 "ON CONFLICT (key) DO UPDATE SET value = value + 1")
+    return conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+
+def _update_aggregates(conn, where, params, version):
+    # Add the aggregates of the history_records rows matching `where` onto wbs_aggregates
+    sum_cols = ", ".join(f"sum_{c}, count_{c}" for c in _AGGREGATE_DB_COLS)
+    select = ", ".join(f"TOTAL({c}), COUNT({c})" for c in _AGGREGATE_DB_COLS)
+    update = ", ".join(f"sum_{c} = sum_{c} + excluded.sum_{c}, count_{c} = count_{c} + excluded.count_{c}"
+                       for c in _AGGREGATE_DB_COLS)
+    conn.execute(
+        f"INSERT INTO wbs_aggregates (subsystem, wbs_item, n_rows, {sum_cols}, revision) "
+        f"SELECT subsystem, wbs_item, COUNT(*), {select}, ? FROM history_records WHERE {where} "
+        "GROUP BY subsystem, wbs_item "
+        f"ON CONFLICT (subsystem, wbs_item) DO UPDATE SET n_rows = n_rows + excluded.n_rows, {update}, "
+        "revision = excluded.revision",
+        [version] + list(params)
+    )
+
+
+def _sheet_records(subsystem, df):
+    # Rows of one template sheet as tuples in history_records column order
+    wbs_col = find_wbs_column(df)
+    if wbs_col is None:
+        return []
+    mission_col = find_mission_column(df)
+    df = df[df[wbs_col].notna()]
+    extra_cols = [c for c in df.columns if c not in NUMERIC_COLUMNS and c not in (wbs_col, mission_col)]
+    numeric = pd.DataFrame({col: pd.to_numeric(df[col], errors='coerce') if col in df.columns else None
+                            for col in NUMERIC_COLUMNS}, index=df.index).astype(object)
+    numeric = numeric.where(numeric.notna(), None)
+    missions = df[mission_col].astype(str).where(df[mission_col].notna(), None) if mission_col != wbs_col else [None] * len(df)
+    extras = ([json.dumps({c: (None if pd.isna(v) else str(v)) for c, v in zip(extra_cols, row)})
+               for row in df[extra_cols].itertuples(index=False)] if extra_cols else [None] * len(df))
+    return [(subsystem, mission, str(wbs), *values, extra)
+            for mission, wbs, values, extra in zip(missions, df[wbs_col], numeric.itertuples(index=False), extras)]
+
+
+def insert_sheets(conn, sheets, replace=True):
+    """
+    Insert template sheets ({subsystem: DataFrame}) in one transaction.
+
+    replace=True deletes the existing rows of each imported subsystem first.
+    The per-WBS aggregates are updated from the inserted rows only (O(new rows)).
+    Returns the number of rows inserted per subsystem.
+    """
+    placeholders = ", ".join("?" * (4 + len(NUMERIC_COLUMNS)))
+    columns = ", ".join(["subsystem", "mission", "wbs_item"] + list(NUMERIC_COLUMNS.values()) + ["extra"])
+    inserted = {}
+    with conn:
+        version = _next_version(conn)
+        if replace:
+            for subsystem in sheets:
+                conn.execute("DELETE FROM history_records WHERE subsystem = ?", (subsystem,))
+                conn.execute("DELETE FROM wbs_aggregates WHERE subsystem = ?", (subsystem,))
+        # Taken after the deletes: freed rowids at the top of the table are reused by the new rows
+        first_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM history_records").fetchone()[0]
+        for subsystem, df in sheets.items():
+            records = _sheet_records(subsystem, df)
+            conn.executemany(f"INSERT INTO history_records ({columns}) VALUES ({placeholders})", records)
+            inserted[subsystem] = len(records)
+        _update_aggregates(conn, "id >= ?", [first_id], version)
+    return inserted
+
+
+def append_sheets(conn, sheets):
+    """
+    Append the rows of new missions ({subsystem: DataFrame} in the template format) to the store.
+
+    Returns {subsystem: [WBS items whose aggregates changed]}.
+    """
+    inserted = insert_sheets(conn, sheets, replace=False)
+    version = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+    affected = {}
+    for subsystem, count in inserted.items():
+        if count:
+            rows = conn.execute("SELECT wbs_item FROM wbs_aggregates WHERE subsystem = ? AND revision = ? "
+                                "ORDER BY wbs_item", (subsystem, version))
+            affected[subsystem] = [r[0] for r in rows]
+    return affected
+
+
+def append_workbook(conn, file):
+    """Append every sheet of a small template workbook (path or file object) with new missions"""
+    return append_sheets(conn, pd.read_excel(file, sheet_name=None))
+
+
+def existing_missions(conn, sheets):
+    """Missions of the given template sheets that are already in the store, per subsystem"""
+    found = {}
+    for subsystem, df in sheets.items():
+        mission_col = find_mission_column(df)
+        if mission_col is None:
+            continue
+        missions = [str(m) for m in df[mission_col].dropna().unique()]
+        if not missions:
+            continue
+        rows = conn.execute(
+            f"SELECT DISTINCT mission FROM history_records WHERE subsystem = ? AND mission IN ({', '.join('?' * len(missions))})",
+            [subsystem] + missions
+        )
+        duplicates = sorted(r[0] for r in rows)
+        if duplicates:
+            found[subsystem] = duplicates
+    return found
+
+
+def import_workbook(conn, file, replace=True):
+    """Import every sheet of a template workbook (path or file object)"""
+    return insert_sheets(conn, pd.read_excel(file, sheet_name=None), replace=replace)
+
+
+def list_subsystems(conn):
+    """Subsystems in the database (in import order) with their row and mission counts (none without a connection)"""
+    if conn is None:
+        return pd.DataFrame(columns=SUBSYSTEM_COLUMNS)
+    return pd.read_sql_query(
+        "SELECT subsystem AS Subsystem, COUNT(*) AS Rows, COUNT(DISTINCT mission) AS Missions "
+        "FROM history_records GROUP BY subsystem ORDER BY MIN(id)", conn
+    )
+
+
+def list_wbs(conn, subsystem):
+    """Sorted distinct WBS items of a subsystem"""
+    rows = conn.execute("SELECT DISTINCT wbs_item FROM history_records WHERE subsystem = ? ORDER BY wbs_item", (subsystem,))
+    return [r[0] for r in rows]
+
+
+def _mapping_cte(wbs_analysis_map):
+    # Inline VALUES table mapping original WBS names to the analysed (merged) WBS
+    items = list(wbs_analysis_map.items())
+    values = ", ".join(["(?, ?)"] * len(items))
+    return f"WITH wbs_map (wbs_item, mapped) AS (VALUES {values})", [str(v) for pair in items for v in pair]
+
+
+def query_wbs_aggregates(conn, subsystem, wbs_analysis_map):
+    """
+    Grouped sums and counts per mapped WBS, combined from the stored per-WBS aggregates.
+
+    Same (sums, counts, rows) format as cost_engine.merged_wbs_aggregates.
+    """
+    if not wbs_analysis_map:
+        empty = pd.DataFrame(columns=AGGREGATE_COLS, dtype=float).rename_axis("WBS")
+        return empty, empty.copy(), pd.Series(dtype=int).rename_axis("WBS")
+    cte, params = _mapping_cte(wbs_analysis_map)
+    select = ", ".join([f"SUM(a.sum_{c}) AS sum_{c}, SUM(a.count_{c}) AS count_{c}" for c in _AGGREGATE_DB_COLS])
+    result = pd.read_sql_query(
+        f"{cte} SELECT m.mapped AS WBS, SUM(a.n_rows) AS n_rows, {select} "
+        "FROM wbs_aggregates a JOIN wbs_map m ON a.wbs_item = m.wbs_item "
+        "WHERE a.subsystem = ? GROUP BY m.mapped",
+        conn, params=params + [subsystem]
+    ).set_index("WBS")
+    sums = pd.DataFrame({col: result[f"sum_{c}"] for col, c in zip(AGGREGATE_COLS, _AGGREGATE_DB_COLS)}, dtype=float)
+    counts = pd.DataFrame({col: result[f"count_{c}"] for col, c in zip(AGGREGATE_COLS, _AGGREGATE_DB_COLS)})
+    return sums, counts, result["n_rows"]
+
+
+def wbs_revisions(conn, subsystem, wbs_items):
+    """Revision of each given WBS item's aggregates ({wbs: revision}; missing items are left out)"""
+    wbs_items = [str(w) for w in wbs_items]
+    if not wbs_items:
+        return {}
+    rows = conn.execute(
+        f"SELECT wbs_item, revision FROM wbs_aggregates WHERE subsystem = ? AND wbs_item IN ({', '.join('?' * len(wbs_items))})",
+        [subsystem] + wbs_items
+    )
+    return dict(rows.fetchall())
+
+
+def query_wbs_rows(conn, subsystem, wbs_items):
+    """Rows of the given WBS items of a subsystem, with the template column names"""
+    wbs_items = [str(w) for w in wbs_items]
+    if not wbs_items:
+        return pd.DataFrame(columns=["Mission", "WBS Item"] + list(NUMERIC_COLUMNS))
+    select = ", ".join(f'{c} AS "{col}"' for col, c in NUMERIC_COLUMNS.items())
+    return pd.read_sql_query(
+        f'SELECT mission AS "Mission", wbs_item AS "WBS Item", {select} FROM history_records '
+        f"WHERE subsystem = ? AND wbs_item IN ({', '.join('?' * len(wbs_items))}) ORDER BY id",
+        conn, params=[subsystem] + wbs_items
+    )
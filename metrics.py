@@ -0,0 +1,205 @@
+import bisect
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import profiling
+import upload_worker
+
+# Prometheus metrics endpoint for monitoring a deployment
+# Finished reruns recorded by profiling.py and background upload parses are turned into latency
+# histograms and cache counters.
+# A daemon thread in the Streamlit process serves them in the Prometheus text format on
+# http://<host>:COSTSPIRITS_METRICS_PORT/metrics (not started when the variable is unset):
+#   COSTSPIRITS_METRICS_PORT=9464 streamlit run CostSpirits.py
+#   curl http://localhost:9464/metrics
+
+METRICS_PORT = os.environ.get("COSTSPIRITS_METRICS_PORT")
+METRICS_HOST = os.environ.get("COSTSPIRITS_METRICS_HOST", "127.0.0.1")
+# A session counts as active if it had a rerun within this many seconds
+ACTIVE_SESSION_WINDOW = 300
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_server = None
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name, self.help, self.label_names = name, help_text, tuple(labels)
+        self.values = {}
+
+    def inc(self, amount=1.0, *label_values):
+        with _lock:
+            self.values[label_values] = self.values.get(label_values, 0.0) + amount
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with _lock:
+            items = list(self.values.items())
+        for label_values, value in sorted(items):
+            lines.append(f"{self.name}{_labels(self.label_names, label_values)} {value}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, help_text, collect):
+        self.name, self.help, self.collect = name, help_text, collect
+
+    def expose(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {self.collect()}"]
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.label_names = name, help_text, tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}
+
+    def observe(self, value, *label_values):
+        with _lock:
+            counts, total = self.values.get(label_values, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[label_values] = (counts, total + value)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with _lock:
+            # observe() increments the bucket counts in place; copy them with their sum
+            items = [(label_values, (list(counts), total)) for label_values, (counts, total) in self.values.items()]
+        for label_values, (counts, total) in sorted(items):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.label_names + ('le',), label_values + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, label_values)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, label_values)} {cumulative}")
+        return lines
+
+
+def process_rss_bytes():
+    """Current resident set size of the process (peak RSS where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        try:
+            import resource
+        except ImportError:
+            return 0
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+
+
+_session_seen = {}
+
+
+def active_sessions():
+    """Sessions with a rerun in the last ACTIVE_SESSION_WINDOW seconds"""
+    cutoff = time.time() - ACTIVE_SESSION_WINDOW
+    with _lock:
+        for session_id in [s for s, seen in _session_seen.items() if seen < cutoff]:
+            del _session_seen[session_id]
+        return len(_session_seen)
+
+
+RERUN_SECONDS = Histogram("costspirits_rerun_duration_seconds", "Wall time of a full script rerun", ("app", "page"))
+PARSE_SECONDS = Histogram("costspirits_upload_parse_duration_seconds", "Wall time of parsing an uploaded historical workbook")
+EXPORT_SECONDS = Histogram("costspirits_export_duration_seconds", "Wall time of building an Excel export", ("export",))
+UPLOADED_BYTES = Counter("costspirits_uploaded_bytes_total", "Bytes of uploaded historical workbooks")
+CACHE_REQUESTS = Counter("costspirits_cache_requests_total", "Cache lookups by cache and result", ("cache", "result"))
+RERUNS = Counter("costspirits_reruns_total", "Script reruns", ("app", "page"))
+METRICS = [
+    RERUN_SECONDS, PARSE_SECONDS, EXPORT_SECONDS, UPLOADED_BYTES, CACHE_REQUESTS, RERUNS,
+    Gauge("costspirits_active_sessions", f"Sessions with a rerun in the last {ACTIVE_SESSION_WINDOW} s", active_sessions),
+    Gauge("process_resident_memory_bytes", "Resident memory size in bytes", process_rss_bytes),
+]
+# Profiling stages reported as export durations
+EXPORT_STAGES = {"export workbook": "cost analysis", "portfolio export": "portfolio"}
+
+
+def observe_run(record):
+    """profiling listener: turn a finished rerun record into metrics"""
+    page = record["page"] or ""
+    RERUN_SECONDS.observe(record["total_ms"] / 1000, record["app"], page)
+    RERUNS.inc(1, record["app"], page)
+    for name, values in record["cache"].items():
+        if values["hits"]:
+            CACHE_REQUESTS.inc(values["hits"], name, "hit")
+        if values["misses"]:
+            CACHE_REQUESTS.inc(values["misses"], name, "miss")
+    for stage_name, export in EXPORT_STAGES.items():
+        if stage_name in record["stages"]:
+            EXPORT_SECONDS.observe(record["stages"][stage_name]["ms"] / 1000, export)
+    session_id = record.get("session")
+    if session_id:
+        with _lock:
+            _session_seen[session_id] = time.time()
+
+
+def observe_parse(job):
+    """upload_worker listener: duration of a finished background parse"""
+    if job.error is None:
+        PARSE_SECONDS.observe(job.duration)
+
+
+def record_upload(size):
+    """Count the bytes of a newly uploaded workbook"""
+    UPLOADED_BYTES.inc(float(size))
+
+
+def exposition():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.expose())
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = exposition().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port, host=METRICS_HOST):
+    """Serve /metrics from a daemon thread (once per process); returns the server"""
+    global _server
+    with _lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="costspirits-metrics", daemon=True).start()
+    return _server
+
+
+def install():
+    """Subscribe to finished reruns and parses and start the endpoint if COSTSPIRITS_METRICS_PORT is set"""
+    profiling.add_listener(observe_run)
+    upload_worker.add_listener(observe_parse)
+    if METRICS_PORT and _server is None:
+        try:
+            start_server(METRICS_PORT)
+        except OSError:
+            # Port taken (e.g. another server process); the app itself keeps working
+            pass
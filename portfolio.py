@@ -0,0 +1,121 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from cost_engine import combine_groups, find_wbs_column, group_sums, numeric_columns, wbs_rates
+
+# Portfolio mode: estimate many spacecraft (point designs) against the same historical workbook
+# The per-WBS cost-per-pound rates are computed once and shared with every worker process;
+# spacecraft are then estimated in chunks with one vectorized merge per chunk.
+
+PORTFOLIO_COLUMNS = ["Spacecraft", "Subsystem", "WBS", "Mass (lbs)"]
+# Portfolios smaller than this are estimated in-process
+PARALLEL_MIN_SPACECRAFT = 200
+
+_worker_rates = None
+
+
+def historical_rates(sheets, merge_groups=None):
+    """
+    Cost per pound of every (Subsystem, WBS) in the historical workbook ({sheet name: DataFrame}).
+
+    merge_groups: {sheet: {group name: [original WBS, ...]}} as created on the Cost Analysis page
+    """
+    frames = []
+    for sheet, df in sheets.items():
+        wbs_col = find_wbs_column(df)
+        if wbs_col is None:
+            continue
+        sums, counts, rows = group_sums(numeric_columns(df), df[wbs_col].rename("WBS"))
+        groups = (merge_groups or {}).get(sheet, {})
+        if groups:
+            mapping = {wbs: wbs for wbs in rows.index}
+            for group_name, members in groups.items():
+                for wbs in members:
+                    mapping[wbs] = group_name
+            sums, counts, rows = combine_groups(sums, counts, rows, mapping)
+        rates = wbs_rates(sums, counts)[["D&D Cost per lbs", "Flight Unit Cost per lbs"]].copy()
+        rates["Historical Count"] = rows
+        frames.append(rates.reset_index().assign(Subsystem=sheet))
+    if not frames:
+        # Typed like a filled table, so estimates against it stay numeric
+        return pd.DataFrame({"Subsystem": pd.Series(dtype=object), "WBS": pd.Series(dtype=object),
+                             "D&D Cost per lbs": pd.Series(dtype=float), "Flight Unit Cost per lbs": pd.Series(dtype=float),
+                             "Historical Count": pd.Series(dtype="int64")})
+    return pd.concat(frames, ignore_index=True)
+
+
+def portfolio_template(rates, spacecraft=("Design 1",)):
+    """Empty portfolio table with one row per spacecraft and historical (Subsystem, WBS)"""
+    base = rates[["Subsystem", "WBS"]]
+    return pd.concat([base.assign(Spacecraft=name, **{"Mass (lbs)": 0.0}) for name in spacecraft],
+                     ignore_index=True)[PORTFOLIO_COLUMNS]
+
+
+def prepare_portfolio(df):
+    """Validate a portfolio table and return it with a numeric 'Mass (lbs)' column ('Mass (kg)' is converted)"""
+    df = df.copy()
+    if "Mass (lbs)" not in df.columns and "Mass (kg)" in df.columns:
+        df["Mass (lbs)"] = pd.to_numeric(df["Mass (kg)"], errors='coerce') * 2.20462
+    missing = [col for col in PORTFOLIO_COLUMNS if col not in df.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    df = df[PORTFOLIO_COLUMNS].dropna(subset=["Spacecraft", "Subsystem", "WBS"])
+    df["Mass (lbs)"] = pd.to_numeric(df["Mass (lbs)"], errors='coerce').fillna(0.0)
+    df["Spacecraft"] = df["Spacecraft"].astype(str)
+    return df.reset_index(drop=True)
+
+
+def estimate_spacecraft(config, rates, inflation_factor=1.0):
+    """Per-WBS estimates for any number of spacecraft with one merge against the historical rates"""
+    detail = config.merge(rates, on=["Subsystem", "WBS"], how="left")
+    mass = detail["Mass (lbs)"]
+    detail["D&D Cost"] = detail["D&D Cost per lbs"] * mass
+    detail["Flight Unit Cost"] = detail["Flight Unit Cost per lbs"] * mass
+    detail["Total Cost"] = detail["D&D Cost"].fillna(0) + detail["Flight Unit Cost"].fillna(0)
+    detail["Total Cost (escalated)"] = detail["Total Cost"] * inflation_factor
+    detail["Has Historical Data"] = detail["Historical Count"].fillna(0) > 0
+    return detail
+
+
+def _init_worker(rates):
+    global _worker_rates
+    _worker_rates = rates
+
+
+def _estimate_chunk(args):
+    config, inflation_factor = args
+    return estimate_spacecraft(config, _worker_rates, inflation_factor)
+
+
+def run_portfolio(config, rates, inflation_factor=1.0, max_workers=None):
+    """
+    Estimate every spacecraft of a portfolio table.
+
+    Large portfolios are split by spacecraft across a process pool; the rates table is sent to each
+    worker once through the pool initializer rather than with every chunk.
+    """
+    names = config["Spacecraft"].unique()
+    workers = min(max_workers or os.cpu_count() or 1, len(names))
+    if workers <= 1 or len(names) < PARALLEL_MIN_SPACECRAFT:
+        return estimate_spacecraft(config, rates, inflation_factor)
+    chunks = [config[config["Spacecraft"].isin(chunk)] for chunk in np.array_split(names, workers * 4)]
+    # Spawned, not forked, from the multi-threaded Streamlit server (see xlsx_export._render_pool)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=(rates,)) as pool:
+        frames = list(pool.map(_estimate_chunk, [(chunk, inflation_factor) for chunk in chunks]))
+    return pd.concat(frames, ignore_index=True)
+
+
+def comparison_table(detail, target_year):
+    """One row per spacecraft: total cost per subsystem, program totals and delta to the cheapest design"""
+    table = detail.pivot_table(index="Spacecraft", columns="Subsystem", values="Total Cost", aggfunc="sum", fill_value=0.0, sort=False)
+    table.columns = [f"{c} (ref yr)" for c in table.columns]
+    table["Total Cost (ref yr)"] = table.sum(axis=1)
+    escalated = detail.groupby("Spacecraft", sort=False)["Total Cost (escalated)"].sum()
+    table[f"Total Cost ({target_year})"] = escalated.reindex(table.index)
+    table[f"Delta vs. Cheapest ({target_year})"] = table[f"Total Cost ({target_year})"] - table[f"Total Cost ({target_year})"].min()
+    table["Total Mass (lbs)"] = detail.groupby("Spacecraft", sort=False)["Mass (lbs)"].sum().reindex(table.index)
+    table["WBS Without History"] = (~detail["Has Historical Data"]).groupby(detail["Spacecraft"], sort=False).sum().reindex(table.index)
+    return table.reset_index()
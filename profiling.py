@@ -0,0 +1,206 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+import pandas as pd
+import streamlit as st
+
+# Stage-level timing of Streamlit reruns
+# A rerun is bracketed by start_run()/finish_run(); stage() blocks, @timed functions and cached()
+# cache lookups inside it add wall time, call counts and cache hits/misses to the rerun's record.
+# Outside a rerun (scripts, benchmarks) the hooks only call through.
+# Finished reruns are kept per session (last PROFILE_RUNS) for the sidebar panel and appended as
+# JSON lines to PROFILE_LOG when COSTSPIRITS_PROFILE_LOG is set or the panel is switched on.
+
+PROFILE_RUNS = int(os.environ.get("COSTSPIRITS_PROFILE_RUNS", 20))
+PROFILE_LOG = os.environ.get("COSTSPIRITS_PROFILE_LOG") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "costspirits_profile.jsonl")
+_LOG_ALWAYS = bool(os.environ.get("COSTSPIRITS_PROFILE_LOG"))
+_HISTORY_KEY = "_profile_history"
+
+_local = threading.local()
+_log_lock = threading.Lock()
+# Callbacks receiving every finished rerun record (e.g. the metrics exporter)
+_listeners = []
+
+
+def _current():
+    return getattr(_local, "run", None)
+
+
+def start_run(app):
+    """Begin recording a rerun of the given app"""
+    ctx = st.runtime.scriptrunner.get_script_run_ctx()
+    _local.run = {"app": app, "page": None, "session": ctx.session_id if ctx is not None else None,
+                  "started": time.perf_counter(), "time": datetime.now().isoformat(timespec='seconds'), "stages": {}, "cache": {}}
+
+
+def set_page(page):
+    """Label the current rerun with the page being rendered"""
+    run = _current()
+    if run is not None:
+        run["page"] = page
+
+
+def record_stage(name, seconds):
+    """Add wall time and one call to a stage of the current rerun"""
+    run = _current()
+    if run is None:
+        return
+    entry = run["stages"].setdefault(name, [0.0, 0])
+    entry[0] += seconds
+    entry[1] += 1
+
+
+def record_cache(name, hit):
+    """Count a cache hit or miss in the current rerun"""
+    run = _current()
+    if run is None:
+        return
+    entry = run["cache"].setdefault(name, [0, 0])
+    entry[0 if hit else 1] += 1
+
+
+@contextmanager
+def stage(name):
+    """Time a block as a named stage of the current rerun"""
+    if _current() is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def timed(name):
+    """Decorator timing every call of a function as a stage"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current() is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record_stage(name, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def cached(cache_decorator, name):
+    """
+    Apply a Streamlit cache decorator (st.cache_data(...) / st.cache_resource(...)) and count hits and misses.
+
+    A call is a miss when the wrapped function body actually runs.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def body(*args, **kwargs):
+            _local.cache_miss = True
+            return func(*args, **kwargs)
+        cached_func = cache_decorator(body)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            _local.cache_miss = False
+            start = time.perf_counter()
+            result = cached_func(*args, **kwargs)
+            record_cache(name, not _local.cache_miss)
+            record_stage(f"cache: {name}", time.perf_counter() - start)
+            return result
+        wrapper.clear = cached_func.clear
+        return wrapper
+    return decorate
+
+
+def add_listener(callback):
+    """Register a callback called with every finished rerun record"""
+    if callback not in _listeners:
+        _listeners.append(callback)
+
+
+def finish_run():
+    """Close the current rerun, store it in the session history and log it; returns the record"""
+    run = _current()
+    if run is None:
+        return None
+    _local.run = None
+    record = {
+        "time": run["time"],
+        "app": run["app"],
+        "page": run["page"],
+        "session": run["session"],
+        "total_ms": (time.perf_counter() - run["started"]) * 1000,
+        "stages": {name: {"ms": seconds * 1000, "calls": calls} for name, (seconds, calls) in run["stages"].items()},
+        "cache": {name: {"hits": hits, "misses": misses} for name, (hits, misses) in run["cache"].items()},
+    }
+    try:
+        history = st.session_state.setdefault(_HISTORY_KEY, deque(maxlen=PROFILE_RUNS))
+        history.append(record)
+        log = _LOG_ALWAYS or st.session_state.get("show_profiling", False)
+    except Exception:
+        # No session (bare script run)
+        log = _LOG_ALWAYS
+    if log:
+        with _log_lock, open(PROFILE_LOG, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    for callback in _listeners:
+        callback(record)
+    return record
+
+
+def stage_summary(history):
+    """Mean/max wall time and calls per stage over the given rerun records"""
+    rows = [{"Stage": name, "ms": values["ms"], "Calls": values["calls"]}
+            for record in history for name, values in record["stages"].items()]
+    if not rows:
+        return pd.DataFrame(columns=["Stage", "Reruns", "Mean ms", "Max ms", "Last ms", "Calls/rerun"])
+    df = pd.DataFrame(rows)
+    last = {name: values["ms"] for name, values in history[-1]["stages"].items()}
+    grouped = df.groupby("Stage", sort=False)
+    summary = pd.DataFrame({
+        "Reruns": grouped.size(),
+        "Mean ms": grouped["ms"].mean(),
+        "Max ms": grouped["ms"].max(),
+        "Calls/rerun": grouped["Calls"].mean(),
+    })
+    summary["Last ms"] = summary.index.map(last)
+    return summary.reset_index().sort_values("Mean ms", ascending=False, ignore_index=True)[
+        ["Stage", "Reruns", "Mean ms", "Max ms", "Last ms", "Calls/rerun"]]
+
+
+def cache_summary(history):
+    """Hits, misses and hit rate per cache over the given rerun records"""
+    totals = {}
+    for record in history:
+        for name, values in record["cache"].items():
+            entry = totals.setdefault(name, [0, 0])
+            entry[0] += values["hits"]
+            entry[1] += values["misses"]
+    return pd.DataFrame([{"Cache": name, "Hits": hits, "Misses": misses, "Hit rate %": 100.0 * hits / (hits + misses)}
+                         for name, (hits, misses) in totals.items()],
+                        columns=["Cache", "Hits", "Misses", "Hit rate %"])
+
+
+def render_panel():
+    """Sidebar panel with per-stage timings and cache hit rates of the last reruns"""
+    if not st.sidebar.checkbox("Show profiling panel", key="show_profiling"):
+        return
+    history = list(st.session_state.get(_HISTORY_KEY, []))
+    if not history:
+        st.sidebar.caption("No reruns recorded yet.")
+        return
+    last = history[-1]
+    st.sidebar.caption(f"Last rerun: {last['total_ms']:.0f} ms ({last['page'] or last['app']}). "
+                       f"Statistics over the last {len(history)} reruns; nested stages overlap. Log: {PROFILE_LOG}")
+    st.sidebar.dataframe(stage_summary(history), hide_index=True, use_container_width=True)
+    caches = cache_summary(history)
+    if not caches.empty:
+        st.sidebar.dataframe(caches, hide_index=True, use_container_width=True)
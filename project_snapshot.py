@@ -0,0 +1,171 @@
+import gzip
+import json
+import re
+from datetime import datetime
+import pandas as pd
+
+# Project snapshots: the analysis inputs of a session saved as one gzip-compressed JSON file
+# A snapshot holds the Cost Analysis and Scenarios inputs (widget values such as WBS selections, masses,
+# units and years, plus merge groups and currency choices), the SHA-1 and name of the historical
+# workbook they refer to and, optionally, the computed result tables. Inputs are also mirrored in the
+# session after every rerun, so values of widgets on other pages (which Streamlit forgets when they
+# are not rendered) are kept for the snapshot and put back when their page is shown again.
+# Restoring sets all keys before any widget is created in one rerun; nothing is recomputed, and the
+# workbook parse is found again by its content hash when the same file is uploaded.
+# The input widgets therefore take their defaults from session state (st.session_state.setdefault
+# before the widget) instead of value=/index= arguments, which would conflict with restored values.
+
+SNAPSHOT_FORMAT = "costspirits-project"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_EXTENSION = ".costspirits.json.gz"
+# Widget keys of the analysis inputs (buttons, uploaders and data editors cannot be set and are left out,
+# chart sliders are views of the results)
+INPUT_KEY_PATTERNS = [re.compile(p) for p in (
+    r".+_wbs_.+",
+    r"mass_(?!slider_).+",
+    r"(unit|total_mass|base_year|target_year|merge_threshold|breakdown_select)_.+",
+    r"(lc|phasing)_(enable|method|slope|quantity|trade|dd_start|dd_end|fu_start|fu_end|profile|alpha|beta|ramp_up|ramp_down)_.+",
+    r"currencies|currency_rate_mode|data_source|scenario_data_source",
+)]
+# Plain session state saved as is
+STATE_KEYS = ["wbs_merge_groups", "currency_params", "export_currencies"]
+# Session state DataFrames (scenario masses are indexed by subsystem and WBS)
+FRAME_KEYS = {"scenario_masses": ["Subsystem", "WBS"]}
+# Computed {sheet: DataFrame} results, saved on request
+RESULT_KEYS = ["subsystem_results", "phasing_results"]
+_MIRROR_KEY = "_project_inputs"
+_PENDING_KEY = "_pending_snapshot"
+PROJECT_KEY = "_project_upload"
+
+
+def is_input_key(key):
+    return isinstance(key, str) and any(p.fullmatch(key) for p in INPUT_KEY_PATTERNS)
+
+
+def remember_inputs(session_state):
+    """Mirror the current input widget values into plain session state (call at the end of a rerun)"""
+    mirror = session_state.setdefault(_MIRROR_KEY, {})
+    for key in list(session_state.keys()):
+        if is_input_key(key):
+            mirror[key] = session_state[key]
+
+
+def restore_inputs(session_state):
+    """Apply a pending snapshot and put back mirrored inputs whose widgets were not rendered (call before any widget)"""
+    pending = session_state.get(_PENDING_KEY)
+    if pending is not None:
+        del session_state[_PENDING_KEY]
+        _apply(session_state, pending)
+    for key, value in session_state.get(_MIRROR_KEY, {}).items():
+        if key not in session_state:
+            session_state[key] = value
+
+
+def _json_default(value):
+    # numpy scalars (e.g. years of the inflation table) and tuples
+    if hasattr(value, "item"):
+        return value.item()
+    if isinstance(value, tuple):
+        return list(value)
+    raise TypeError(f"Cannot save {type(value).__name__} in a project snapshot")
+
+
+def _frame_to_json(df):
+    # Column-wise lists keep every float exactly (Python's shortest repr); dtypes are restored on load
+    return {
+        "columns": [c.item() if hasattr(c, "item") else c for c in df.columns],
+        "index": None if isinstance(df.index, pd.RangeIndex) else df.index.tolist(),
+        "data": [df.iloc[:, i].tolist() for i in range(df.shape[1])],
+        "dtypes": [str(t) for t in df.dtypes],
+    }
+
+
+def _frame_from_json(data):
+    df = pd.DataFrame(dict(enumerate(data["data"])), index=data["index"])
+    df = df.astype(dict(enumerate(data["dtypes"])))
+    df.columns = data["columns"]
+    return df
+
+
+def snapshot_bytes(session_state, upload=None, results=None):
+    """
+    gzip-compressed JSON snapshot of the session's analysis inputs.
+
+    upload: {"name", "sha1", "size"} of the historical workbook; results: {key: {sheet: DataFrame}}
+    of RESULT_KEYS to include (None saves the inputs only).
+    """
+    inputs = dict(session_state.get(_MIRROR_KEY, {}))
+    inputs.update({key: session_state[key] for key in list(session_state.keys()) if is_input_key(key)})
+    frames = {}
+    for key, index in FRAME_KEYS.items():
+        df = session_state.get(key)
+        if isinstance(df, pd.DataFrame):
+            frames[key] = _frame_to_json(df.reset_index() if index else df)
+    snapshot = {
+        "format": SNAPSHOT_FORMAT,
+        "version": SNAPSHOT_VERSION,
+        "created": datetime.now().isoformat(timespec='seconds'),
+        "upload": upload,
+        "inputs": inputs,
+        "state": {key: session_state[key] for key in STATE_KEYS if key in session_state},
+        "frames": frames,
+        "results": {key: {sheet: _frame_to_json(df) for sheet, df in tables.items()}
+                    for key, tables in (results or {}).items() if tables},
+    }
+    return gzip.compress(json.dumps(snapshot, default=_json_default, separators=(",", ":")).encode("utf-8"))
+
+
+def load_snapshot(data):
+    """Parse snapshot bytes; raises ValueError if they are not a supported project snapshot"""
+    try:
+        snapshot = json.loads(gzip.decompress(data) if data[:2] == b"\x1f\x8b" else data)
+    except (OSError, ValueError) as e:
+        raise ValueError(f"Not a project snapshot: {e}")
+    if not isinstance(snapshot, dict) or snapshot.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError("Not a CostSpirits project snapshot")
+    if snapshot.get("version", 0) > SNAPSHOT_VERSION:
+        raise ValueError(f"Snapshot version {snapshot['version']} is newer than this version of CostSpirits supports")
+    return snapshot
+
+
+def restore(session_state, snapshot):
+    """Schedule a loaded snapshot to be applied at the start of the next rerun (widget values cannot change mid-run)"""
+    session_state[_PENDING_KEY] = snapshot
+
+
+def _apply(session_state, snapshot):
+    import session_memory
+    # Inputs of the previous analysis are replaced, not merged
+    for key in [k for k in list(session_state.keys()) if is_input_key(k)]:
+        del session_state[key]
+    session_state[_MIRROR_KEY] = dict(snapshot.get("inputs", {}))
+    for key, value in snapshot.get("inputs", {}).items():
+        session_state[key] = value
+    for key in STATE_KEYS:
+        session_state.pop(key, None)
+    state = snapshot.get("state", {})
+    if "wbs_merge_groups" in state:
+        session_state["wbs_merge_groups"] = state["wbs_merge_groups"]
+    if "currency_params" in state:
+        session_state["currency_params"] = {sheet: tuple(params) for sheet, params in state["currency_params"].items()}
+    if "export_currencies" in state:
+        session_state["export_currencies"] = tuple(state["export_currencies"])
+    for key, index in FRAME_KEYS.items():
+        if key in snapshot.get("frames", {}):
+            df = _frame_from_json(snapshot["frames"][key])
+            session_state[key] = df.set_index(index) if index else df
+        else:
+            session_state.pop(key, None)
+    for key in RESULT_KEYS:
+        tables = snapshot.get("results", {}).get(key)
+        session_memory.put(key, {sheet: _frame_from_json(data) for sheet, data in tables.items()} if tables else {})
+    session_state[PROJECT_KEY] = snapshot.get("upload")
+
+
+def snapshot_summary(snapshot):
+    """One line describing a snapshot"""
+    upload = snapshot.get("upload") or {}
+    results = snapshot.get("results", {}).get("subsystem_results", {})
+    return (f"Saved {snapshot.get('created', '?')}, {len(snapshot.get('inputs', {}))} inputs"
+            + (f", results of {len(results)} sheets" if results else "")
+            + (f", workbook '{upload.get('name')}' ({upload.get('sha1', '')[:8]})" if upload else ""))
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import threading
+from io import BytesIO
+import pandas as pd
+
+# Process-wide cache of the reference data files (subsystem headers, inflation and exchange rate tables)
+# Streamlit imports this module once per server process, so every session shares the parsed data.
+# Each access stats the file; it is only re-read when the mtime or size changed, and the derived
+# indexes are only rebuilt when the content hash changed, so updated files are picked up without
+# a server restart.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SUBSYSTEM_HEADERS_PATH = os.path.join(BASE_DIR, "subsystem_headers.json")
+INFLATION_TABLE_PATH = os.path.join(BASE_DIR, "Inflation Table.xlsx")
+EXCHANGE_RATES_PATH = os.path.join(BASE_DIR, "exchange_rates.csv")
+
+
+class ReferenceFile:
+    """A file parsed once into derived data and re-parsed only when its content changes"""
+
+    def __init__(self, path, parse):
+        self.path = path
+        self.parse = parse
+        self.stat_key = None
+        self.digest = None
+        self.value = None
+        self.loads = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Parsed data of the file (shared, treat as read-only); raises FileNotFoundError if it is missing"""
+        stat = os.stat(self.path)
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        if stat_key == self.stat_key:
+            return self.value
+        with self._lock:
+            if stat_key != self.stat_key:
+                with open(self.path, "rb") as f:
+                    data = f.read()
+                digest = hashlib.sha1(data).hexdigest()
+                if digest != self.digest:
+                    self.value = self.parse(data)
+                    self.digest = digest
+                    self.loads += 1
+                self.stat_key = stat_key
+        return self.value
+
+
+def _header_key(name):
+    # Lookup key tolerant of '&'/'and', slashes, spaces and case
+    return name.replace('&', 'and').replace('/', '').replace(' ', '').lower()
+
+
+def _parse_subsystem_headers(data):
+    entries = json.loads(data.decode("utf-8"))
+    # Convert list of {name, headers} to dict: name -> headers
+    headers = {entry['name']: entry['headers'] for entry in entries if 'name' in entry and 'headers' in entry}
+    loose = {}
+    for name, values in headers.items():
+        loose.setdefault(_header_key(name), values)
+    return headers, loose
+
+
+def _parse_inflation_table(data):
+    infl_df = pd.read_excel(BytesIO(data), header=None)
+    # Get year row and index row
+    year_row = infl_df.iloc[5].tolist()[1:]
+    index_row = infl_df.iloc[7].tolist()[1:]
+    # Remove non-numeric years (e.g., 'TQ')
+    year_index_pairs = [(y, idx) for y, idx in zip(year_row, index_row) if isinstance(y, (int, float)) and not pd.isna(y)]
+    years = [int(y) for y, _ in year_index_pairs]
+    indices = [float(idx) for _, idx in year_index_pairs]
+    return years, dict(zip(years, indices))
+
+
+def _parse_exchange_rates(data):
+    rates = pd.read_csv(BytesIO(data), usecols=["Date", "Currency", "Per USD"], parse_dates=["Date"])
+    rates = rates.dropna().sort_values("Date", kind="stable")
+    rates["Currency"] = rates["Currency"].str.strip().str.upper()
+    latest = rates.groupby("Currency", sort=False).last()
+    # Mean rate of every year with dated entries, one column per currency
+    by_year = rates.pivot_table(index=rates["Date"].dt.year, columns="Currency", values="Per USD", aggfunc="mean")
+    return {"latest": latest["Per USD"], "latest_date": latest["Date"], "by_year": by_year}
+
+
+_subsystem_headers = ReferenceFile(SUBSYSTEM_HEADERS_PATH, _parse_subsystem_headers)
+_inflation_table = ReferenceFile(INFLATION_TABLE_PATH, _parse_inflation_table)
+_exchange_rates = ReferenceFile(EXCHANGE_RATES_PATH, _parse_exchange_rates)
+
+
+def subsystem_headers():
+    """{subsystem name: template headers} from subsystem_headers.json ({} if the file is missing)"""
+    try:
+        return _subsystem_headers.get()[0]
+    except FileNotFoundError:
+        return {}
+
+
+def headers_for(name):
+    """Template headers of a subsystem or group: exact name first, then a case/punctuation-insensitive match"""
+    try:
+        headers, loose = _subsystem_headers.get()
+    except FileNotFoundError:
+        return None
+    return headers.get(name, loose.get(_header_key(name)))
+
+
+def inflation_index():
+    """(years, {year: NASA New Start Inflation Index}) from the inflation table"""
+    return _inflation_table.get()
+
+
+def exchange_rates():
+    """
+    Exchange rates from exchange_rates.csv (units of currency per USD), or None if the file is missing.
+
+    {"latest": rate per currency, "latest_date": date of that rate, "by_year": year x currency mean rates}
+    """
+    try:
+        return _exchange_rates.get()
+    except FileNotFoundError:
+        return None
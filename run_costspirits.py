@@ -1,44 +1,74 @@
 #!/usr/bin/env python3
 """
 Quick start script for CostSpirits
-Run this file to launch the application
+Run this file to launch the application (CostSpirits and the AMCM calculator in one server)
+
+    python run_costspirits.py                   # launch both apps as pages of one server
+    python run_costspirits.py --costspirits-only
+    python run_costspirits.py --import-report   # show the slowest imports at start-up
 """
 
+import argparse
+import importlib.util
+import re
 import subprocess
 import sys
 import os
 
+# Modules imported by the app at start-up, for the import-time report
+APP_MODULES = ["CostSpirits", "amcm_calculator"]
+
+
+def import_time_report(modules=APP_MODULES, top=15):
+    """Slowest imports (cumulative) when importing the given modules in a fresh interpreter"""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + ", ".join(modules)],
+                            cwd=script_dir, capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)", line)
+        if match:
+            rows.append((int(match.group(2)), int(match.group(1)), len(match.group(3)) // 2, match.group(4)))
+    total = sum(cumulative for cumulative, _, depth, _ in rows if depth == 0)
+    lines = [f"Total import time: {total / 1e6:.2f} s", f"{'cumulative':>12} {'self':>10}  module"]
+    for cumulative, self_time, _, name in sorted(rows, reverse=True)[:top]:
+        lines.append(f"{cumulative / 1e3:>10.1f}ms {self_time / 1e3:>8.1f}ms  {name}")
+    return "\n".join(lines)
+
+
 def main():
     """Launch CostSpirits application"""
+    parser = argparse.ArgumentParser(description="Launch CostSpirits")
+    parser.add_argument("--costspirits-only", action="store_true", help="serve only CostSpirits (without the AMCM calculator page)")
+    parser.add_argument("--import-report", action="store_true", help="print the slowest start-up imports and exit")
+    args = parser.parse_args()
+    # Check if streamlit is installed (without starting another interpreter)
+    if importlib.util.find_spec("streamlit") is None:
+        print("❌ Error: Streamlit is not installed.")
+        print("📦 Please install requirements first:")
+        print("   pip install -r requirements.txt")
+        sys.exit(1)
+    if args.import_report:
+        print(import_time_report())
+        return
+    # Get the directory where this script is located
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    app_path = os.path.join(script_dir, "CostSpirits.py" if args.costspirits_only else "costspirits_app.py")
+    if not os.path.exists(app_path):
+        print(f"❌ Error: {os.path.basename(app_path)} not found.")
+        print("📁 Make sure you're running this script from the CostSpirits directory.")
+        sys.exit(1)
     try:
-        # Check if streamlit is installed
-        subprocess.run([sys.executable, "-c", "import streamlit"], check=True, capture_output=True)
-        
-        # Get the directory where this script is located
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        costspirits_path = os.path.join(script_dir, "CostSpirits.py")
-        
         # Launch the Streamlit app
         print("🚀 Launching CostSpirits...")
         print("📊 Opening spacecraft cost estimation tool...")
         print("🌐 The application will open in your default web browser")
         print("⏹️  Press Ctrl+C to stop the application")
         print("-" * 50)
-        
-        subprocess.run([sys.executable, "-m", "streamlit", "run", costspirits_path])
-        
-    except subprocess.CalledProcessError:
-        print("❌ Error: Streamlit is not installed.")
-        print("📦 Please install requirements first:")
-        print("   pip install -r requirements.txt")
-        sys.exit(1)
-    except FileNotFoundError:
-        print("❌ Error: CostSpirits.py not found.")
-        print("📁 Make sure you're running this script from the CostSpirits directory.")
-        sys.exit(1)
+        subprocess.run([sys.executable, "-m", "streamlit", "run", app_path])
     except KeyboardInterrupt:
         print("\n👋 CostSpirits application stopped.")
         sys.exit(0)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,154 @@
+import numpy as np
+import pandas as pd
+from cost_engine import AGGREGATE_COLS, find_wbs_column, merged_wbs_aggregates, wbs_rates
+
+# Scenario matrix: several named alternatives of one spacecraft evaluated against the same history
+# A scenario sets per-WBS masses, its own WBS merge groups and base/target years. The historical sums
+# and counts are aggregated once per original (Subsystem, WBS); every scenario is then one column of
+# WBS labels and one column of masses over those aggregates, and all scenarios are combined with one
+# bincount per aggregate column over the (scenario x WBS) codes. Another scenario adds a column, not a
+# pass over the historical rows. A merged group is estimated with its members' combined history and
+# the sum of their masses; a WBS (or group) is part of a scenario when its mass is positive.
+
+SCENARIO_COLUMNS = ["Scenario", "Base Year", "Target Year"]
+MERGE_COLUMNS = ["Scenario", "Subsystem", "Group", "WBS"]
+
+
+def sheet_aggregates(sheets):
+    """Sums, counts and row counts of every original (Subsystem, WBS) of a {sheet: DataFrame} workbook"""
+    frames = []
+    for sheet, df in sheets.items():
+        wbs_col = find_wbs_column(df)
+        if wbs_col is None:
+            continue
+        wbs_items = df[wbs_col].dropna().unique()
+        sums, counts, rows = merged_wbs_aggregates(df, wbs_col, {w: w for w in wbs_items})
+        frames.append(aggregate_frame(sheet, sums, counts, rows))
+    if not frames:
+        empty = pd.DataFrame(columns=AGGREGATE_COLS, dtype=float)
+        return aggregate_frame(None, empty, empty, pd.Series(dtype=float))
+    return pd.concat(frames)
+
+
+def aggregate_frame(subsystem, sums, counts, rows):
+    """One subsystem's (sums, counts, rows) as rows of the shared aggregates table, indexed by (Subsystem, WBS)"""
+    table = pd.concat([sums.add_prefix("sum "), counts.add_prefix("count ")], axis=1)
+    table["rows"] = rows
+    table.index = pd.MultiIndex.from_arrays([[subsystem] * len(table), table.index.astype(str)], names=["Subsystem", "WBS"])
+    return table
+
+
+def default_scenarios(base_year, target_year, names=("Baseline", "Alternative")):
+    """Scenario settings table with the same years for every scenario"""
+    return pd.DataFrame({"Scenario": list(names), "Base Year": base_year, "Target Year": target_year})
+
+
+def validate_scenarios(settings, year_to_index):
+    """Clean scenario settings: named, unique, with years of the inflation table; raises ValueError otherwise"""
+    settings = settings.dropna(subset=["Scenario"]).copy()
+    settings["Scenario"] = settings["Scenario"].astype(str).str.strip()
+    settings = settings[settings["Scenario"] != ""]
+    if settings.empty:
+        raise ValueError("Define at least one scenario")
+    duplicated = settings["Scenario"][settings["Scenario"].duplicated()]
+    if not duplicated.empty:
+        raise ValueError(f"Duplicate scenario names: {', '.join(duplicated.unique())}")
+    for col in ("Base Year", "Target Year"):
+        settings[col] = pd.to_numeric(settings[col], errors='coerce')
+        unknown = settings[col][~settings[col].isin(list(year_to_index))]
+        if not unknown.empty:
+            raise ValueError(f"{col} without inflation index: {', '.join(str(y) for y in unknown.unique())}")
+        settings[col] = settings[col].astype(int)
+    return settings.reset_index(drop=True)
+
+
+def _labels(aggregates, scenario_names, merges):
+    # (original WBS x scenario) analysis labels: the merge group of the WBS in that scenario, else the WBS
+    labels = np.tile(aggregates.index.get_level_values("WBS").to_numpy(dtype=object)[:, None], (1, len(scenario_names)))
+    if merges is None or merges.empty:
+        return labels
+    position = pd.Series(np.arange(len(aggregates)), index=aggregates.index)
+    column = {name: j for j, name in enumerate(scenario_names)}
+    for scenario, subsystem, group, wbs in merges[MERGE_COLUMNS].itertuples(index=False):
+        i = position.get((subsystem, str(wbs)))
+        if i is not None and scenario in column and str(group).strip():
+            labels[i, column[scenario]] = str(group).strip()
+    return labels
+
+
+def evaluate_scenarios(aggregates, masses, settings, year_to_index, merges=None):
+    """
+    Estimate of every scenario and (possibly merged) WBS in one pass.
+
+    aggregates: shared table from sheet_aggregates; masses: lbs per original (Subsystem, WBS) with one
+    column per scenario; settings: validated scenario table; merges: MERGE_COLUMNS rows (one per group member).
+    Returns a long table with one row per scenario and estimated WBS.
+    """
+    names = list(settings["Scenario"])
+    n, k = len(aggregates), len(names)
+    masses = masses.reindex(index=aggregates.index, columns=names).fillna(0.0).to_numpy(dtype=float)
+    labels = _labels(aggregates, names, merges)
+    subsystems = np.repeat(aggregates.index.get_level_values("Subsystem").to_numpy(dtype=object)[:, None], k, axis=1)
+    # One code per (Subsystem, label) over all scenarios, then one per (scenario, label)
+    keys, groups = pd.factorize(pd.MultiIndex.from_arrays([subsystems.ravel(order="F"), labels.ravel(order="F")]))
+    n_groups = len(groups)
+    codes = keys + np.repeat(np.arange(k), n) * n_groups
+    size = k * n_groups
+
+    def combine(values):
+        return np.bincount(codes, weights=np.tile(values, k) if values.ndim == 1 else values.ravel(order="F"), minlength=size)
+
+    sums = pd.DataFrame({col: combine(aggregates[f"sum {col}"].to_numpy(dtype=float)) for col in AGGREGATE_COLS})
+    counts = pd.DataFrame({col: combine(aggregates[f"count {col}"].to_numpy(dtype=float)) for col in AGGREGATE_COLS})
+    rows = combine(aggregates["rows"].to_numpy(dtype=float))
+    members = np.bincount(codes, minlength=size)
+    mass = combine(masses)
+    rates = wbs_rates(sums, counts)
+    factors = np.array([year_to_index[t] / year_to_index[b] for b, t in zip(settings["Base Year"], settings["Target Year"])])
+    dd_cost = rates["D&D Cost per lbs"].to_numpy() * mass
+    fu_cost = rates["Flight Unit Cost per lbs"].to_numpy() * mass
+    total = np.nan_to_num(dd_cost) + np.nan_to_num(fu_cost)
+    scenario_index = np.repeat(np.arange(k), n_groups)
+    result = pd.DataFrame({
+        "Scenario": np.array(names, dtype=object)[scenario_index],
+        "Subsystem": np.tile(groups.get_level_values(0), k),
+        "WBS": np.tile(groups.get_level_values(1), k),
+        "Historical Count": rows.astype(int),
+        "Mass (lbs)": mass,
+        "D&D Cost": dd_cost,
+        "Flight Unit Cost": fu_cost,
+        "Total Cost (ref yr)": total,
+        "Inflation Factor": factors[scenario_index],
+        "Total Cost (target yr)": total * factors[scenario_index],
+    })
+    # Labels that do not exist in a scenario (e.g. a WBS merged away) and unselected WBS are left out
+    return result[(members > 0) & (mass > 0)].reset_index(drop=True)
+
+
+def scenario_matrix(result, settings, baseline=None):
+    """
+    (Subsystem, WBS) x scenario tables of the target-year total cost and its delta to the baseline scenario.
+
+    Both tables end with a 'Total' row; the baseline defaults to the first scenario.
+    """
+    names = list(settings["Scenario"])
+    baseline = baseline or names[0]
+    matrix = result.pivot_table(index=["Subsystem", "WBS"], columns="Scenario", values="Total Cost (target yr)",
+                                aggfunc="sum", sort=False).reindex(columns=names)
+    matrix.loc[("Total", ""), :] = matrix.sum(min_count=1)
+    # A WBS missing from one side of the comparison counts as zero there (added or removed WBS)
+    base = matrix[baseline]
+    present = matrix.notna().to_numpy() | base.notna().to_numpy()[:, None]
+    delta = matrix.fillna(0).sub(base.fillna(0), axis=0).where(present).drop(columns=baseline)
+    years = dict(zip(settings["Scenario"], settings["Target Year"]))
+    matrix.columns = [f"{name} ({years[name]})" for name in names]
+    delta.columns = [f"Δ {name} vs. {baseline}" for name in delta.columns]
+    return matrix, delta
+
+
+def side_by_side(matrix, delta):
+    """Matrix and delta columns interleaved: each scenario's cost followed by its delta to the baseline"""
+    columns = [matrix.iloc[:, 0]]
+    for cost, change in zip(matrix.columns[1:], delta.columns):
+        columns += [matrix[cost], delta[change]]
+    return pd.concat(columns, axis=1).reset_index()
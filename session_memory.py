@@ -0,0 +1,218 @@
+import hashlib
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from io import BytesIO
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Memory accounting and eviction of large per-session artifacts in st.session_state
+# After every run the session's artifacts are measured. When the session (or all sessions of the
+# process together) exceed the budget, the least recently used result tables are spilled to disk
+# until the session fits. Tables read or written during the run that just finished are kept, so a
+# table the page uses on every rerun is not loaded back and spilled again each time. Spilled
+# artifacts are loaded back transparently by get(). Nothing is dropped to be rebuilt from the
+# parsed upload: spilling is the only release policy.
+#
+# Budgets (MB) come from COSTSPIRITS_SESSION_MB and COSTSPIRITS_GLOBAL_MB; spill files go to
+# COSTSPIRITS_SPILL_DIR (default: costspirits_spill in the system temp directory).
+
+SESSION_BUDGET_MB = float(os.environ.get("COSTSPIRITS_SESSION_MB", 256))
+GLOBAL_BUDGET_MB = float(os.environ.get("COSTSPIRITS_GLOBAL_MB", 2048))
+SPILL_DIR = os.environ.get("COSTSPIRITS_SPILL_DIR", os.path.join(tempfile.gettempdir(), "costspirits_spill"))
+# Sessions not seen for this long no longer count towards the global budget; their spill files are
+# deleted once the session has also ended (an idle browser tab keeps its session)
+SESSION_TTL_SECONDS = 3600
+
+# Result tables that may be written to disk and loaded back
+SPILLABLE_KEYS = ("subsystem_results", "phasing_results", "backtest_results", "portfolio_results", "scenario_results")
+
+_ACCESS_KEY = "_memory_access"
+# Time the previous run of the session ended (when enforce_budget last ran)
+_RUN_KEY = "_memory_last_run"
+_INTERNAL_KEYS = (_ACCESS_KEY, _RUN_KEY)
+_usage = {}
+_usage_lock = threading.Lock()
+# Sessions of this process that have spill files
+_spilling_sessions = set()
+_MISSING = object()
+
+
+class Spilled:
+    """Placeholder left in session state for an artifact written to disk"""
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+
+
+def artifact_size(value):
+    """Approximate in-memory size of a session artifact in bytes"""
+    if isinstance(value, Spilled):
+        return 0
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, BytesIO):
+        return value.getbuffer().nbytes
+    if isinstance(value, dict):
+        return sum(artifact_size(v) for v in value.values())
+    if isinstance(value, (list, tuple, set)):
+        return sum(artifact_size(v) for v in value)
+    if hasattr(value, "size") and isinstance(value.size, int):
+        # Streamlit UploadedFile
+        return value.size
+    return sys.getsizeof(value)
+
+
+def policy(key):
+    """How an artifact is released under memory pressure: 'spill' or 'keep'"""
+    return "spill" if key in SPILLABLE_KEYS else "keep"
+
+
+def _session_id():
+    ctx = st.runtime.scriptrunner.get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "bare"
+
+
+def _touch(key):
+    st.session_state.setdefault(_ACCESS_KEY, {})[key] = time.time()
+
+
+def get(key, default=None):
+    """Session artifact by key, loading it back from disk if it was spilled (default if the spill file is gone)"""
+    value = st.session_state.get(key, default)
+    if isinstance(value, Spilled):
+        try:
+            with open(value.path, "rb") as f:
+                restored = pickle.load(f)
+        except OSError:
+            # Spill directory removed (e.g. the temp directory was cleaned): the page recomputes it
+            del st.session_state[key]
+            return default
+        os.remove(value.path)
+        st.session_state[key] = value = restored
+    if key in st.session_state:
+        _touch(key)
+    return value
+
+
+def put(key, value):
+    """Store a session artifact and mark it as recently used"""
+    st.session_state[key] = value
+    _touch(key)
+    return value
+
+
+def setdefault(key, default):
+    """get() the artifact, storing default first if it is not set"""
+    value = get(key, _MISSING)
+    if value is _MISSING:
+        return put(key, default)
+    return value
+
+
+def _spill(key, value):
+    session_id = _session_id()
+    directory = os.path.join(SPILL_DIR, session_id)
+    os.makedirs(directory, exist_ok=True)
+    with _usage_lock:
+        _spilling_sessions.add(session_id)
+    path = os.path.join(directory, hashlib.sha1(str(key).encode("utf-8")).hexdigest() + ".pkl")
+    with open(path, "wb") as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return Spilled(path, artifact_size(value))
+
+
+def memory_report():
+    """Size, release policy and location of every session state entry, largest first"""
+    rows = []
+    for key, value in st.session_state.items():
+        if key in _INTERNAL_KEYS:
+            continue
+        spilled = isinstance(value, Spilled)
+        rows.append({
+            "Key": key,
+            "Type": type(value).__name__,
+            "Size (MB)": (value.size if spilled else artifact_size(value)) / 1e6,
+            "Policy": policy(key),
+            "Location": "disk" if spilled else "memory",
+        })
+    if not rows:
+        return pd.DataFrame(columns=["Key", "Type", "Size (MB)", "Policy", "Location"])
+    return pd.DataFrame(rows).sort_values("Size (MB)", ascending=False, ignore_index=True)
+
+
+def _session_ended(session_id):
+    # Not connected to the server; a disconnected session is only kept for a few minutes, far
+    # less than SESSION_TTL_SECONDS. Without a runtime (bare mode) the files are kept.
+    runtime = st.runtime.Runtime
+    return runtime.exists() and not runtime.instance().is_active_session(session_id)
+
+
+def _other_sessions_bytes(session_id, now):
+    with _usage_lock:
+        for sid in [sid for sid, (_, seen) in _usage.items() if now - seen > SESSION_TTL_SECONDS]:
+            del _usage[sid]
+        for sid in [sid for sid in _spilling_sessions if sid not in _usage and sid != session_id and _session_ended(sid)]:
+            _spilling_sessions.discard(sid)
+            shutil.rmtree(os.path.join(SPILL_DIR, sid), ignore_errors=True)
+        return sum(size for sid, (size, _) in _usage.items() if sid != session_id)
+
+
+def enforce_budget():
+    """
+    Spill this session's least recently used artifacts until it fits its share of the budgets.
+
+    Artifacts used during the current run are not spilled.
+
+    Returns the list of released keys.
+    """
+    now = time.time()
+    session_id = _session_id()
+    sizes = {key: artifact_size(value) for key, value in st.session_state.items() if key not in _INTERNAL_KEYS}
+    total = sum(sizes.values())
+    others = _other_sessions_bytes(session_id, now)
+    allowed = min(SESSION_BUDGET_MB * 1e6, max(0.0, GLOBAL_BUDGET_MB * 1e6 - others))
+    released = []
+    if total > allowed:
+        access = st.session_state.get(_ACCESS_KEY, {})
+        run_started = st.session_state.get(_RUN_KEY, 0.0)
+        candidates = sorted((key for key in sizes
+                             if policy(key) == "spill" and sizes[key] > 0 and access.get(key, 0.0) < run_started),
+                            key=lambda k: access.get(k, 0.0))
+        for key in candidates:
+            if total <= allowed:
+                break
+            st.session_state[key] = _spill(key, st.session_state[key])
+            total -= sizes[key]
+            released.append(key)
+    st.session_state[_RUN_KEY] = now
+    with _usage_lock:
+        _usage[session_id] = (total, now)
+    return released
+
+
+def render_debug_panel():
+    """Sidebar view of this session's memory use, the budgets and the process-wide total"""
+    if not st.sidebar.checkbox("Show session memory (debug)", key="show_memory_debug"):
+        return
+    report = memory_report()
+    in_memory = report.loc[report["Location"] == "memory", "Size (MB)"].sum()
+    on_disk = report.loc[report["Location"] == "disk", "Size (MB)"].sum()
+    with _usage_lock:
+        process_total = sum(size for size, _ in _usage.values()) / 1e6
+        sessions = len(_usage)
+    st.sidebar.caption(f"Session: {in_memory:.1f} MB in memory, {on_disk:.1f} MB spilled (budget {SESSION_BUDGET_MB:.0f} MB). "
+                       f"All sessions: {process_total:.1f} MB over {sessions} (budget {GLOBAL_BUDGET_MB:.0f} MB).")
+    st.sidebar.dataframe(report, hide_index=True, use_container_width=True)
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Server-side paginated table previews
+# Filtering and sorting run on the parsed DataFrame in the app process; only the rows of the
+# current page are sent to the browser. While a filter or sort is active, the filtered/sorted row
+# order is kept in session state so paging through a large sheet does not re-sort it on every
+# rerun; unfiltered, unsorted tables are paged straight through without storing anything.
+
+PAGE_SIZES = [25, 50, 100, 500]
+
+
+def _text_match(series, query):
+    # Case-insensitive substring match of the text/categorical values of a column
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        categories = pd.Series(series.cat.categories.astype(str))
+        hits = np.flatnonzero(categories.str.contains(query, case=False, regex=False).to_numpy())
+        return np.isin(series.cat.codes.to_numpy(), hits)
+    if pd.api.types.is_string_dtype(series.dtype):
+        return series.map(str, na_action='ignore').str.contains(query, case=False, regex=False, na=False).to_numpy(dtype=bool)
+    return np.zeros(len(series), dtype=bool)
+
+
+def row_positions(df, query="", sort_col=None, ascending=True):
+    """Positions of the rows of df matching the text query, in sort order (missing values last)"""
+    positions = np.arange(len(df))
+    query = query.strip()
+    if query:
+        mask = np.zeros(len(df), dtype=bool)
+        for col in df.columns:
+            mask |= _text_match(df[col], query)
+        positions = positions[mask]
+    if sort_col is not None and len(positions):
+        values = df[sort_col].take(positions).reset_index(drop=True)
+        try:
+            order = values.sort_values(ascending=ascending, na_position='last', kind='stable').index.to_numpy()
+        except TypeError:
+            # Mixed text and numbers: sort by the text representation
+            order = values.map(str, na_action='ignore').sort_values(ascending=ascending, na_position='last', kind='stable').index.to_numpy()
+        positions = positions[order]
+    return positions
+
+
+def render_paginated_table(df, key, source, page_size=50):
+    """
+    Filter, sort and page through df, sending only the visible page to the browser.
+
+    source identifies the contents of df (e.g. the SHA-1 of the upload it was parsed from); a stored
+    row order is only reused for the same source.
+    """
+    col_filter, col_sort, col_desc, col_size = st.columns([3, 2, 1, 1])
+    query = col_filter.text_input("Filter rows (text columns)", key=f"{key}_filter")
+    sort_col = col_sort.selectbox("Sort by", ["(none)"] + list(df.columns), key=f"{key}_sort")
+    descending = col_desc.checkbox("Descending", key=f"{key}_desc")
+    page_size = col_size.selectbox("Rows per page", PAGE_SIZES, index=PAGE_SIZES.index(page_size) if page_size in PAGE_SIZES else 1,
+                                   key=f"{key}_page_size")
+    sort_col = None if sort_col == "(none)" else sort_col
+    positions_key = f"{key}_positions"
+    if query.strip() or sort_col is not None:
+        signature = (source, len(df), query.strip(), sort_col, descending)
+        cached = st.session_state.get(positions_key)
+        if cached is None or cached[0] != signature:
+            cached = (signature, row_positions(df, query, sort_col, not descending))
+            st.session_state[positions_key] = cached
+        positions = cached[1]
+        n_rows = len(positions)
+    else:
+        st.session_state.pop(positions_key, None)
+        positions = None
+        n_rows = len(df)
+    n_pages = max(1, -(-n_rows // page_size))
+    page = st.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, value=1, step=1, key=f"{key}_page")
+    page = min(int(page), n_pages)
+    start = (page - 1) * page_size
+    visible = df.iloc[start:start + page_size] if positions is None else df.take(positions[start:start + page_size])
+    st.dataframe(visible, use_container_width=True)
+    filtered = f" (filtered from {len(df)})" if n_rows != len(df) else ""
+    st.caption(f"Rows {start + 1 if len(visible) else 0}-{start + len(visible)} of {n_rows}{filtered}")
@@ -0,0 +1,164 @@
+import numpy as np
+import pandas as pd
+from cost_engine import MISSION_COL, RANGE_COLUMNS, find_wbs_column
+import reference_data
+
+# Ingest-time validation of uploaded historical workbooks
+# Runs once per upload on the raw parsed sheets (before text in the range columns is coerced to NaN)
+# as part of the background parse, so the report is cached with the parse job by the upload's SHA-1.
+# Every check is a whole-column operation over all rows of a sheet: the header schema against
+# subsystem_headers.json, non-numeric cells, Lower above Higher ranges, zero or negative weights, and
+# unit-scale outliers (values orders of magnitude away from the median of the same WBS, typically
+# kg/lbs or $/$K/$M mix-ups). The report lists every finding with its Excel cell (header in row 1).
+
+REPORT_COLUMNS = ["Sheet", "Cell", "Check", "Severity", "Value", "Message"]
+SEVERITIES = ["error", "warning", "info"]
+# Headers of a sheet that is not in subsystem_headers.json
+TEMPLATE_HEADERS = [MISSION_COL, "WBS Item"] + RANGE_COLUMNS
+# (Lower, Higher) column pairs of the template
+RANGE_PAIRS = list(zip(RANGE_COLUMNS[0::2], RANGE_COLUMNS[1::2]))
+WEIGHT_COLUMNS = RANGE_COLUMNS[:2]
+# A value this many orders of magnitude away from its WBS median (or the column median for WBS with
+# fewer than MIN_SCALE_VALUES values) is reported as a unit-scale outlier (10^2.5 ~ 316x)
+OUTLIER_DECADES = 2.5
+MIN_SCALE_VALUES = 5
+
+
+def column_letter(position):
+    """Excel column letter of a 0-based column position (0 -> A, 26 -> AA)"""
+    letters = ""
+    position += 1
+    while position:
+        position, rest = divmod(position - 1, 26)
+        letters = chr(65 + rest) + letters
+    return letters
+
+
+def _issues(sheet, cells, check, severity, values, messages):
+    n = len(cells)
+    return pd.DataFrame({
+        "Sheet": [sheet] * n,
+        "Cell": cells,
+        "Check": [check] * n,
+        "Severity": [severity] * n,
+        "Value": np.asarray(values).astype(str) if n else [],
+        "Message": messages if not isinstance(messages, str) else [messages] * n,
+    }, columns=REPORT_COLUMNS)
+
+
+def _cells(letter, rows):
+    # Excel cell of each row position (row 1 is the header)
+    return np.char.add(letter, (rows + 2).astype(str))
+
+
+def _schema_issues(sheet, df, expected):
+    found = []
+    if expected is None:
+        found.append(_issues(sheet, [""], "Unknown sheet", "info", [sheet],
+                             "Not a subsystem of the template; checked against the standard template columns"))
+        expected = TEMPLATE_HEADERS
+    columns = [str(c) for c in df.columns]
+    missing = [h for h in expected if h not in columns]
+    if missing:
+        found.append(_issues(sheet, [""] * len(missing), "Missing column", "error", missing,
+                             "Template column not found in the header row"))
+    extra = [(i, c) for i, c in enumerate(columns) if c not in expected and not c.startswith("Unnamed:")]
+    if extra:
+        found.append(_issues(sheet, [f"{column_letter(i)}1" for i, _ in extra], "Unexpected column", "info",
+                             [c for _, c in extra], "Not a template column; ignored by the estimate"))
+    if find_wbs_column(df) is None:
+        found.append(_issues(sheet, [""], "No WBS column", "error", [""],
+                             "No 'WBS Item' column; the sheet cannot be used in Cost Analysis"))
+    return found
+
+
+def validate_sheet(sheet, df, expected=None):
+    """
+    Findings of one raw (not yet compacted) sheet as a REPORT_COLUMNS table.
+
+    expected: template headers of the sheet (default: from subsystem_headers.json by sheet name).
+    """
+    found = _schema_issues(sheet, df, expected if expected is not None else reference_data.headers_for(sheet))
+    position = {col: i for i, col in enumerate(df.columns)}
+    letters = {col: column_letter(i) for col, i in position.items()}
+    range_cols = [col for col in RANGE_COLUMNS if col in position]
+    if not range_cols:
+        return _concat(found)
+    raw = df[range_cols]
+    numbers = raw.apply(pd.to_numeric, errors='coerce').astype(float)
+    for col in range_cols:
+        values = raw[col]
+        rows = np.flatnonzero(values.notna().to_numpy() & numbers[col].isna().to_numpy())
+        # Whitespace-only cells count as blank
+        rows = rows[values.iloc[rows].astype(str).str.strip().ne("").to_numpy()]
+        if len(rows):
+            found.append(_issues(sheet, _cells(letters[col], rows), "Non-numeric value", "warning", values.to_numpy()[rows],
+                                 "Text in a numeric column; ignored by the estimate"))
+    for lower, higher in RANGE_PAIRS:
+        if lower in position and higher in position:
+            lo, hi = numbers[lower].to_numpy(), numbers[higher].to_numpy()
+            rows = np.flatnonzero(lo > hi)
+            if len(rows):
+                found.append(_issues(sheet, _cells(letters[lower], rows), "Lower > Higher", "warning", lo[rows],
+                                     f"Above '{higher}' (column {letters[higher]}) of the same row"))
+    for col in WEIGHT_COLUMNS:
+        if col in position:
+            weights = numbers[col].to_numpy()
+            rows = np.flatnonzero(weights <= 0)
+            if len(rows):
+                found.append(_issues(sheet, _cells(letters[col], rows), "Weight <= 0", "warning", weights[rows],
+                                     "Zero or negative weight; the row does not contribute a cost per pound"))
+    found += _scale_outliers(sheet, df, numbers, letters)
+    return _concat(found)
+
+
+def _scale_outliers(sheet, df, numbers, letters):
+    found = []
+    wbs_col = find_wbs_column(df)
+    # Rows without a WBS form one group of their own (blank keys would drop them from the groupby)
+    keys = df[wbs_col].astype(str).fillna("").to_numpy() if wbs_col is not None else np.zeros(len(df))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        logs = np.log10(numbers.where(numbers > 0))
+    grouped = logs.groupby(keys, sort=False)
+    medians, counts = grouped.transform("median"), grouped.transform("count")
+    column_medians = logs.median().where(logs.count() >= MIN_SCALE_VALUES)
+    # The WBS median where the WBS has enough values, else the column median over the sheet
+    reference = medians.where(counts >= MIN_SCALE_VALUES, column_medians, axis=1)
+    deviation = logs - reference
+    for col in numbers.columns:
+        dev = deviation[col].to_numpy()
+        rows = np.flatnonzero(np.abs(dev) >= OUTLIER_DECADES)
+        if len(rows):
+            found.append(_issues(sheet, _cells(letters[col], rows), "Unit-scale outlier", "warning", numbers[col].to_numpy()[rows],
+                                 [f"{10 ** d:,.0f}x the typical value" if d > 0 else f"1/{10 ** -d:,.0f} of the typical value"
+                                  for d in dev[rows]]))
+    return found
+
+
+def _concat(found):
+    if not found:
+        return pd.DataFrame(columns=REPORT_COLUMNS)
+    return pd.concat(found, ignore_index=True)
+
+
+def validate_sheet_safely(sheet, df):
+    """validate_sheet that reports a failing check as a finding instead of raising (keeps the upload usable)"""
+    try:
+        return validate_sheet(sheet, df)
+    except Exception as e:
+        return _issues(sheet, [""], "Validation failed", "warning", [type(e).__name__],
+                       f"The sheet could not be fully validated: {e}")
+
+
+def validate_workbook(sheets):
+    """Findings of a {sheet: raw DataFrame} workbook"""
+    return _concat([validate_sheet_safely(sheet, df) for sheet, df in sheets.items()])
+
+
+def summary(report, sheets=None):
+    """Sheet x check counts of a report (sheets without findings included when given)"""
+    table = pd.crosstab(report["Sheet"], report["Check"]) if not report.empty else pd.DataFrame(index=pd.Index([], name="Sheet"))
+    if sheets is not None:
+        table = table.reindex(list(sheets), fill_value=0)
+    table["Errors"] = report[report["Severity"] == "error"].groupby("Sheet").size().reindex(table.index, fill_value=0)
+    return table.rename_axis(index="Sheet", columns=None).reset_index()
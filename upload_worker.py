@@ -0,0 +1,163 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import pandas as pd
+from cost_engine import compact_sheet
+from upload_validation import validate_sheet_safely, REPORT_COLUMNS
+
+# Background parsing of uploaded historical workbooks
+# A parse job is keyed by the SHA-1 of the uploaded bytes, so later reruns (and other sessions
+# uploading the same file) find the running or finished job instead of starting over. Sheets are
+# parsed one after the other on a worker thread and the job records the state of every sheet for
+# progress reporting. Every raw sheet is validated before it is compacted (see upload_validation.py)
+# and the report is kept on the job with the parsed sheets. Finished results are kept for the last
+# MAX_JOBS uploads.
+
+MAX_JOBS = 8
+PARSE_WORKERS = int(os.environ.get("COSTSPIRITS_PARSE_WORKERS", 2))
+
+_jobs = OrderedDict()
+_jobs_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=PARSE_WORKERS, thread_name_prefix="costspirits-parse")
+# Callbacks receiving every finished job (e.g. the metrics exporter)
+_listeners = []
+
+
+class ParseJob:
+    """Parse of one uploaded workbook into compact sheets, with per-sheet progress"""
+
+    def __init__(self, key, size):
+        self.key = key
+        self.size = size
+        self.sheets = []
+        # sheet -> "queued", "parsing" or "done"
+        self.status = {}
+        self.rows = {}
+        self.result = None
+        # Validation findings of all sheets (upload_validation.REPORT_COLUMNS)
+        self.report = pd.DataFrame(columns=REPORT_COLUMNS)
+        self.error = None
+        self.started = None
+        self.finished = None
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def duration(self):
+        """Seconds spent parsing (so far, while running)"""
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def progress(self):
+        """Fraction of the sheets parsed (0 while the workbook is being opened)"""
+        if self.done:
+            return 1.0
+        if not self.sheets:
+            return 0.0
+        return sum(state == "done" for state in self.status.values()) / len(self.sheets)
+
+    def wait(self, timeout=None):
+        """{sheet: compact DataFrame} once parsed; re-raises the parse error"""
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"Workbook {self.key[:8]} is still being parsed")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def _on_sheet(self, sheet, state, rows):
+        if state == "opened":
+            self.sheets = list(sheet)
+            self.status = dict.fromkeys(self.sheets, "queued")
+            return
+        self.status[sheet] = state
+        if rows is not None:
+            self.rows[sheet] = rows
+
+    def _run(self, data):
+        self.started = time.time()
+        try:
+            reports = {}
+            self.result = parse_workbook(data, self._on_sheet, reports)
+            self.report = pd.concat(list(reports.values()) or [self.report], ignore_index=True)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished = time.time()
+            self._done.set()
+        for callback in _listeners:
+            callback(self)
+
+
+def parse_workbook(data, on_sheet=None, reports=None):
+    """
+    {sheet: compact DataFrame} of a workbook's bytes, parsed sheet by sheet.
+
+    on_sheet(sheet, state, rows) is called with the list of sheet names and state "opened" first,
+    then for every sheet with "parsing" and "done" (rows is the row count when done). With a
+    reports dict, the validation findings of every sheet are stored in it by sheet name.
+    """
+    on_sheet = on_sheet or (lambda sheet, state, rows: None)
+    result = {}
+    with pd.ExcelFile(BytesIO(data)) as xls:
+        on_sheet(xls.sheet_names, "opened", None)
+        for sheet in xls.sheet_names:
+            on_sheet(sheet, "parsing", None)
+            df = xls.parse(sheet)
+            if reports is not None:
+                reports[sheet] = validate_sheet_safely(sheet, df)
+            result[sheet] = compact_sheet(df)
+            on_sheet(sheet, "done", len(df))
+    return result
+
+
+def upload_key(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def submit(data):
+    """
+    Parse job of a workbook's bytes, starting it in the background unless it already exists.
+
+    Returns (job, started). A failed job keeps its error (the same bytes would fail again).
+    """
+    key = upload_key(data)
+    with _jobs_lock:
+        job = _jobs.get(key)
+        started = job is None
+        if started:
+            job = _jobs[key] = ParseJob(key, len(data))
+            _executor.submit(job._run, data)
+        _jobs.move_to_end(key)
+        # Forget the oldest finished jobs; running ones are kept until they finish
+        for old_key in [k for k, j in _jobs.items() if j.done][:max(0, len(_jobs) - MAX_JOBS)]:
+            del _jobs[old_key]
+    return job, started
+
+
+def get(key):
+    """Parse job by upload key, or None"""
+    with _jobs_lock:
+        return _jobs.get(key)
+
+
+def add_listener(callback):
+    """Register a callback called with every finished job"""
+    if callback not in _listeners:
+        _listeners.append(callback)
+
+
+def progress_table(job):
+    """Per-sheet status and row counts of a job"""
+    return pd.DataFrame({
+        "Sheet": job.sheets,
+        "Status": [job.status.get(sheet, "queued") for sheet in job.sheets],
+        "Rows": [job.rows.get(sheet) for sheet in job.sheets],
+    })
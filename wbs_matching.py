@@ -0,0 +1,103 @@
+import hashlib
+import math
+import re
+from collections import Counter, defaultdict
+
+# Fuzzy matching of WBS names for automatic merge-group suggestions
+# Names are normalized and split into character trigrams. Pairs with a trigram Jaccard similarity
+# above the threshold are found through an inverted index with prefix filtering: each name only
+# indexes and probes its rarest trigrams, which is enough to find every pair above the threshold
+# without comparing all pairs. Groups are built around anchors: the first listed name not yet in
+# a group takes every ungrouped name matching it, so every member matches its group's anchor
+# (chains A~B~C do not pull A and C together when they are far apart).
+
+DEFAULT_THRESHOLD = 0.6
+
+_SEPARATORS = re.compile(r"[\s_\-/.,;:()\[\]&+]+")
+
+
+def normalize_name(name):
+    """Lower-case WBS name with punctuation collapsed to single spaces"""
+    return _SEPARATORS.sub(" ", str(name).lower()).strip()
+
+
+def trigrams(text):
+    """Set of character trigrams of a normalized name (padded so short names still match)"""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def names_hash(names, counts=None):
+    """Stable hash of a WBS name list (and its row counts) used as the suggestion cache key"""
+    digest = hashlib.sha1()
+    for i, name in enumerate(names):
+        digest.update(f"{name}\x1f{counts[i] if counts is not None else ''}\x1e".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def similar_pairs(keys, threshold=DEFAULT_THRESHOLD):
+    """
+    Index pairs (i, j, similarity) of normalized names whose trigram Jaccard similarity is >= threshold.
+
+    Jaccard(A, B) >= t implies |A & B| >= t * |A|, so with the trigrams of every name sorted by a
+    global order (rarest first) two matching names must share one of their first
+    |A| - ceil(t * |A|) + 1 trigrams. Only those prefixes go into the inverted index.
+    """
+    grams = [trigrams(k) for k in keys]
+    frequency = Counter(g for gs in grams for g in gs)
+    ordered = [sorted(gs, key=lambda g: (frequency[g], g)) for gs in grams]
+    index = defaultdict(list)
+    pairs = []
+    for i, gs in enumerate(ordered):
+        prefix = gs[:len(gs) - math.ceil(threshold * len(gs)) + 1]
+        candidates = set()
+        for g in prefix:
+            candidates.update(index[g])
+            index[g].append(i)
+        for j in candidates:
+            shared = len(grams[i] & grams[j])
+            similarity = shared / (len(grams[i]) + len(grams[j]) - shared)
+            if similarity >= threshold:
+                pairs.append((j, i, similarity))
+    return pairs
+
+
+def suggest_merge_groups(names, counts=None, threshold=DEFAULT_THRESHOLD):
+    """
+    Proposed merge groups {group name: [WBS names]} for a list of WBS names.
+
+    Names that normalize to the same text are always grouped. Every other member matches the group's
+    anchor, its first listed name, at the threshold; a name matching several anchors joins the first.
+    The group is named after the member with the most historical rows (counts, aligned with names),
+    then the shortest, then the first listed.
+    Only groups with two or more members are returned.
+    """
+    names = list(names)
+    counts = list(counts) if counts is not None else [0] * len(names)
+    key_ids = {}
+    name_keys = []
+    for name in names:
+        name_keys.append(key_ids.setdefault(normalize_name(name), len(key_ids)))
+    keys = list(key_ids)
+    neighbors = defaultdict(list)
+    for i, j, _ in similar_pairs(keys, threshold):
+        neighbors[i].append(j)
+        neighbors[j].append(i)
+    # Keys are numbered in order of first appearance, so anchors are taken in list order
+    anchor_of = {}
+    for anchor in range(len(keys)):
+        if anchor in anchor_of:
+            continue
+        anchor_of[anchor] = anchor
+        for j in neighbors[anchor]:
+            anchor_of.setdefault(j, anchor)
+    members = defaultdict(list)
+    for name_idx, key_idx in enumerate(name_keys):
+        members[anchor_of[key_idx]].append(name_idx)
+    groups = {}
+    for idxs in members.values():
+        if len(idxs) < 2:
+            continue
+        lead = min(idxs, key=lambda i: (-counts[i], len(str(names[i])), i))
+        groups[str(names[lead])] = sorted((names[i] for i in idxs), key=str)
+    return dict(sorted(groups.items()))
@@ -0,0 +1,315 @@
+import hashlib
+import math
+import multiprocessing
+import os
+import pickle
+import re
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from xml.sax.saxutils import escape
+import numpy as np
+import pandas as pd
+from upload_validation import column_letter
+
+# Excel export assembled from cached per-sheet worksheet parts
+# Every worksheet of an export is rendered on its own into the XML part that goes into the xlsx zip
+# (xl/worksheets/sheetN.xml). Parts use inline strings and the style ids of one fixed styles.xml, so
+# they do not depend on the other sheets and a part can be reused in any export. Parts are cached in
+# this process by a hash of the sheet layout and table contents; an export renders only the
+# sheets whose tables changed (in worker processes when there is enough to render) and zips the
+# cached parts into the final workbook. The layout matches the former openpyxl export: styled header
+# rows, thin borders, alternating row fills on even rows, tables separated by one blank row and
+# column widths fitted to the longest value (at most 40 characters).
+
+# Header fill colors of the subsystem sheets, used in turn
+SHEET_COLORS = ["4F81BD", "C0504D", "9BBB59", "8064A2", "F79646", "2C4D75", "1F497D", "E46C0A", "00B050", "7030A0"]
+ALT_FILL = "FFF2CC"
+CURRENCY_HEADER = "92D050"
+CURRENCY_ALT_FILL = "E2EFDA"
+BREAKDOWN_HEADER = "005fa3"
+BREAKDOWN_ALT_FILL = "E3F0FF"
+MAX_COLUMN_WIDTH = 40
+# Total size of the cached parts (bytes), least recently used parts are dropped first
+MAX_CACHE_BYTES = int(os.environ.get("COSTSPIRITS_EXPORT_CACHE_MB", 64)) * 1024 * 1024
+# Render sheets in worker processes only when there are this many cells to render
+PARALLEL_MIN_CELLS = 200_000
+# Size of the worker process pool, shared by all exports of this process
+EXPORT_WORKERS = int(os.environ.get("COSTSPIRITS_EXPORT_WORKERS", os.cpu_count() or 1))
+
+_MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+_XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+# Characters that are not allowed in XML 1.0
+_ILLEGAL_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_parts = OrderedDict()
+_parts_bytes = 0
+_parts_lock = threading.Lock()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _styles():
+    # Fixed style table shared by every part: {(kind, color): cellXfs index} and styles.xml
+    header_colors = list(dict.fromkeys(SHEET_COLORS + [CURRENCY_HEADER, BREAKDOWN_HEADER]))
+    alt_colors = [ALT_FILL, CURRENCY_ALT_FILL, BREAKDOWN_ALT_FILL]
+    fill_colors = header_colors + alt_colors
+    fills = ['<fill><patternFill patternType="none"/></fill>', '<fill><patternFill patternType="gray125"/></fill>']
+    fills += [f'<fill><patternFill patternType="solid"><fgColor rgb="00{c.upper()}"/><bgColor rgb="00{c.upper()}"/></patternFill></fill>'
+              for c in fill_colors]
+    fill_id = {c: i + 2 for i, c in enumerate(fill_colors)}
+    ids = {("body", None): 1}
+    xfs = ['<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>',
+           '<xf numFmtId="0" fontId="0" fillId="0" borderId="1" xfId="0" applyBorder="1"/>']
+    for c in alt_colors:
+        ids[("body", c)] = len(xfs)
+        xfs.append(f'<xf numFmtId="0" fontId="0" fillId="{fill_id[c]}" borderId="1" xfId="0" applyFill="1" applyBorder="1"/>')
+    for c in header_colors:
+        ids[("header", c)] = len(xfs)
+        xfs.append(f'<xf numFmtId="0" fontId="1" fillId="{fill_id[c]}" borderId="1" xfId="0" applyFont="1" applyFill="1" '
+                   f'applyBorder="1" applyAlignment="1"><alignment horizontal="center" vertical="center"/></xf>')
+    thin = '<{0} style="thin"><color auto="1"/></{0}>'
+    xml = (_XML_HEADER + f'<styleSheet xmlns="{_MAIN_NS}">'
+           '<fonts count="2"><font><sz val="11"/><name val="Calibri"/><family val="2"/></font>'
+           '<font><b/><sz val="11"/><color rgb="00FFFFFF"/><name val="Calibri"/><family val="2"/></font></fonts>'
+           f'<fills count="{len(fills)}">{"".join(fills)}</fills>'
+           '<borders count="2"><border><left/><right/><top/><bottom/><diagonal/></border>'
+           f'<border>{"".join(thin.format(side) for side in ("left", "right", "top", "bottom"))}<diagonal/></border></borders>'
+           '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+           f'<cellXfs count="{len(xfs)}">{"".join(xfs)}</cellXfs>'
+           '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+           '</styleSheet>')
+    return ids, xml.encode("utf-8")
+
+
+STYLE_IDS, STYLES_XML = _styles()
+
+
+def sheet_color(index):
+    """Header color of the index-th subsystem sheet"""
+    return SHEET_COLORS[index % len(SHEET_COLORS)]
+
+
+def _cell(ref, style, value):
+    # One <c> element and the text length used for the column width (0 for empty cells)
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or value is pd.NA or value is pd.NaT:
+        return f'<c r="{ref}" s="{style}"/>', 0
+    if isinstance(value, bool):
+        return f'<c r="{ref}" s="{style}" t="b"><v>{int(value)}</v></c>', len(str(bool(value))) if value else 0
+    if isinstance(value, (int, float)):
+        if isinstance(value, float) and not math.isfinite(value):
+            return f'<c r="{ref}" s="{style}"/>', 0
+        return f'<c r="{ref}" s="{style}"><v>{value!r}</v></c>', len(str(value)) if value else 0
+    text = _ILLEGAL_XML.sub("", str(value))
+    if not text:
+        return f'<c r="{ref}" s="{style}"/>', 0
+    return f'<c r="{ref}" s="{style}" t="inlineStr"><is><t xml:space="preserve">{escape(text)}</t></is></c>', len(text)
+
+
+def render_sheet(tables, freeze=None):
+    """
+    Worksheet XML part of one sheet.
+
+    tables: [(DataFrame, header color, alternating fill color)] written below each other with one
+    blank row in between; freeze: top-left cell of the scrolling area (e.g. "D2") or None.
+    """
+    rows = []
+    widths = {}
+    row = 0
+    for df, header_color, alt_color in tables:
+        row = 1 if row == 0 else row + 2
+        header_style = STYLE_IDS[("header", header_color)]
+        cells = []
+        for c, col in enumerate(df.columns):
+            xml, length = _cell(f"{column_letter(c)}{row}", header_style, col)
+            cells.append(xml)
+            widths[c] = max(widths.get(c, 0), length)
+        rows.append(f'<row r="{row}">{"".join(cells)}</row>')
+        letters = [column_letter(c) for c in range(df.shape[1])]
+        for values in df.itertuples(index=False, name=None):
+            row += 1
+            style = STYLE_IDS[("body", alt_color if row % 2 == 0 else None)]
+            cells = []
+            for c, value in enumerate(values):
+                xml, length = _cell(f"{letters[c]}{row}", style, value)
+                cells.append(xml)
+                if length > widths.get(c, 0):
+                    widths[c] = length
+            rows.append(f'<row r="{row}">{"".join(cells)}</row>')
+    pane = ""
+    if freeze:
+        column, split_row = re.fullmatch(r"([A-Z]+)(\d+)", freeze).groups()
+        x_split = sum((ord(ch) - 64) * 26 ** i for i, ch in enumerate(reversed(column))) - 1
+        x_attr = f' xSplit="{x_split}"' if x_split else ""
+        pane = (f'<pane{x_attr} ySplit="{int(split_row) - 1}" topLeftCell="{freeze}" '
+                f'activePane="bottomRight" state="frozen"/><selection pane="bottomRight" activeCell="{freeze}" sqref="{freeze}"/>')
+    cols = "".join(f'<col min="{c + 1}" max="{c + 1}" width="{min(w + 2, MAX_COLUMN_WIDTH)}" customWidth="1"/>'
+                   for c, w in sorted(widths.items()))
+    xml = (_XML_HEADER + f'<worksheet xmlns="{_MAIN_NS}" xmlns:r="{_REL_NS}">'
+           f'<sheetViews><sheetView workbookViewId="0">{pane}</sheetView></sheetViews>'
+           '<sheetFormatPr defaultRowHeight="15"/>'
+           + (f"<cols>{cols}</cols>" if cols else "")
+           + f'<sheetData>{"".join(rows)}</sheetData></worksheet>')
+    return xml.encode("utf-8")
+
+
+def _render_task(args):
+    return render_sheet(*args)
+
+
+def frame_digest(df):
+    """Content hash of a DataFrame (values, columns and dtypes)"""
+    h = hashlib.sha1()
+    h.update(repr((list(df.columns), [str(t) for t in df.dtypes], df.shape)).encode("utf-8"))
+    try:
+        h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    except TypeError:
+        # Unhashable cell values
+        h.update(pickle.dumps(df.reset_index(drop=True)))
+    return h.hexdigest()
+
+
+def part_key(tables, freeze=None):
+    """Cache key of a sheet part: its layout and the digests of its tables"""
+    layout = [(frame_digest(df), header_color, alt_color) for df, header_color, alt_color in tables]
+    return hashlib.sha1(repr((layout, freeze)).encode("utf-8")).hexdigest()
+
+
+def _cache_get(key):
+    with _parts_lock:
+        part = _parts.get(key)
+        if part is not None:
+            _parts.move_to_end(key)
+        return part
+
+
+def _cache_put(key, part):
+    global _parts_bytes
+    with _parts_lock:
+        if key not in _parts:
+            _parts[key] = part
+            _parts_bytes += len(part)
+        while _parts_bytes > MAX_CACHE_BYTES and len(_parts) > 1:
+            _, old = _parts.popitem(last=False)
+            _parts_bytes -= len(old)
+
+
+def clear_cache():
+    global _parts_bytes
+    with _parts_lock:
+        _parts.clear()
+        _parts_bytes = 0
+
+
+def _render_pool():
+    # Worker processes are spawned, not forked: the Streamlit server forking from a thread while
+    # other threads (parse workers, metrics server) hold locks can deadlock the child
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=EXPORT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+
+def render_parts(sheets, max_workers=None, on_part=None):
+    """
+    Worksheet parts of [(title, tables, freeze)] sheets, from the cache where possible.
+
+    Missing parts are rendered in the shared worker process pool when they hold at least
+    PARALLEL_MIN_CELLS cells; max_workers=1 renders them in this process.
+    on_part(title, cached) is called for every sheet.
+    """
+    keys = [part_key(tables, freeze) for _, tables, freeze in sheets]
+    parts = [_cache_get(key) for key in keys]
+    missing = [i for i, part in enumerate(parts) if part is None]
+    cells = sum(df.size + df.shape[1] for i in missing for df, _, _ in sheets[i][1])
+    workers = min(max_workers or EXPORT_WORKERS, len(missing))
+    tasks = [(sheets[i][1], sheets[i][2]) for i in missing]
+    rendered = None
+    if workers > 1 and cells >= PARALLEL_MIN_CELLS:
+        pool = _render_pool()
+        try:
+            rendered = list(pool.map(_render_task, tasks))
+        except BrokenProcessPool:
+            # A worker died; start a new pool with the next export and render here
+            _discard_pool(pool)
+    if rendered is None:
+        rendered = [render_sheet(*task) for task in tasks]
+    for i, part in zip(missing, rendered):
+        parts[i] = part
+        _cache_put(keys[i], part)
+    if on_part is not None:
+        for i, (title, _, _) in enumerate(sheets):
+            on_part(title, i not in missing)
+    return parts
+
+
+def _unique_titles(titles):
+    # Excel sheet names: at most 31 characters and unique (case-insensitive)
+    seen = set()
+    unique = []
+    for title in titles:
+        title = title[:31] or "Sheet"
+        candidate, n = title, 1
+        while candidate.lower() in seen:
+            suffix = str(n)
+            candidate, n = title[:31 - len(suffix)] + suffix, n + 1
+        seen.add(candidate.lower())
+        unique.append(candidate)
+    return unique
+
+
+def assemble_xlsx(titles, parts):
+    """xlsx bytes of a workbook made of the given worksheet parts"""
+    titles = _unique_titles(titles)
+    n = len(parts)
+    content_types = (_XML_HEADER + '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+                     '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+                     '<Default Extension="xml" ContentType="application/xml"/>'
+                     '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+                     '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+                     + "".join(f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+                               'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                               for i in range(1, n + 1))
+                     + '</Types>')
+    root_rels = (_XML_HEADER + f'<Relationships xmlns="{_PKG_REL_NS}">'
+                 f'<Relationship Id="rId1" Type="{_REL_NS}/officeDocument" Target="xl/workbook.xml"/></Relationships>')
+    workbook = (_XML_HEADER + f'<workbook xmlns="{_MAIN_NS}" xmlns:r="{_REL_NS}">'
+                '<bookViews><workbookView activeTab="0"/></bookViews><sheets>'
+                + "".join(f'<sheet name="{escape(title, {chr(34): "&quot;"})}" sheetId="{i}" r:id="rId{i}"/>'
+                          for i, title in enumerate(titles, 1))
+                + '</sheets></workbook>')
+    workbook_rels = (_XML_HEADER + f'<Relationships xmlns="{_PKG_REL_NS}">'
+                     + "".join(f'<Relationship Id="rId{i}" Type="{_REL_NS}/worksheet" Target="worksheets/sheet{i}.xml"/>'
+                               for i in range(1, n + 1))
+                     + f'<Relationship Id="rId{n + 1}" Type="{_REL_NS}/styles" Target="styles.xml"/></Relationships>')
+    files = [("[Content_Types].xml", content_types), ("_rels/.rels", root_rels), ("xl/workbook.xml", workbook),
+             ("xl/_rels/workbook.xml.rels", workbook_rels), ("xl/styles.xml", STYLES_XML)]
+    files += [(f"xl/worksheets/sheet{i}.xml", part) for i, part in enumerate(parts, 1)]
+    output = BytesIO()
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in files:
+            # Fixed timestamps: the same sheets give the same file
+            zf.writestr(zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0)), data, compress_type=zipfile.ZIP_DEFLATED)
+    return output.getvalue()
+
+
+def build_xlsx(sheets, max_workers=None, on_part=None):
+    """xlsx bytes of [(title, tables, freeze)] sheets (see render_sheet), reusing cached parts"""
+    parts = render_parts(sheets, max_workers, on_part)
+    return assemble_xlsx([title for title, _, _ in sheets], parts)